@@ -3,12 +3,16 @@ import telebot
 
 from django.conf import settings
 
+from .state_storage import StateHandlerBackend
+
 commands = settings.BOT_COMMANDS
 
 bot = telebot.TeleBot(
     settings.BOT_TOKEN,
     threaded=False,
     skip_pending=True,
+    # next step обработчики хранятся вне процесса: диалог продолжается в любом воркере и после перезапуска
+    next_step_backend=StateHandlerBackend(),
 )
 
 bot.set_my_commands(commands)
@@ -0,0 +1,98 @@
+import threading
+
+from .caching import FAMILY_ACTIVITIES, family_version, get_active_activities
+from .models import Activity
+
+# Поля активности, которые держит реестр (остальные поля загрузятся из БД при обращении)
+REGISTRY_FIELDS = (
+    'id', 'name', 'description', 'is_active', 'base_coefficient', 'ignore_odds', 'created_at', 'activated_at',
+)
+
+
+class ActiveActivityRegistry:
+    """
+    Активные активности в памяти процесса: {id: поля}. Прогревается при первом запросе воркера
+    и обновляется сигналами Activity после коммита. Версия семейства ключей «activities»
+    в общем кеше служит меткой: если другой процесс изменил активность, версия не совпадёт
+    и реестр перечитает список (из общего кеша, а при промахе — одним запросом).
+    Для нескольких процессов нужен общий бэкенд кеша (CACHE_BACKEND=file или db).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._activities = None
+        self._version = None
+
+    def warm(self):
+        version = family_version(FAMILY_ACTIVITIES)
+        rows = get_active_activities()
+        with self._lock:
+            self._activities = {row['id']: row for row in rows}
+            self._version = version
+
+    def warm_if_needed(self):
+        if self._activities is None:
+            self.warm()
+
+    def _rows(self):
+        """Актуальный снимок реестра: при изменении версии в общем кеше он перечитывается"""
+        if self._activities is None or self._version != family_version(FAMILY_ACTIVITIES):
+            self.warm()
+        return self._activities
+
+    @staticmethod
+    def _instance(row):
+        # Новый экземпляр на каждый вызов: обработчики могут менять его, не затрагивая реестр
+        return Activity.from_db('default', REGISTRY_FIELDS, [row[field] for field in REGISTRY_FIELDS])
+
+    def get(self, activity_id):
+        """Активная активность по id или None, если она не активна (или не существует)"""
+        row = self._rows().get(activity_id)
+        return self._instance(row) if row else None
+
+    def all(self):
+        """Все активные активности, новые первыми"""
+        rows = sorted(self._rows().values(), key=lambda row: row['created_at'], reverse=True)
+        return [self._instance(row) for row in rows]
+
+    def latest(self):
+        """Самая новая активная активность или None"""
+        activities = self.all()
+        return activities[0] if activities else None
+
+    def activity_saved(self, activity):
+        """Обновление после сохранения активности (вызывается после коммита)"""
+        with self._lock:
+            if self._activities is None:
+                return
+            if activity.is_active:
+                self._activities[activity.pk] = {field: getattr(activity, field) for field in REGISTRY_FIELDS}
+            else:
+                self._activities.pop(activity.pk, None)
+            # Версия уже увеличена сигналом кеша; своё изменение не должно вызывать перечитывание
+            self._version = family_version(FAMILY_ACTIVITIES)
+
+    def activity_deleted(self, activity_id):
+        with self._lock:
+            if self._activities is not None:
+                self._activities.pop(activity_id, None)
+                self._version = family_version(FAMILY_ACTIVITIES)
+
+    def reset(self):
+        with self._lock:
+            self._activities = None
+            self._version = None
+
+
+activity_registry = ActiveActivityRegistry()
+
+
+def get_activity(activity_id):
+    """
+    Активность по id: активная — из реестра без запроса к БД, неактивная — из БД.
+    Если активности нет, поднимает Activity.DoesNotExist, как Activity.objects.get.
+    """
+    activity = activity_registry.get(activity_id)
+    if activity is None:
+        activity = Activity.objects.get(id=activity_id)
+    return activity
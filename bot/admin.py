@@ -1,3 +1,6 @@
+import threading
+from functools import partial
+
 from django.contrib import admin
 from .models import (
     Player, GameClass, PlayerClass, Activity, ActivityParticipant, 
@@ -9,13 +12,17 @@ from django import forms
 from django.core.exceptions import ValidationError
 from django.utils.html import format_html
 from django.urls import reverse
-from django.http import HttpResponseRedirect
+from django.http import HttpResponseRedirect, JsonResponse
 from django.shortcuts import render
 from django.contrib import messages
 from django.utils.safestring import mark_safe
-from .models import export_activity_history_to_google_sheets
 from django.utils import timezone
 from django.urls import path
+from django.db import transaction
+from django.db.models import Count, Q
+from django.core.exceptions import PermissionDenied
+from django.template.response import TemplateResponse
+from django.utils.http import urlencode
 
 class PlayerClassInline(admin.TabularInline):
     model = PlayerClass
@@ -57,9 +64,57 @@ class ActivityClassLevelCoefficientForm(forms.ModelForm):
                 raise ValidationError('Для этого класса и диапазона уровней уже существует коэффициент!')
         return cleaned_data
 
+class ClassLevelCoefficientFormSet(forms.BaseInlineFormSet):
+    """Формсет коэффициентов одного класса: строки берутся из общей для всех классов выборки"""
+    shared_rows = None
+
+    def get_queryset(self):
+        if self.shared_rows is None:
+            return super().get_queryset()
+        return self.shared_rows
+
+
+class ClassLevelCoefficientInline(admin.TabularInline):
+    """Базовый inline коэффициентов по игровому классу (подклассы создаёт make_class_level_inline)"""
+    model = ActivityClassLevelCoefficient
+    formset = ClassLevelCoefficientFormSet
+    fields = ('min_level', 'max_level', 'coefficient')
+    extra = 0
+    fk_name = 'activity'
+    can_delete = True
+    formfield_overrides = {ActivityClassLevelCoefficient._meta.get_field('game_class'): {'widget': forms.HiddenInput}}
+    game_class = None
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).filter(game_class=self.game_class)
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        rows = get_prefetched_class_coefficients(request, obj).get(self.game_class.pk, [])
+        return type(formset.__name__, (formset,), {'shared_rows': rows})
+
+
+def get_prefetched_class_coefficients(request, activity):
+    """
+    Все коэффициенты активности одним запросом, сгруппированные по классу {game_class_id: [строки]}.
+    Кешируются на время запроса и делятся между inline всех классов.
+    """
+    if activity is None or activity.pk is None:
+        return {}
+    cache = getattr(request, '_class_coefficients_cache', None)
+    if cache is None or cache[0] != activity.pk:
+        rows_by_class = {}
+        coefficients = ActivityClassLevelCoefficient.objects.filter(activity=activity).select_related('game_class')
+        for coefficient in coefficients.order_by('pk'):
+            coefficient.activity = activity  # для __str__ и валидации формы без повторной выборки
+            rows_by_class.setdefault(coefficient.game_class_id, []).append(coefficient)
+        cache = (activity.pk, rows_by_class)
+        request._class_coefficients_cache = cache
+    return cache[1]
+
+
 # Динамический inline для коэффициентов по игровому классу
 def make_class_level_inline(game_class):
-    class_name = f"{game_class.name}"
     class CustomForm(ActivityClassLevelCoefficientForm):
         def save(self, commit=True):
             instance = super().save(commit=False)
@@ -67,27 +122,33 @@ def make_class_level_inline(game_class):
             if commit:
                 instance.save()
             return instance
-    class Meta:
-        verbose_name = f"Коэффициенты для класса: {game_class.name}"
-        verbose_name_plural = f"Коэффициенты для класса: {game_class.name}"
-        model = ActivityClassLevelCoefficient
-        fields = ('min_level', 'max_level', 'coefficient')
-        extra = 0
     attrs = {
-        'model': ActivityClassLevelCoefficient,
         'form': CustomForm,
-        'fields': ('min_level', 'max_level', 'coefficient'),
-        'extra': 0,
+        'game_class': game_class,
         'verbose_name': f"Коэффициенты для класса: {game_class.name}",
         'verbose_name_plural': f"Коэффициенты для класса: {game_class.name}",
-        'fk_name': 'activity',
-        'can_delete': True,
-        'Meta': Meta,
-        'get_queryset': lambda self, request: super(self.__class__, self).get_queryset(request).filter(game_class=game_class),
-        'formfield_overrides': {ActivityClassLevelCoefficient._meta.get_field('game_class'): {'widget': forms.HiddenInput}},
         '__module__': __name__,
     }
-    return type(f"{game_class.name}ClassLevelInline", (admin.TabularInline,), attrs)
+    return type(f"{game_class.name}ClassLevelInline", (ClassLevelCoefficientInline,), attrs)
+
+
+# Сгенерированные inline-классы для текущего набора игровых классов: (версия набора, [классы inline])
+_class_level_inlines = (None, [])
+_class_level_inlines_lock = threading.Lock()
+
+
+def get_class_level_inlines():
+    """
+    Inline-классы коэффициентов для всех игровых классов. Пересоздаются только при изменении
+    набора игровых классов (версия — список (id, название), одним запросом).
+    """
+    global _class_level_inlines
+    game_classes = list(GameClass.objects.order_by('pk'))
+    version = tuple((game_class.pk, game_class.name) for game_class in game_classes)
+    with _class_level_inlines_lock:
+        if _class_level_inlines[0] != version:
+            _class_level_inlines = (version, [make_class_level_inline(game_class) for game_class in game_classes])
+        return _class_level_inlines[1]
 
 class ActivityParticipantForm(forms.ModelForm):
     """Форма для редактирования участника активности"""
@@ -113,33 +174,6 @@ class ActivityParticipantForm(forms.ModelForm):
                 widget=forms.TextInput(attrs={'readonly': 'readonly'})
             )
 
-class ActivityParticipantInline(admin.TabularInline):
-    """Inline для редактирования участников активности"""
-    model = ActivityParticipant
-    form = ActivityParticipantForm
-    extra = 0
-    readonly_fields = ('player_game_nickname', 'player_tg_name', 'class_name', 'class_level', 'joined_at', 'calculated_duration', 'total_points')
-    fields = ('player_game_nickname', 'class_name', 'class_level', 'joined_at', 'completed_at', 'calculated_duration', 'points_earned', 'additional_points', 'total_points')
-    
-    def calculated_duration(self, obj):
-        """Расчетное время участия"""
-        if obj.completed_at and obj.joined_at:
-            duration = obj.completed_at - obj.joined_at
-            hours = int(duration.total_seconds() // 3600)
-            minutes = int((duration.total_seconds() % 3600) // 60)
-            seconds = int(duration.total_seconds() % 60)
-            return f"{hours}ч {minutes}м {seconds}с"
-        return "Не завершено"
-    calculated_duration.short_description = 'Расчетное время'
-    
-    def total_points(self, obj):
-        """Общее количество баллов"""
-        return obj.total_points
-    total_points.short_description = 'Итоговые баллы'
-    
-    def has_add_permission(self, request, obj=None):
-        return False
-
 class ActivityHistoryParticipantForm(forms.ModelForm):
     """Форма для редактирования участника истории активности"""
     class Meta:
@@ -165,48 +199,267 @@ class ActivityHistoryParticipantForm(forms.ModelForm):
                 widget=forms.TextInput(attrs={'readonly': 'readonly'})
             )
 
-class ActivityHistoryParticipantInline(admin.TabularInline):
-    """Inline для редактирования участников истории активности"""
-    model = ActivityHistoryParticipant
-    form = ActivityHistoryParticipantForm
-    extra = 0
-    readonly_fields = ('player_game_nickname', 'player_tg_name', 'class_name', 'class_level', 'calculated_duration', 'total_points')
-    fields = ('player_game_nickname', 'class_name', 'class_level', 'joined_at', 'completed_at', 'calculated_duration', 'points_earned', 'additional_points', 'total_points')
-    
-    def calculated_duration(self, obj):
-        """Расчетное время участия"""
-        if obj.completed_at and obj.joined_at:
-            duration = obj.completed_at - obj.joined_at
-            hours = int(duration.total_seconds() // 3600)
-            minutes = int((duration.total_seconds() % 3600) // 60)
-            seconds = int(duration.total_seconds() % 60)
-            return f"{hours}ч {minutes}м {seconds}с"
-        return "Не завершено"
-    calculated_duration.short_description = 'Расчетное время'
-    
-    def total_points(self, obj):
-        """Общее количество баллов (из базы)"""
-        return obj.total_points
-    total_points.short_description = 'Итоговые баллы'
-    
-    def has_add_permission(self, request, obj=None):
-        return False
+def format_participation_duration(obj):
+    """Расчетное время участия"""
+    if obj.completed_at and obj.joined_at:
+        duration = obj.completed_at - obj.joined_at
+        hours = int(duration.total_seconds() // 3600)
+        minutes = int((duration.total_seconds() % 3600) // 60)
+        seconds = int(duration.total_seconds() % 60)
+        return f"{hours}ч {minutes}м {seconds}с"
+    return "Не завершено"
 
-    class Media:
-        js = ('admin/js/activity_history_participant_inline.js',)
-    
-    def has_delete_permission(self, request, obj=None):
-        return False  # Запрещаем удаление участников
 
-    def save_model(self, request, obj, form, change):
-        """Автообновление Google Sheets при изменении участника"""
-        super().save_model(request, obj, form, change)
-        from .models import export_activity_history_to_google_sheets
-        result = export_activity_history_to_google_sheets(obj.activity_history)
-        if result:
-            messages.success(request, 'Данные автоматически обновлены в Google Sheets (Лист1).')
-        else:
-            messages.warning(request, 'Не удалось обновить данные в Google Sheets.')
+def parse_participants_cursor(value):
+    """Ключ страницы участников 'joined_at|id' -> (datetime, id) или None"""
+    from django.utils.dateparse import parse_datetime
+    joined_at, _, pk = (value or '').rpartition('|')
+    try:
+        joined_at = parse_datetime(joined_at)
+        pk = int(pk)
+    except ValueError:
+        return None
+    if joined_at is None:
+        return None
+    return joined_at, pk
+
+
+def keyset_participants_page(queryset, after=None, before=None, size=50):
+    """
+    Страница участников по ключу (joined_at, id) без OFFSET и без COUNT: время выборки
+    не зависит от номера страницы. Возвращает (участники, есть_предыдущая, есть_следующая).
+    """
+    if before:
+        joined_at, pk = before
+        rows = list(
+            queryset.filter(Q(joined_at__lt=joined_at) | Q(joined_at=joined_at, pk__lt=pk))
+            .order_by('-joined_at', '-pk')[:size + 1]
+        )
+        has_previous = len(rows) > size
+        return rows[:size][::-1], has_previous, True
+    if after:
+        joined_at, pk = after
+        queryset = queryset.filter(Q(joined_at__gt=joined_at) | Q(joined_at=joined_at, pk__gt=pk))
+    rows = list(queryset.order_by('joined_at', 'pk')[:size + 1])
+    return rows[:size], after is not None, len(rows) > size
+
+
+class AdditionalPointsImportForm(forms.Form):
+    file = forms.FileField(
+        label='Файл CSV или XLSX',
+        help_text='Колонки: никнейм, класс, баллы (класс можно оставить пустым — баллы получат все классы игрока). '
+                  'Баллы прибавляются к уже начисленным.'
+    )
+
+
+class ParticipantsPageMixin:
+    """
+    Редактирование участников на отдельной странице <id>/participants/ вместо inline:
+    постранично (ключ joined_at, id), с фильтром по никнейму и классу. Каждая строка —
+    отдельная форма, сохранение отправляет только одного участника.
+    На странице объекта выводится только сводка (participants_summary) со ссылкой.
+    """
+    participants_model = None
+    participants_fk = None
+    participants_form = None
+    # Поля участника, которые показываются только для чтения
+    participants_readonly = ('player_game_nickname', 'class_name', 'class_level')
+    participants_page_size = 50
+
+    def get_participants_urls(self):
+        info = self.model._meta.app_label, self.model._meta.model_name
+        return [
+            path(
+                '<int:object_id>/participants/',
+                self.admin_site.admin_view(self.participants_view),
+                name='%s_%s_participants' % info,
+            ),
+            path(
+                '<int:object_id>/participants/grant/',
+                self.admin_site.admin_view(self.grant_points_view),
+                name='%s_%s_grant_points' % info,
+            ),
+        ]
+
+    def participants_url(self, obj):
+        info = self.model._meta.app_label, self.model._meta.model_name
+        return reverse('admin:%s_%s_participants' % info, args=[obj.pk])
+
+    def participants_summary(self, obj):
+        """Сводка по участникам одним агрегирующим запросом"""
+        if obj is None or obj.pk is None:
+            return '—'
+        summary = obj.participants.aggregate(total=Count('pk'), completed=Count('completed_at'))
+        return format_html(
+            'Всего: {}, завершили: {} <a class="button" style="margin-left:10px;" href="{}">Редактировать участников</a>',
+            summary['total'], summary['completed'], self.participants_url(obj)
+        )
+    participants_summary.short_description = 'Участники'
+
+    def grant_points_url(self, obj):
+        info = self.model._meta.app_label, self.model._meta.model_name
+        return reverse('admin:%s_%s_grant_points' % info, args=[obj.pk])
+
+    def grant_points_from_file(self, request, queryset):
+        """Действие списка: переход к загрузке файла доп. баллов для выбранного объекта"""
+        if queryset.count() != 1:
+            self.message_user(request, 'Выберите ровно одну запись для начисления баллов.', level=messages.WARNING)
+            return None
+        return HttpResponseRedirect(self.grant_points_url(queryset.first()))
+    grant_points_from_file.short_description = 'Начислить доп. баллы из файла (CSV/XLSX)'
+
+    def grant_points_view(self, request, object_id):
+        """Загрузка CSV/XLSX (никнейм, класс, баллы) и начисление доп. баллов участникам одним bulk_update"""
+        from .bulk_import import ImportFileError, grant_additional_points
+        obj = self.get_object(request, str(object_id))
+        if obj is None:
+            return self._get_obj_does_not_exist_redirect(request, self.model._meta, str(object_id))
+        if not self.has_change_permission(request, obj):
+            raise PermissionDenied
+        form = AdditionalPointsImportForm(request.POST or None, request.FILES or None)
+        report = None
+        if request.method == 'POST' and form.is_valid():
+            participants = self.participants_model.objects.filter(**{self.participants_fk: obj})
+            try:
+                report = grant_additional_points(participants, form.cleaned_data['file'])
+            except ImportFileError as e:
+                form.add_error('file', str(e))
+            else:
+                self.message_user(
+                    request,
+                    f"Начислено участникам: {report['updated']} (строк файла сопоставлено: "
+                    f"{report['matched']} из {report['rows']}).",
+                    level=messages.SUCCESS if report['updated'] else messages.WARNING
+                )
+        context = {
+            **self.admin_site.each_context(request),
+            'title': f'Начисление доп. баллов: {obj}',
+            'subtitle': None,
+            'opts': self.model._meta,
+            'original': obj,
+            'form': form,
+            'report': report,
+            'participants_url': self.participants_url(obj),
+        }
+        request.current_app = self.admin_site.name
+        return TemplateResponse(request, 'admin/bot/grant_points.html', context)
+
+    def get_participants_form(self, request):
+        """Форма участника с виджетами админки (как у inline: поля даты — SplitDateTimeField)"""
+        return forms.modelform_factory(
+            self.participants_model,
+            form=self.participants_form,
+            fields=self.participants_form._meta.fields,
+            formfield_callback=partial(self.formfield_for_dbfield, request=request),
+        )
+
+    def participants_view(self, request, object_id):
+        obj = self.get_object(request, str(object_id))
+        if obj is None:
+            return self._get_obj_does_not_exist_redirect(request, self.model._meta, str(object_id))
+        if not self.has_view_or_change_permission(request, obj):
+            raise PermissionDenied
+        can_change = self.has_change_permission(request, obj)
+        form_class = self.get_participants_form(request)
+
+        queryset = self.participants_model.objects.filter(**{self.participants_fk: obj})
+        search = request.GET.get('q', '').strip()
+        class_name = request.GET.get('class_name', '')
+        filtered = queryset
+        if search:
+            filtered = filtered.filter(player_game_nickname__icontains=search)
+        if class_name:
+            filtered = filtered.filter(class_name=class_name)
+
+        # Сохранение одного участника: форма строки с префиксом p<id>
+        bound_form = None
+        if request.method == 'POST':
+            if not can_change:
+                raise PermissionDenied
+            participant = queryset.filter(pk=request.POST.get('participant')).first()
+            if participant is None:
+                self.message_user(request, 'Участник не найден.', level=messages.ERROR)
+                return HttpResponseRedirect(request.get_full_path())
+            bound_form = form_class(request.POST, instance=participant, prefix=f'p{participant.pk}')
+            if bound_form.is_valid():
+                bound_form.save()
+                self.message_user(
+                    request, f'Участник {participant.player_game_nickname} сохранён.', level=messages.SUCCESS
+                )
+                return HttpResponseRedirect(request.get_full_path())
+
+        participants, has_previous, has_next = keyset_participants_page(
+            filtered,
+            after=parse_participants_cursor(request.GET.get('after')),
+            before=parse_participants_cursor(request.GET.get('before')),
+            size=self.participants_page_size,
+        )
+        if bound_form is not None and bound_form.instance not in participants:
+            participants.insert(0, bound_form.instance)
+
+        rows = []
+        for participant in participants:
+            form = None
+            if can_change:
+                if bound_form is not None and bound_form.instance.pk == participant.pk:
+                    form = bound_form
+                else:
+                    form = form_class(instance=participant, prefix=f'p{participant.pk}')
+                # Поля строки таблицы привязаны к её форме атрибутом form (форма — в последней ячейке)
+                for name in form._meta.fields:
+                    form.fields[name].widget.attrs['form'] = f'participant-{participant.pk}'
+            rows.append({
+                'participant': participant,
+                'values': [getattr(participant, name) for name in self.participants_readonly],
+                'duration': format_participation_duration(participant),
+                'fields': [form[name] for name in form._meta.fields] if form else [],
+                'errors': form.non_field_errors() if form else [],
+            })
+
+        def page_link(**cursor):
+            params = {key: value for key, value in (('q', search), ('class_name', class_name)) if value}
+            params.update(cursor)
+            return '?' + urlencode(params)
+
+        def cursor(participant):
+            return f'{participant.joined_at.isoformat()}|{participant.pk}'
+
+        form_fields = form_class._meta.fields
+        context = {
+            **self.admin_site.each_context(request),
+            'title': f'Участники: {obj}',
+            'subtitle': None,
+            'opts': self.model._meta,
+            'original': obj,
+            'can_change': can_change,
+            'readonly_headers': [
+                self.participants_model._meta.get_field(name).verbose_name for name in self.participants_readonly
+            ],
+            'field_headers': [
+                self.participants_model._meta.get_field(name).verbose_name for name in form_fields
+            ] if can_change else [],
+            'rows': rows,
+            'search': search,
+            'class_name': class_name,
+            'class_names': queryset.exclude(class_name='').order_by('class_name')
+            .values_list('class_name', flat=True).distinct(),
+            'grant_points_url': self.grant_points_url(obj) if can_change else None,
+            'first_link': page_link() if has_previous else None,
+            'previous_link': page_link(before=cursor(participants[0])) if has_previous and participants else None,
+            'next_link': page_link(after=cursor(participants[-1])) if has_next and participants else None,
+            'media': self.media + form_class().media,
+        }
+        request.current_app = self.admin_site.name
+        return TemplateResponse(request, 'admin/bot/participants_page.html', context)
+
+
+class RosterImportForm(forms.Form):
+    file = forms.FileField(
+        label='Файл CSV или XLSX',
+        help_text='Колонки: никнейм, Telegram ID, класс, уровень, Telegram имя — по строке на каждый класс игрока. '
+                  'Существующие игроки и классы обновляются, пустые ячейки не затирают сохранённые значения.'
+    )
+    our_players = forms.BooleanField(label='Отметить как наших игроков', required=False)
 
 @admin.register(Player)
 class PlayerAdmin(admin.ModelAdmin):
@@ -229,6 +482,45 @@ class PlayerAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
+    def get_urls(self):
+        urls = super().get_urls()
+        custom_urls = [
+            path(
+                'import/',
+                self.admin_site.admin_view(self.import_roster_view),
+                name='bot_player_import',
+            ),
+        ]
+        return custom_urls + urls
+    def import_roster_view(self, request):
+        """Импорт состава гильдии из CSV/XLSX с пакетным добавлением/обновлением игроков и классов"""
+        from .bulk_import import ImportFileError, import_roster
+        if not (self.has_add_permission(request) and self.has_change_permission(request)):
+            raise PermissionDenied
+        form = RosterImportForm(request.POST or None, request.FILES or None)
+        report = None
+        if request.method == 'POST' and form.is_valid():
+            try:
+                report = import_roster(form.cleaned_data['file'], mark_our_players=form.cleaned_data['our_players'])
+            except ImportFileError as e:
+                form.add_error('file', str(e))
+            else:
+                self.message_user(
+                    request,
+                    f"Игроки: добавлено {report['players_inserted']}, обновлено {report['players_updated']}. "
+                    f"Классы: добавлено {report['classes_inserted']}, обновлено {report['classes_updated']}.",
+                    level=messages.SUCCESS
+                )
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Импорт состава гильдии',
+            'subtitle': None,
+            'opts': self.model._meta,
+            'form': form,
+            'report': report,
+        }
+        request.current_app = self.admin_site.name
+        return TemplateResponse(request, 'admin/bot/roster_import.html', context)
 
 @admin.register(GameClass)
 class GameClassAdmin(admin.ModelAdmin):
@@ -239,14 +531,18 @@ class GameClassAdmin(admin.ModelAdmin):
     inlines = [GameClassBaseCoefficientConditionInline]
 
 @admin.register(Activity)
-class ActivityAdmin(admin.ModelAdmin):
+class ActivityAdmin(ParticipantsPageMixin, admin.ModelAdmin):
     list_display = ('name', 'is_active', 'ignore_odds', 'base_coefficient', 'participants_count', 'created_at')
     search_fields = ('name', 'description')
     list_filter = ('is_active', 'ignore_odds')
     ordering = ('-created_at',)
-    readonly_fields = ('created_at', 'updated_at', 'activated_at')
+    readonly_fields = ('created_at', 'updated_at', 'activated_at', 'participants_summary')
     list_editable = ('is_active',)
-    inlines = [ActivityParticipantInline]
+    actions = ['grant_points_from_file']
+    participants_model = ActivityParticipant
+    participants_fk = 'activity'
+    participants_form = ActivityParticipantForm
+    participants_readonly = ('player_game_nickname', 'class_name', 'class_level', 'joined_at', 'points_earned')
     fieldsets = (
         ('Основная информация', {
             'fields': ('name', 'description', 'is_active', 'ignore_odds')
@@ -255,6 +551,9 @@ class ActivityAdmin(admin.ModelAdmin):
             'fields': ('base_coefficient',),
             'description': 'Настройка коэффициента для расчета баллов'
         }),
+        ('Участники', {
+            'fields': ('participants_summary',)
+        }),
         ('Временные метки', {
             'fields': ('created_at', 'activated_at', 'updated_at'),
             'classes': ('collapse',)
@@ -268,23 +567,49 @@ class ActivityAdmin(admin.ModelAdmin):
                 self.admin_site.admin_view(self.sync_class_coeffs),
                 name='sync_class_coeffs',
             ),
+            path(
+                'dashboard/',
+                self.admin_site.admin_view(self.dashboard_view),
+                name='bot_activity_dashboard',
+            ),
+            path(
+                'dashboard/data/',
+                self.admin_site.admin_view(self.dashboard_data),
+                name='bot_activity_dashboard_data',
+            ),
         ]
-        return custom_urls + urls
+        return custom_urls + self.get_participants_urls() + urls
+    def dashboard_view(self, request):
+        """Панель идущих активностей: страница опрашивает dashboard/data/ раз в несколько секунд"""
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Идущие активности',
+            'subtitle': None,
+            'opts': self.model._meta,
+            'data_url': reverse('admin:bot_activity_dashboard_data'),
+            'poll_seconds': 5,
+        }
+        request.current_app = self.admin_site.name
+        return TemplateResponse(request, 'admin/bot/activity_dashboard.html', context)
+    def dashboard_data(self, request):
+        """Сводка по активным активностям из общего кеша (без запросов к БД после прогрева)"""
+        from .live_stats import live_stats
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        return JsonResponse(live_stats.snapshot())
     def sync_class_coeffs(self, request, activity_id):
-        from .models import Activity, GameClass, ActivityClassLevelCoefficient
+        from .coefficients import sync_activity_coefficients
         try:
             activity = Activity.objects.get(id=activity_id)
-            ActivityClassLevelCoefficient.objects.filter(activity=activity).delete()
-            for game_class in GameClass.objects.all():
-                for cond in game_class.base_coefficient_conditions.all():
-                    ActivityClassLevelCoefficient.objects.create(
-                        activity=activity,
-                        game_class=game_class,
-                        min_level=cond.min_level,
-                        max_level=cond.max_level,
-                        coefficient=cond.coefficient
-                    )
-            self.message_user(request, 'Коэффициенты классов успешно синхронизированы!', level=messages.SUCCESS)
+            result = sync_activity_coefficients(activity)
+            self.message_user(
+                request,
+                f"Коэффициенты классов успешно синхронизированы! "
+                f"Добавлено: {result['created']}, обновлено: {result['updated']}, удалено: {result['deleted']}",
+                level=messages.SUCCESS
+            )
         except Exception as e:
             self.message_user(request, f'Ошибка при синхронизации: {e}', level=messages.ERROR)
         return HttpResponseRedirect(reverse('admin:bot_activity_change', args=[activity_id]))
@@ -296,27 +621,34 @@ class ActivityAdmin(admin.ModelAdmin):
                 f'<a class="button" style="margin-left:10px;" href="{sync_url}">🔄 Синхронизировать коэффициенты классов</a>'
             )
         return super().render_change_form(request, context, *args, **kwargs)
+    def get_queryset(self, request):
+        # Количество уникальных участников считается в том же запросе, что и список
+        return super().get_queryset(request).annotate(
+            participants_total=Count('participants__player__game_nickname', distinct=True)
+        )
     def participants_count(self, obj):
-        unique_players = obj.participants.values('player__game_nickname').distinct().count()
-        return unique_players
+        if hasattr(obj, 'participants_total'):
+            return obj.participants_total
+        return obj.participants.values('player__game_nickname').distinct().count()
     participants_count.short_description = 'Уникальных участников'
+    participants_count.admin_order_field = 'participants_total'
     def get_inline_instances(self, request, obj=None):
         inlines = []
-        inlines.append(ActivityParticipantInline(self.model, self.admin_site))
-        for game_class in GameClass.objects.all():
-            inline = make_class_level_inline(game_class)
+        for inline in get_class_level_inlines():
             inlines.append(inline(self.model, self.admin_site))
         return inlines
 
 @admin.register(ActivityHistory)
-class ActivityHistoryAdmin(admin.ModelAdmin):
+class ActivityHistoryAdmin(ParticipantsPageMixin, admin.ModelAdmin):
     list_display = ('name', 'activity_started_at', 'activity_ended_at', 'participants_count')  # убрал is_exported
     search_fields = ('name', 'description')
     list_filter = ('activity_started_at',)  # убрал is_exported
     ordering = ('-activity_ended_at',)
-    readonly_fields = ('original_activity', 'created_at', 'updated_at')  # убрал is_exported
+    readonly_fields = ('original_activity', 'export_hash', 'created_at', 'updated_at', 'participants_summary')  # убрал is_exported
     # list_editable = ('is_exported',)  # убрал
-    inlines = [ActivityHistoryParticipantInline]
+    participants_model = ActivityHistoryParticipant
+    participants_fk = 'activity_history'
+    participants_form = ActivityHistoryParticipantForm
     fieldsets = (
         ('Основная информация', {
             'fields': ('name', 'description', 'base_coefficient', 'ignore_odds')
@@ -324,20 +656,117 @@ class ActivityHistoryAdmin(admin.ModelAdmin):
         ('Время активности', {
             'fields': ('activity_started_at', 'activity_ended_at')
         }),
+        ('Участники', {
+            'fields': ('participants_summary',),
+            'description': 'Сохранение участника планирует автообновление в Google Sheets.'
+        }),
         ('Техническая информация', {
-            'fields': ('original_activity', 'is_exported', 'created_at', 'updated_at'),
+            'fields': ('original_activity', 'is_exported', 'export_hash', 'created_at', 'updated_at'),
             'classes': ('collapse',),
-            'description': 'При изменении данных происходит автообновление в Google Sheets (Лист1).'
+            'description': 'При изменении данных происходит автообновление в Google Sheets (лист раздела по дате активности).'
         }),
     )
+    actions = ['export_selected_csv', 'export_selected_xlsx', 'rebuild_selected_sheets', 'grant_points_from_file']
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(participants_total=Count('participants'))
     def participants_count(self, obj):
+        if hasattr(obj, 'participants_total'):
+            return obj.participants_total
         return obj.participants.count()
     participants_count.short_description = 'Участников'
+    participants_count.admin_order_field = 'participants_total'
+    def get_urls(self):
+        urls = super().get_urls()
+        custom_urls = [
+            path(
+                'export/',
+                self.admin_site.admin_view(self.export_history),
+                name='bot_activityhistory_export',
+            ),
+        ]
+        return custom_urls + self.get_participants_urls() + urls
+    def export_history(self, request):
+        """
+        Выгрузка участников историй: ?format=csv|xlsx, ?date_from=ГГГГ-ММ-ДД, ?date_to=ГГГГ-ММ-ДД,
+        ?ids=1,2,3 (выбранные истории).
+        """
+        from .history_export import export_response, history_participants_queryset
+        from django.utils.dateparse import parse_date
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        try:
+            date_from = parse_date(request.GET.get('date_from', ''))
+            date_to = parse_date(request.GET.get('date_to', ''))
+            ids = [int(pk) for pk in request.GET.get('ids', '').split(',') if pk.strip()]
+        except ValueError as e:
+            self.message_user(request, f'Некорректные параметры выгрузки: {e}', level=messages.ERROR)
+            return HttpResponseRedirect(reverse('admin:bot_activityhistory_changelist'))
+        queryset = history_participants_queryset(ids or None, date_from, date_to)
+        return export_response(queryset, request.GET.get('format', 'csv'))
+    def export_selected_csv(self, request, queryset):
+        from .history_export import export_response, history_participants_queryset
+        return export_response(history_participants_queryset(queryset.values('pk')), 'csv')
+    export_selected_csv.short_description = 'Выгрузить участников выбранных историй (CSV)'
+    def export_selected_xlsx(self, request, queryset):
+        from .history_export import export_response, history_participants_queryset
+        return export_response(history_participants_queryset(queryset.values('pk')), 'xlsx')
+    export_selected_xlsx.short_description = 'Выгрузить участников выбранных историй (XLSX)'
+    def rebuild_selected_sheets(self, request, queryset):
+        """
+        Пересобирает в фоне листы-разделы Google Sheets, в которые входят выбранные истории.
+        Одновременно идёт только одна пересборка; итог и ошибки пишутся в лог бота.
+        """
+        import threading
+        from django.db import connection
+        from . import logger
+        from .google_sheets import get_sheets_manager
+        from .sheets_rebuild import RebuildInProgress, claim_rebuild, rebuild_export, release_rebuild
+        try:
+            lease = claim_rebuild()
+        except RebuildInProgress:
+            messages.warning(request, 'Пересборка листов Google Sheets уже идёт — повторите после её завершения.')
+            return
+        try:
+            manager = get_sheets_manager()
+            partitions = sorted({
+                manager.sheet_title_for(started_at.strftime('%d.%m.%Y %H:%M:%S'))
+                for started_at in queryset.values_list('activity_started_at', flat=True)
+            })
+        except Exception:
+            release_rebuild(lease)
+            raise
+        user = request.user.get_username()
+
+        def run():
+            try:
+                report = rebuild_export(partitions=partitions, manager=manager, lease=lease)
+                logger.info(
+                    f"Пересборка листов {', '.join(report['sheets']) or '—'} (запустил {user}): "
+                    f"строк {report['rows']}, {report['rows_per_second']:.0f} строк/с, запросов {report['requests']}"
+                )
+                if report['failed_sheets']:
+                    logger.error(
+                        f"Пересборка (запустил {user}): не удалось пересобрать листы {', '.join(report['failed_sheets'])}"
+                    )
+            except Exception as e:
+                logger.error(f"Ошибка при пересборке выгрузки (запустил {user}): {e}")
+            finally:
+                release_rebuild(lease)
+                connection.close()
+
+        threading.Thread(target=run, name='sheets-rebuild', daemon=True).start()
+        messages.info(
+            request,
+            f"Запущена пересборка листов Google Sheets: {', '.join(partitions)}. Итог будет записан в лог бота.",
+        )
+    rebuild_selected_sheets.short_description = 'Пересобрать листы Google Sheets с выбранными историями'
     def save_model(self, request, obj, form, change):
         super().save_model(request, obj, form, change)
-        # Автообновление Google Sheets при изменении истории активности
-        from .models import export_activity_history_to_google_sheets
-        export_activity_history_to_google_sheets(obj)
+        # Автообновление Google Sheets при изменении истории активности (правки участников
+        # в этом же сохранении склеиваются в один экспорт)
+        from .export_scheduler import schedule_export
+        schedule_export(obj)
+        messages.info(request, 'Обновление данных в Google Sheets запланировано.')
 
     def has_add_permission(self, request):
         return False  # Запрещаем создание записей вручную
@@ -347,37 +776,43 @@ class ActivityHistoryAdmin(admin.ModelAdmin):
 
     def delete_model(self, request, obj):
         """Обработчик удаления записи истории"""
-        # Если запись была экспортирована, удаляем данные из Google Sheets
-        if obj.is_exported:
-            from .models import delete_activity_history_from_google_sheets
-            success = delete_activity_history_from_google_sheets(obj)
-            if success:
-                messages.success(request, 'Данные удалены из Google Sheets (Лист1).')
+        # Удаляем данные из Google Sheets (даже если экспорт ещё в очереди и is_exported=False,
+        # строки могли попасть в лист при прошлом экспорте; поиск идёт по индексу строк).
+        # Лист чистится после фиксации транзакции админки, чтобы аренда листа и запросы к API
+        # не выполнялись внутри неё; для поиска строк достаточно названия и времени начала.
+        from .models import delete_activity_history_from_google_sheets
+
+        def delete_from_sheets():
+            if delete_activity_history_from_google_sheets(obj):
+                messages.success(request, 'Данные удалены из Google Sheets.')
             else:
                 messages.warning(request, 'Не удалось удалить данные из Google Sheets.')
-        
+
         # Удаляем запись
         super().delete_model(request, obj)
         messages.success(request, 'Запись истории активности удалена.')
+        transaction.on_commit(delete_from_sheets)
 
     def delete_queryset(self, request, queryset):
         """Обработчик массового удаления записей истории"""
-        for obj in queryset:
-            # Если запись была экспортирована, удаляем данные из Google Sheets
-            if obj.is_exported:
-                from .models import delete_activity_history_from_google_sheets
-                success = delete_activity_history_from_google_sheets(obj)
-                if not success:
+        from .models import delete_activity_history_from_google_sheets
+        histories = list(queryset)
+
+        def delete_from_sheets():
+            for obj in histories:
+                if not delete_activity_history_from_google_sheets(obj):
                     messages.warning(request, f'Не удалось удалить данные из Google Sheets для активности "{obj.name}".')
-        
-        # Удаляем записи
+
+        # Удаляем записи, данные из Google Sheets — после фиксации транзакции
         super().delete_queryset(request, queryset)
-        messages.success(request, f'Удалено записей истории: {queryset.count()}.')
+        messages.success(request, f'Удалено записей истории: {len(histories)}.')
+        transaction.on_commit(delete_from_sheets)
 
 @admin.register(ActivityParticipant)
 class ActivityParticipantAdmin(admin.ModelAdmin):
     """Отдельное представление для участников активностей"""
     list_display = ('player_game_nickname', 'activity', 'class_name', 'class_level', 'joined_at', 'completed_at', 'points_earned', 'additional_points', 'total_points')
+    list_select_related = ('activity',)
     search_fields = ('player_game_nickname', 'activity__name', 'class_name')
     list_filter = ('activity', 'class_name')
     ordering = ('-joined_at',)
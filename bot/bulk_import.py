@@ -0,0 +1,309 @@
+import csv
+import io
+import time
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import ActivityHistoryParticipant, GameClass, Player, PlayerClass
+
+# Колонки файла начисления доп. баллов: {поле: допустимые заголовки в нижнем регистре, первый — основной}
+POINTS_COLUMNS = {
+    'nickname': ('никнейм', 'ник', 'игровой никнейм', 'участник', 'nickname', 'game_nickname'),
+    'class_name': ('класс', 'class', 'class_name'),
+    'points': ('баллы', 'доп баллы', 'доп. баллы', 'points', 'additional_points'),
+}
+# Колонки файла состава гильдии (строка на класс игрока); без заголовка — в этом порядке
+ROSTER_COLUMNS = {
+    'nickname': ('никнейм', 'ник', 'игровой никнейм', 'nickname', 'game_nickname'),
+    'telegram_id': ('telegram id', 'telegram_id', 'tg id', 'телеграм id'),
+    'class_name': ('класс', 'class', 'class_name'),
+    'level': ('уровень', 'level'),
+    'tg_name': ('telegram имя', 'имя в телеграм', 'tg_name', 'telegram'),
+}
+ROSTER_REQUIRED = ('nickname',)
+# Размер пачки для bulk_create и выборок по списку ключей
+IMPORT_BATCH_SIZE = 1000
+
+
+class ImportFileError(Exception):
+    """Файл импорта не удаётся прочитать или в нём нет нужных колонок"""
+
+
+def _normalize(value):
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def read_table(uploaded_file):
+    """
+    Строки таблицы из CSV (UTF-8, разделитель ; , или табуляция) или XLSX (первый лист).
+    Возвращает список строк — списков значений-строк; пустые строки пропускаются.
+    """
+    name = (getattr(uploaded_file, 'name', '') or '').lower()
+    if name.endswith('.xlsx'):
+        from openpyxl import load_workbook
+        try:
+            workbook = load_workbook(uploaded_file, read_only=True, data_only=True)
+        except Exception as e:
+            raise ImportFileError(f'Не удалось прочитать XLSX: {e}')
+        try:
+            rows = [[_normalize(value) for value in row] for row in workbook.worksheets[0].iter_rows(values_only=True)]
+        finally:
+            workbook.close()
+    else:
+        try:
+            text = uploaded_file.read().decode('utf-8-sig')
+        except UnicodeDecodeError:
+            raise ImportFileError('CSV должен быть в кодировке UTF-8')
+        try:
+            delimiter = csv.Sniffer().sniff(text[:4096], delimiters=';,\t').delimiter
+        except csv.Error:
+            delimiter = ';'
+        rows = [[_normalize(value) for value in row] for row in csv.reader(io.StringIO(text), delimiter=delimiter)]
+    return [row for row in rows if any(row)]
+
+
+def map_columns(rows, columns, required=None):
+    """
+    Строки таблицы как словари {поле: значение} с номером строки файла.
+    Колонки определяются по заголовку (первая строка); если заголовка нет,
+    берутся по порядку columns. required — обязательные колонки заголовка (по умолчанию все),
+    отсутствующие необязательные в словарь не попадают.
+    Возвращает список пар (номер_строки, словарь).
+    """
+    if not rows:
+        return []
+    header = [value.lower() for value in rows[0]]
+    positions = {}
+    for field, aliases in columns.items():
+        for index, title in enumerate(header):
+            if title in aliases:
+                positions[field] = index
+                break
+    if positions:
+        missing = [field for field in (columns if required is None else required) if field not in positions]
+        if missing:
+            raise ImportFileError(f"В заголовке нет колонок: {', '.join(columns[field][0] for field in missing)}")
+        start = 1
+    else:
+        positions = {field: index for index, field in enumerate(columns)}
+        start = 0
+    return [
+        (line, {field: row[index] if index < len(row) else '' for field, index in positions.items()})
+        for line, row in enumerate(rows[start:], start=start + 1)
+    ]
+
+
+def parse_float(value):
+    """Число из ячейки: допускается десятичная запятая и пробелы между разрядами"""
+    return float(value.replace(',', '.').replace(' ', ''))
+
+
+def grant_additional_points(participants, uploaded_file):
+    """
+    Начисляет доп. баллы участникам (queryset ActivityParticipant или ActivityHistoryParticipant)
+    по файлу с колонками никнейм, класс, баллы. Строки сопоставляются через индекс
+    {(никнейм, класс): [участники]}, построенный одним запросом; пустой класс — все классы игрока.
+    Изменения записываются одним bulk_update в транзакции; для историй после коммита
+    планируется по одному экспорту в Google Sheets на историю.
+    Возвращает отчёт: matched/updated/unmatched/errors.
+    """
+    rows = map_columns(read_table(uploaded_file), POINTS_COLUMNS)
+    report = {'rows': len(rows), 'matched': 0, 'updated': 0, 'unmatched': [], 'errors': []}
+
+    with transaction.atomic():
+        index = {}
+        by_nickname = {}
+        fk_field = 'activity_history' if participants.model is ActivityHistoryParticipant else 'activity'
+        for participant in participants.select_for_update().only(
+            'pk', fk_field, 'player_game_nickname', 'class_name', 'additional_points'
+        ):
+            nickname = participant.player_game_nickname.strip().lower()
+            index.setdefault((nickname, participant.class_name.strip().lower()), []).append(participant)
+            by_nickname.setdefault(nickname, []).append(participant)
+
+        changed = {}
+        for line, values in rows:
+            try:
+                points = parse_float(values['points'])
+            except ValueError:
+                report['errors'].append(f"Строка {line}: некорректное количество баллов «{values['points']}»")
+                continue
+            nickname = values['nickname'].lower()
+            if values['class_name']:
+                matched = index.get((nickname, values['class_name'].lower()), [])
+            else:
+                matched = by_nickname.get(nickname, [])
+            if not matched:
+                report['unmatched'].append(
+                    f"Строка {line}: {values['nickname']}" + (f" ({values['class_name']})" if values['class_name'] else '')
+                )
+                continue
+            report['matched'] += 1
+            for participant in matched:
+                participant.additional_points = (participant.additional_points or 0) + points
+                changed[participant.pk] = participant
+
+        if changed:
+            participants.model.objects.bulk_update(list(changed.values()), ['additional_points'], batch_size=1000)
+            # bulk_update не вызывает post_save: экспорт историй планируется явно, один на историю
+            if fk_field == 'activity_history':
+                from .export_scheduler import schedule_export
+                for history_id in sorted({participant.activity_history_id for participant in changed.values()}):
+                    schedule_export(history_id)
+        report['updated'] = len(changed)
+    return report
+
+
+def _chunks(items, size=IMPORT_BATCH_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _upsert_target(unique_fields):
+    """
+    unique_fields для bulk_create(update_conflicts=True): MySQL (ON DUPLICATE KEY UPDATE) не принимает
+    явный ключ конфликта и сам сопоставляет строки по уникальным индексам.
+    """
+    if connection.features.supports_update_conflicts_with_target:
+        return {'unique_fields': unique_fields}
+    return {}
+
+
+def import_roster(uploaded_file, mark_our_players=False):
+    """
+    Импорт состава гильдии из CSV/XLSX: никнейм, Telegram ID, класс, уровень, Telegram имя
+    (строка на каждый класс игрока; класс можно не указывать). Игроки добавляются или обновляются
+    через bulk_create(update_conflicts=True) по game_nickname, классы игроков — по (игрок, класс)
+    (на MySQL — по уникальным индексам этих полей).
+    Пустые ячейки не затирают уже сохранённые значения. Игрокам без выбранного класса
+    выбирается первый импортированный. Всё выполняется в одной транзакции.
+    Возвращает отчёт со счётчиками добавленных/обновлённых записей и ошибками строк.
+    """
+    started = time.perf_counter()
+    rows = map_columns(read_table(uploaded_file), ROSTER_COLUMNS, required=ROSTER_REQUIRED)
+    report = {
+        'rows': len(rows), 'players_inserted': 0, 'players_updated': 0,
+        'classes_inserted': 0, 'classes_updated': 0, 'errors': [],
+    }
+    game_classes = {name.lower(): pk for pk, name in GameClass.objects.values_list('pk', 'name')}
+
+    # Разбор файла: {никнейм: данные игрока}, {(никнейм, id класса): уровень}; последнее значение побеждает
+    players = {}
+    levels = {}
+    for line, values in rows:
+        nickname = values['nickname']
+        if not nickname:
+            report['errors'].append(f'Строка {line}: не указан никнейм')
+            continue
+        class_name = values.get('class_name', '')
+        game_class_id = None
+        if class_name:
+            game_class_id = game_classes.get(class_name.lower())
+            if game_class_id is None:
+                report['errors'].append(f'Строка {line}: неизвестный класс «{class_name}»')
+                continue
+        level = 1
+        if values.get('level'):
+            try:
+                level = int(parse_float(values['level']))
+            except ValueError:
+                report['errors'].append(f"Строка {line}: некорректный уровень «{values['level']}»")
+                continue
+        player = players.setdefault(nickname, {'telegram_id': '', 'tg_name': ''})
+        for field in ('telegram_id', 'tg_name'):
+            if values.get(field):
+                player[field] = values[field]
+        if game_class_id is not None:
+            levels[(nickname, game_class_id)] = level
+
+    with transaction.atomic():
+        existing = {}
+        for nicknames in _chunks(players):
+            existing.update({
+                nickname: (telegram_id, tg_name)
+                for nickname, telegram_id, tg_name in Player.objects.filter(game_nickname__in=nicknames)
+                .values_list('game_nickname', 'telegram_id', 'tg_name')
+            })
+        now = timezone.now()
+        player_objects = []
+        for nickname, data in players.items():
+            saved_telegram_id, saved_tg_name = existing.get(nickname, ('', ''))
+            player_objects.append(Player(
+                game_nickname=nickname,
+                telegram_id=data['telegram_id'] or saved_telegram_id,
+                tg_name=data['tg_name'] or saved_tg_name,
+                is_our_player=mark_our_players,
+                created_at=now,
+                updated_at=now,
+            ))
+        update_fields = ['telegram_id', 'tg_name', 'updated_at'] + (['is_our_player'] if mark_our_players else [])
+        Player.objects.bulk_create(
+            player_objects, batch_size=IMPORT_BATCH_SIZE,
+            update_conflicts=True, update_fields=update_fields, **_upsert_target(['game_nickname']),
+        )
+        report['players_updated'] = len(existing)
+        report['players_inserted'] = len(players) - len(existing)
+
+        # id игроков и их текущие классы (bulk_create с update_conflicts возвращает id не на всех СУБД)
+        player_ids = {}
+        selected = {}
+        existing_classes = set()
+        for nicknames in _chunks(players):
+            for pk, nickname, selected_class_id in Player.objects.filter(game_nickname__in=nicknames).values_list(
+                'pk', 'game_nickname', 'selected_class_id'
+            ):
+                player_ids[nickname] = pk
+                selected[pk] = selected_class_id
+        for ids in _chunks(player_ids.values()):
+            existing_classes.update(
+                PlayerClass.objects.filter(player_id__in=ids).values_list('player_id', 'game_class_id')
+            )
+
+        class_objects = [
+            PlayerClass(
+                player_id=player_ids[nickname], game_class_id=game_class_id, level=level,
+                created_at=now, updated_at=now,
+            )
+            for (nickname, game_class_id), level in levels.items()
+        ]
+        PlayerClass.objects.bulk_create(
+            class_objects, batch_size=IMPORT_BATCH_SIZE,
+            update_conflicts=True, update_fields=['level', 'updated_at'], **_upsert_target(['player', 'game_class']),
+        )
+        report['classes_updated'] = sum(
+            1 for player_class in class_objects
+            if (player_class.player_id, player_class.game_class_id) in existing_classes
+        )
+        report['classes_inserted'] = len(class_objects) - report['classes_updated']
+
+        # Выбранный класс для игроков, у которых его ещё нет
+        first_class = {}
+        for player_class in class_objects:
+            if selected.get(player_class.player_id) is None:
+                first_class.setdefault(player_class.player_id, player_class.game_class_id)
+        if first_class:
+            class_ids = {}
+            for ids in _chunks(first_class):
+                class_ids.update({
+                    (player_id, game_class_id): pk
+                    for pk, player_id, game_class_id in PlayerClass.objects.filter(player_id__in=ids)
+                    .values_list('pk', 'player_id', 'game_class_id')
+                })
+            Player.objects.bulk_update(
+                [
+                    Player(pk=player_id, selected_class_id=class_ids[(player_id, game_class_id)])
+                    for player_id, game_class_id in first_class.items()
+                ],
+                ['selected_class'], batch_size=IMPORT_BATCH_SIZE,
+            )
+        # bulk_create/bulk_update не вызывают сигналы: профили игроков в кеше сбрасываются целиком
+        from .caching import invalidate_player
+        invalidate_player()
+    report['seconds'] = time.perf_counter() - started
+    return report
@@ -0,0 +1,193 @@
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+# Семейства ключей кеша: профиль игрока, готовый текст профиля и список классов игрока
+# (по telegram_id), список игровых классов, активные активности, таблицы коэффициентов классов
+# и сводки панели идущих активностей (по id активности)
+FAMILY_PLAYER = 'player'
+FAMILY_PROFILE_TEXT = 'profile_text'
+FAMILY_PLAYER_CLASSES = 'player_classes'
+FAMILY_CLASSES = 'classes'
+FAMILY_ACTIVITIES = 'activities'
+FAMILY_COEFFICIENTS = 'coefficients'
+FAMILY_LIVE_STATS = 'live_stats'
+FAMILIES = (
+    FAMILY_PLAYER, FAMILY_PROFILE_TEXT, FAMILY_PLAYER_CLASSES, FAMILY_CLASSES, FAMILY_ACTIVITIES, FAMILY_COEFFICIENTS,
+    FAMILY_LIVE_STATS,
+)
+
+# Отсутствие записи в БД тоже кешируется, чтобы не повторять запрос для незарегистрированных
+_MISSING = '__missing__'
+_NOT_CACHED = object()
+
+
+class CacheStats:
+    """Счётчики попаданий и промахов кеша по семействам ключей (в пределах процесса)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+
+    def record(self, family, hit):
+        with self._lock:
+            counters = self._counters.setdefault(family, {'hits': 0, 'misses': 0, 'invalidations': 0})
+            counters['hits' if hit else 'misses'] += 1
+
+    def record_invalidation(self, family):
+        with self._lock:
+            counters = self._counters.setdefault(family, {'hits': 0, 'misses': 0, 'invalidations': 0})
+            counters['invalidations'] += 1
+
+    def as_dict(self):
+        with self._lock:
+            result = {}
+            for family, counters in self._counters.items():
+                total = counters['hits'] + counters['misses']
+                result[family] = {**counters, 'hit_ratio': round(counters['hits'] / total, 3) if total else None}
+            return result
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+
+
+cache_stats = CacheStats()
+
+
+def _version_key(family, ident=None):
+    return f'bot:ver:{family}' if ident is None else f'bot:ver:{family}:{ident}'
+
+
+def _get_version(key):
+    """
+    Текущая версия ключа. Начальная версия — от текущего времени, а не 1: если запись версии
+    вытеснена из кеша, новая версия не совпадёт со старыми ключами данных.
+    """
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key, time.time_ns())
+    return version
+
+
+def family_version(family):
+    """Текущая версия семейства ключей (метка для реестров в памяти процессов)"""
+    return _get_version(_version_key(family))
+
+
+def cache_key(family, ident=None):
+    """Ключ данных с версией семейства и, для ключей по объекту, версией объекта"""
+    version = family_version(family)
+    if ident is None:
+        return f'bot:{family}:{version}'
+    return f'bot:{family}:{version}:{ident}:{_get_version(_version_key(family, ident))}'
+
+
+def cached(family, ident, loader, timeout=None):
+    """Значение из кеша или результат loader(), сохранённый под версионированным ключом"""
+    key = cache_key(family, ident)
+    value = cache.get(key, _NOT_CACHED)
+    if value is not _NOT_CACHED:
+        cache_stats.record(family, hit=True)
+        return None if value == _MISSING else value
+    cache_stats.record(family, hit=False)
+    value = loader()
+    cache.set(key, _MISSING if value is None else value, timeout)
+    return value
+
+
+def _bump(family, ident=None):
+    key = _version_key(family, ident)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), None)
+    cache_stats.record_invalidation(family)
+
+
+def invalidate_player(telegram_id=None):
+    """Сброс профиля, текста профиля и списка классов игрока (или всех игроков, если telegram_id не указан)"""
+    for family in (FAMILY_PLAYER, FAMILY_PROFILE_TEXT, FAMILY_PLAYER_CLASSES):
+        invalidate(family, telegram_id)
+
+
+def invalidate(family, ident=None):
+    """
+    Сбрасывает кеш объекта (ident) или всего семейства. Версия меняется после коммита,
+    чтобы параллельный запрос не закешировал под новой версией ещё не закоммиченные данные.
+    """
+    transaction.on_commit(lambda: _bump(family, ident))
+
+
+def get_player_profile(telegram_id):
+    """Профиль игрока (данные, классы, выбранный класс) словарём или None, если игрок не зарегистрирован"""
+    from .models import Player
+
+    def load():
+        player = Player.objects.filter(telegram_id=str(telegram_id)).select_related(
+            'selected_class__game_class'
+        ).first()
+        if player is None:
+            return None
+        classes = [
+            {
+                'id': player_class.pk,
+                'game_class_id': player_class.game_class_id,
+                'class_name': player_class.game_class.name,
+                'level': player_class.level,
+            }
+            for player_class in player.player_classes.select_related('game_class').order_by('pk')
+        ]
+        selected = player.selected_class
+        return {
+            'id': player.pk,
+            'telegram_id': player.telegram_id,
+            'game_nickname': player.game_nickname,
+            'tg_name': player.tg_name,
+            'is_admin': player.is_admin,
+            'is_our_player': player.is_our_player,
+            'created_at': player.created_at,
+            'classes': classes,
+            'selected_class': {
+                'id': selected.pk,
+                'game_class_id': selected.game_class_id,
+                'class_name': selected.game_class.name,
+                'level': selected.level,
+            } if selected else None,
+        }
+
+    return cached(FAMILY_PLAYER, str(telegram_id), load)
+
+
+def get_game_classes():
+    """Все игровые классы [(id, название)] по названию"""
+    from .models import GameClass
+    return cached(FAMILY_CLASSES, None, lambda: list(GameClass.objects.order_by('name').values_list('pk', 'name')))
+
+
+def get_active_activities():
+    """Активные активности словарями, новые первыми"""
+    from .models import Activity
+    return cached(FAMILY_ACTIVITIES, None, lambda: list(
+        Activity.objects.filter(is_active=True).order_by('-created_at').values(
+            'id', 'name', 'description', 'is_active', 'base_coefficient', 'ignore_odds', 'created_at', 'activated_at'
+        )
+    ))
+
+
+def get_class_coefficients(activity_id):
+    """Коэффициенты классов активности [(класс, мин. уровень, макс. уровень, коэффициент)]"""
+    from .models import load_class_coefficients
+    return cached(FAMILY_COEFFICIENTS, activity_id, lambda: load_class_coefficients([activity_id]).get(activity_id, []))
+
+
+def cache_metrics():
+    """Бэкенд кеша и доля попаданий по семействам ключей"""
+    from django.conf import settings
+    return {
+        'backend': settings.CACHES['default']['BACKEND'],
+        'families': cache_stats.as_dict(),
+    }
@@ -0,0 +1,65 @@
+import threading
+from types import MappingProxyType
+
+from .caching import FAMILY_CLASSES, FAMILY_PLAYER_CLASSES, cached, family_version, get_game_classes, get_player_profile
+from .models import GameClass, PlayerClass
+
+
+class GameClassCatalog:
+    """
+    Неизменяемый снимок игровых классов {id: название} в памяти процесса. Игровые классы почти
+    не меняются, поэтому снимок целиком заменяется новым, только когда сигналы GameClass
+    увеличили версию семейства «classes» в общем кеше; читатели без блокировок получают
+    согласованный снимок.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = (None, MappingProxyType({}))  # (версия, {id: название})
+
+    def _names(self):
+        version = family_version(FAMILY_CLASSES)
+        snapshot = self._snapshot
+        if snapshot[0] != version:
+            with self._lock:
+                if self._snapshot[0] != version:
+                    self._snapshot = (version, MappingProxyType(dict(get_game_classes())))
+                snapshot = self._snapshot
+        return snapshot[1]
+
+    def name(self, game_class_id):
+        """Название класса; GameClass.DoesNotExist, если класса нет"""
+        try:
+            return self._names()[game_class_id]
+        except KeyError:
+            raise GameClass.DoesNotExist(f'Игровой класс {game_class_id} не найден')
+
+    def all(self):
+        """Все классы [(id, название)] по названию"""
+        return sorted(self._names().items(), key=lambda item: item[1])
+
+
+game_class_catalog = GameClassCatalog()
+
+
+def get_player_classes(telegram_id):
+    """
+    Классы игрока списком словарей {id, game_class_id, class_name, level} в порядке добавления
+    или None, если игрок не зарегистрирован. В кеше по игроку хранятся только
+    (id класса игрока, id игрового класса, уровень); названия берутся из каталога.
+    """
+    profile = get_player_profile(telegram_id)
+    if profile is None:
+        return None
+    rows = cached(FAMILY_PLAYER_CLASSES, str(telegram_id), lambda: list(
+        PlayerClass.objects.filter(player_id=profile['id']).order_by('pk').values_list('pk', 'game_class_id', 'level')
+    ))
+    return [
+        {
+            'id': player_class_id,
+            'game_class_id': game_class_id,
+            'class_name': game_class_catalog.name(game_class_id),
+            'level': level,
+        }
+        for player_class_id, game_class_id, level in rows
+    ]
@@ -0,0 +1,90 @@
+from django.db import transaction
+
+from .models import ActivityClassLevelCoefficient, GameClassBaseCoefficientCondition
+
+
+def invalidate_activity_coefficients(activity_id):
+    """Сброс кешированной таблицы коэффициентов активности и её сводки на панели"""
+    from .caching import FAMILY_COEFFICIENTS, invalidate
+    from .live_stats import live_stats
+    invalidate(FAMILY_COEFFICIENTS, activity_id)
+    transaction.on_commit(lambda: live_stats.invalidate(activity_id))
+
+
+def get_coefficient_template():
+    """
+    Шаблон коэффициентов из базовых условий всех игровых классов.
+    Возвращает словарь {(game_class_id, min_level, max_level): coefficient}, загруженный одним запросом.
+    """
+    conditions = GameClassBaseCoefficientCondition.objects.values_list(
+        'game_class_id', 'min_level', 'max_level', 'coefficient'
+    )
+    return {
+        (game_class_id, min_level, max_level): coefficient
+        for game_class_id, min_level, max_level, coefficient in conditions
+    }
+
+
+def apply_coefficient_template(activity, template=None):
+    """Создаёт коэффициенты классов для новой активности одним bulk_create"""
+    if template is None:
+        template = get_coefficient_template()
+    ActivityClassLevelCoefficient.objects.bulk_create([
+        ActivityClassLevelCoefficient(
+            activity=activity,
+            game_class_id=game_class_id,
+            min_level=min_level,
+            max_level=max_level,
+            coefficient=coefficient
+        )
+        for (game_class_id, min_level, max_level), coefficient in template.items()
+    ])
+    invalidate_activity_coefficients(activity.pk)
+    return len(template)
+
+
+def sync_activity_coefficients(activity, template=None):
+    """
+    Синхронизирует коэффициенты активности с базовыми условиями классов.
+    Меняет только отличающиеся диапазоны: добавляет недостающие, обновляет изменённые
+    и удаляет лишние. Возвращает словарь со счётчиками created/updated/deleted.
+    """
+    if template is None:
+        template = get_coefficient_template()
+    with transaction.atomic():
+        existing = {
+            (coeff.game_class_id, coeff.min_level, coeff.max_level): coeff
+            for coeff in ActivityClassLevelCoefficient.objects.select_for_update().filter(activity=activity)
+        }
+        to_create = [
+            ActivityClassLevelCoefficient(
+                activity=activity,
+                game_class_id=game_class_id,
+                min_level=min_level,
+                max_level=max_level,
+                coefficient=coefficient
+            )
+            for (game_class_id, min_level, max_level), coefficient in template.items()
+            if (game_class_id, min_level, max_level) not in existing
+        ]
+        to_update = []
+        for key, coeff in existing.items():
+            if key in template and coeff.coefficient != template[key]:
+                coeff.coefficient = template[key]
+                to_update.append(coeff)
+        to_delete = [coeff.pk for key, coeff in existing.items() if key not in template]
+
+        if to_delete:
+            ActivityClassLevelCoefficient.objects.filter(pk__in=to_delete).delete()
+        if to_update:
+            ActivityClassLevelCoefficient.objects.bulk_update(to_update, ['coefficient'])
+        if to_create:
+            ActivityClassLevelCoefficient.objects.bulk_create(to_create)
+        if to_update or to_create:
+            # bulk_update/bulk_create не вызывают сигналы: кеш коэффициентов сбрасывается явно
+            invalidate_activity_coefficients(activity.pk)
+    return {
+        'created': len(to_create),
+        'updated': len(to_update),
+        'deleted': len(to_delete),
+    }
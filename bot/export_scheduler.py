@@ -0,0 +1,134 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import ActivityHistory
+
+
+class ExportScheduler:
+    """
+    Отложенный экспорт истории активностей в Google Sheets.
+    Все вызовы schedule() для одной истории в пределах окна склеиваются в один экспорт,
+    который выполняется фоновым потоком. Пока экспорт не выполнен, у истории is_exported=False.
+    """
+
+    def __init__(self, window, max_delay):
+        self.window = window
+        self.max_delay = max_delay
+        self._pending = {}  # {history_id: (срок_экспорта, время_первого_запроса)}
+        self._condition = threading.Condition()
+        self._thread = None
+        self._paused = 0
+
+    def schedule(self, history_id):
+        """Помечает историю как неэкспортированную и ставит экспорт в очередь после коммита"""
+        ActivityHistory.objects.filter(pk=history_id).update(is_exported=False)
+        transaction.on_commit(lambda: self._enqueue(history_id))
+
+    def _enqueue(self, history_id):
+        with self._condition:
+            now = time.monotonic()
+            first_requested = self._pending.get(history_id, (None, now))[1]
+            deadline = min(now + self.window, first_requested + self.max_delay)
+            self._pending[history_id] = (deadline, first_requested)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='sheets-export', daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def _take_due(self):
+        """Ждёт, пока наступит срок хотя бы одного экспорта, и забирает все просроченные"""
+        with self._condition:
+            while True:
+                if not self._pending or self._paused:
+                    self._condition.wait()
+                    continue
+                now = time.monotonic()
+                due = [history_id for history_id, (deadline, _) in self._pending.items() if deadline <= now]
+                if due:
+                    for history_id in due:
+                        del self._pending[history_id]
+                    return due
+                self._condition.wait(min(deadline for deadline, _ in self._pending.values()) - now)
+
+    def _run(self):
+        while True:
+            due = self._take_due()
+            try:
+                self.export_many(due)
+            finally:
+                connection.close()
+
+    @contextmanager
+    def paused(self):
+        """
+        Приостанавливает фоновые экспорты (например, на время пересборки листов): запросы
+        копятся в очереди и выполняются после выхода из блока. Уже идущий экспорт завершается.
+        """
+        with self._condition:
+            self._paused += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._paused -= 1
+                self._condition.notify()
+
+    def export_many(self, history_ids):
+        """
+        Экспортирует несколько историй одним пакетом менеджера: окраска листов и оглавление
+        отправляются один раз в конце. Возвращает количество успешно экспортированных историй.
+        """
+        from .google_sheets import get_sheets_manager
+        try:
+            manager = get_sheets_manager()
+        except Exception as e:
+            print(f"Ошибка при создании Google Sheets Manager: {e}")
+            return 0
+        with manager.batch():
+            return sum(1 for history_id in history_ids if self.export_now(history_id))
+
+    def export_now(self, history_id):
+        """Экспортирует историю сразу и отмечает is_exported, если за это время не пришли новые изменения"""
+        from .models import export_activity_history_to_google_sheets
+        try:
+            history = ActivityHistory.objects.filter(pk=history_id).first()
+            if history is None:
+                return False
+            result = export_activity_history_to_google_sheets(history)
+            if result:
+                with self._condition:
+                    still_clean = history_id not in self._pending
+                if still_clean:
+                    ActivityHistory.objects.filter(pk=history_id).update(is_exported=True)
+            return bool(result)
+        except Exception as e:
+            print(f"Ошибка при отложенном экспорте истории {history_id}: {e}")
+            return False
+
+    def flush(self):
+        """Выполняет все запланированные экспорты немедленно в текущем потоке"""
+        with self._condition:
+            due = list(self._pending)
+            self._pending.clear()
+        self.export_many(due)
+        return len(due)
+
+    @property
+    def pending_count(self):
+        with self._condition:
+            return len(self._pending)
+
+
+export_scheduler = ExportScheduler(
+    window=getattr(settings, 'SHEETS_EXPORT_DEBOUNCE_SECONDS', 5),
+    max_delay=getattr(settings, 'SHEETS_EXPORT_MAX_DELAY_SECONDS', 60),
+)
+
+
+def schedule_export(activity_history):
+    """Запланировать экспорт истории активности (принимает объект или id)"""
+    export_scheduler.schedule(getattr(activity_history, 'pk', activity_history))
@@ -1,12 +1,111 @@
 import os
 import json
+import threading
+from contextlib import contextmanager
+import httplib2
+import google_auth_httplib2
 from google.oauth2 import service_account
-from googleapiclient.discovery import build
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
 from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest
 from datetime import datetime, timedelta
+from django.conf import settings
+from .sheets_diff import (
+    SheetDiff, build_color_groups, build_delete_requests, build_update_ranges, diff_rows, event_key,
+    parse_first_row, row_key, rows_digest,
+)
+from .sheets_partitions import (
+    DEFAULT_INDEX_SHEET_TITLE, LEGACY_SHEET_TITLE, build_index_sheet_rows, partition_title,
+    split_rows_by_partition,
+)
+from .sheets_quota import QuotaGovernor
+
+SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
+
+# Цвета для чередования событий
+EVENT_COLORS = [
+    {"red": 1, "green": 0.95, "blue": 0.5},  # банановый
+    {"red": 0.7, "green": 0.9, "blue": 1},   # нежно-голубой
+]
+
+SHEET_HEADERS = [
+    'Дата создания',
+    'Активность',
+    'Участник',
+    'Класс',
+    'Уровень',
+    'Время начала',
+    'Время конца',
+    'Расчетное время',
+    'Коэффициент',
+    'Кол-во поинтов',
+    'Доп поинты',
+    'Поинты итого',
+]
+
+# Общий менеджер на процесс и разобранный discovery-документ Sheets v4 из пакета googleapiclient
+_manager = None
+_manager_lock = threading.Lock()
+_discovery_doc = None
+
+
+def get_discovery_document():
+    """Возвращает встроенный discovery-документ Sheets v4 (разбирается один раз на процесс)"""
+    global _discovery_doc
+    if _discovery_doc is None:
+        _discovery_doc = json.loads(get_static_doc('sheets', 'v4'))
+    return _discovery_doc
+
+
+def get_sheets_manager():
+    """Возвращает общий для процесса GoogleSheetsManager, создавая его при первом обращении"""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = GoogleSheetsManager()
+    return _manager
+
+
+def set_sheets_manager(manager):
+    """
+    Подменяет общий менеджер (например, менеджером с офлайн-заменой API из sheets_fake).
+    Возвращает предыдущий менеджер, чтобы его можно было вернуть обратно.
+    """
+    global _manager
+    with _manager_lock:
+        previous, _manager = _manager, manager
+    return previous
+
 
 class GoogleSheetsManager:
-    def __init__(self):
+    def __init__(self, service=None, spreadsheet_id=None, partition_period=None, index_sheet_title=None, quota=None,
+                 sheet_title_prefix=''):
+        self._local = threading.local()
+        # Бюджет запросов к API (квоты Google — на минуту, отдельно чтение и запись)
+        self.quota = quota or QuotaGovernor(
+            read_limit=getattr(settings, 'SHEETS_READ_REQUESTS_PER_MINUTE', 60),
+            write_limit=getattr(settings, 'SHEETS_WRITE_REQUESTS_PER_MINUTE', 60),
+        )
+        # Кеш sheetId по названию листа и последней окраски групп строк {лист: {(начало, конец, цвет)}}
+        self._sheet_ids = {}
+        self._sheet_ids_lock = threading.Lock()
+        self._colored_groups = {}
+        # Разбиение выгрузки по листам-периодам и последнее записанное оглавление
+        self.partition_period = partition_period or getattr(settings, 'SHEETS_PARTITION_PERIOD', 'month')
+        # Префикс названий листов (и записей индекса строк) — отделяет замеры от листов выгрузки
+        self.sheet_title_prefix = sheet_title_prefix
+        self.index_sheet_title = sheet_title_prefix + (index_sheet_title or getattr(
+            settings, 'SHEETS_INDEX_SHEET_TITLE', DEFAULT_INDEX_SHEET_TITLE
+        ))
+        self._index_sheet_rows = None
+        if service is not None:
+            # Готовый клиент (например, FakeSheetsService) — учётные данные не нужны
+            self.spreadsheet_id = spreadsheet_id or 'fake'
+            self.creds = None
+            self.service = service
+            return
         creds_json = os.getenv('GOOGLE_SHEETS_CREDS_JSON')
         if not creds_json:
             raise ValueError("Не найдена переменная окружения GOOGLE_SHEETS_CREDS_JSON")
@@ -14,10 +113,58 @@ class GoogleSheetsManager:
             creds_info = json.loads(creds_json)
         except Exception as e:
             raise ValueError(f"Ошибка парсинга GOOGLE_SHEETS_CREDS_JSON: {e}")
-        self.spreadsheet_id = os.getenv('GOOGLE_SHEETS_ID')
-        scopes = ['https://www.googleapis.com/auth/spreadsheets']
-        self.creds = service_account.Credentials.from_service_account_info(creds_info, scopes=scopes)
-        self.service = build('sheets', 'v4', credentials=self.creds)
+        self.spreadsheet_id = spreadsheet_id or os.getenv('GOOGLE_SHEETS_ID')
+        self.creds = service_account.Credentials.from_service_account_info(creds_info, scopes=SCOPES)
+        self.service = build_from_document(
+            get_discovery_document(),
+            http=self._thread_http(),
+            requestBuilder=self._build_request,
+        )
+
+    def _thread_http(self):
+        """
+        HTTP-транспорт текущего потока (httplib2.Http не потокобезопасен).
+        Учётные данные общие: токен кешируется и обновляется AuthorizedHttp по истечении срока.
+        """
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            http = google_auth_httplib2.AuthorizedHttp(self.creds, http=httplib2.Http())
+            self._local.http = http
+        return http
+
+    def _build_request(self, http, *args, **kwargs):
+        """Создаёт запрос к API на транспорте текущего потока"""
+        return HttpRequest(self._thread_http(), *args, **kwargs)
+
+    def _execute(self, request, kind='write', idempotent=None):
+        """
+        Выполняет запрос через учёт квоты (ожидание бюджета, повторы при 429 с задержкой;
+        при 5xx — только для чтений и записей с idempotent=True)
+        """
+        return self.quota.execute(request, kind, idempotent)
+
+    def quota_metrics(self):
+        """Использование квоты Google Sheets API в текущем окне и накопленные счётчики"""
+        return self.quota.metrics()
+
+    @contextmanager
+    def batch(self):
+        """
+        Пакет экспортов в текущем потоке: окраска затронутых листов и обновление оглавления
+        откладываются до конца пакета и отправляются одним batchUpdate и одним update.
+        """
+        if getattr(self._local, 'deferred', None) is not None:
+            yield
+            return
+        self._local.deferred = {'colorize': set(), 'index': False}
+        try:
+            yield
+        finally:
+            deferred, self._local.deferred = self._local.deferred, None
+            if deferred['colorize']:
+                self._colorize_sheets(sorted(deferred['colorize']))
+            if deferred['index']:
+                self._refresh_index_sheet()
 
     def get_spreadsheet_url(self):
         """Возвращает URL таблицы"""
@@ -36,10 +183,10 @@ class GoogleSheetsManager:
                 }
             }]
             body = {'requests': requests}
-            self.service.spreadsheets().batchUpdate(
+            self._execute(self.service.spreadsheets().batchUpdate(
                 spreadsheetId=self.spreadsheet_id,
                 body=body
-            ).execute()
+            ))
             return sheet_title
         except HttpError as error:
             print(f"Ошибка при создании листа: {error}")
@@ -83,12 +230,12 @@ class GoogleSheetsManager:
                 total_points,
             ])
         try:
-            self.service.spreadsheets().values().update(
+            self._execute(self.service.spreadsheets().values().update(
                 spreadsheetId=self.spreadsheet_id,
                 range=f"'{sheet_title}'!A1",
                 valueInputOption="RAW",
                 body={"values": values}
-            ).execute()
+            ), idempotent=True)
             return True
         except HttpError as error:
             print(f"Ошибка при записи данных: {error}")
@@ -97,15 +244,8 @@ class GoogleSheetsManager:
     def delete_sheet(self, sheet_title):
         """Удаляет лист из таблицы"""
         try:
-            spreadsheet = self.service.spreadsheets().get(
-                spreadsheetId=self.spreadsheet_id
-            ).execute()
-            sheet_id = None
-            for sheet in spreadsheet['sheets']:
-                if sheet['properties']['title'] == sheet_title:
-                    sheet_id = sheet['properties']['sheetId']
-                    break
-            if not sheet_id:
+            sheet_id = self._get_sheet_id(sheet_title)
+            if sheet_id is None:
                 print(f"Лист '{sheet_title}' не найден")
                 return False
             request = {
@@ -116,10 +256,11 @@ class GoogleSheetsManager:
             body = {
                 'requests': [request]
             }
-            self.service.spreadsheets().batchUpdate(
+            self._execute(self.service.spreadsheets().batchUpdate(
                 spreadsheetId=self.spreadsheet_id,
                 body=body
-            ).execute()
+            ))
+            self._forget_sheet(sheet_title)
             return True
         except HttpError as error:
             print(f"Ошибка при удалении листа: {error}")
@@ -128,243 +269,581 @@ class GoogleSheetsManager:
     def write_activity_data_to_sheet1(self, data):
         """
         Записывает данные участников в Лист1 с обновлением только измененных записей
-        Ключ для поиска: (Дата создания, Время начала, Участник, Класс, Активность)
+        Ключ для поиска: (Дата создания, Активность, Участник, Класс, Время начала)
         Цветовая маркировка: по (Активность, Дата создания)
-        Новые активности (по дате) — внизу.
+        Номера строк и хеши берутся из локального индекса SheetRowIndex, поэтому лист не читается.
+        Изменённые строки обновляются одним values.batchUpdate, новые — добавляются вниз через values.append,
+        строки события, которых больше нет в данных, удаляются.
         """
         if not data:
             return False
-        headers = [
-            'Дата создания',
-            'Активность',
-            'Участник',
-            'Класс',
-            'Уровень',
-            'Время начала',
-            'Время конца',
-            'Расчетное время',
-            'Коэффициент',
-            'Кол-во поинтов',
-            'Доп поинты',
-            'Поинты итого',
-        ]
-        # Получаем существующие данные
-        try:
-            existing_data = self.service.spreadsheets().values().get(
-                spreadsheetId=self.spreadsheet_id,
-                range='Лист1!A1:L'
-            ).execute()
-            existing_values = existing_data.get('values', [])
-        except Exception:
-            existing_values = []
-
-        # Создаем словарь для быстрого поиска существующих записей
-        existing_records = {}
-        if existing_values and existing_values[0] == headers:
-            for row in existing_values[1:]:
-                if len(row) >= 5:  # Проверяем, что есть все необходимые колонки
-                    key = (row[0], row[1], row[2], row[3], row[5])  # Дата, Активность, Участник, Класс, Время начала
-                    existing_records[key] = row
-
-        # Обрабатываем новые данные
-        new_records = {}
-        for row in data:
-            key = (
-                row.get('Дата создания', ''),
-                row.get('Активность', ''),
-                row.get('Участник', ''),
-                row.get('Класс', ''),
-                row.get('Время начала', '')
-            )
-            new_row = [
-                row.get('Дата создания', ''),
-                row.get('Активность', ''),
-                row.get('Участник', ''),
-                row.get('Класс', ''),
-                row.get('Уровень', ''),
-                row.get('Время начала', ''),
-                row.get('Время конца', ''),
-                row.get('Расчетное время', ''),
-                row.get('Коэффициент', ''),
-                row.get('Кол-во поинтов', ''),
-                row.get('Доп поинты', ''),
-                float(row.get('Кол-во поинтов', 0)) + float(row.get('Доп поинты', 0)),
-            ]
-            new_records[key] = new_row
+        return self._write_rows(self.sheet_title_prefix + LEGACY_SHEET_TITLE, [self._row_from_data(row) for row in data])
+
+    def write_activity_data_partitioned(self, data):
+        """
+        Записывает данные участников в листы-разделы по периоду даты события (SHEETS_PARTITION_PERIOD).
+        Лист раздела создаётся при первой записи в него; запись затрагивает только разделы
+        с этими событиями, поэтому её стоимость не растёт с накоплением истории.
+        После записи обновляется лист-оглавление со списком разделов и количеством строк.
+        Возвращает список записанных листов или None при ошибке.
+        """
+        if not data:
+            return None
+        partitions = self.partition_rows([self._row_from_data(row) for row in data])
+        for sheet_title, rows in partitions.items():
+            if not self._ensure_sheet(sheet_title) or not self._write_rows(sheet_title, rows):
+                return None
+        # Повторно сохранённая история до разбиения: прежние строки её событий убираются из Лист1
+        events = {event_key(row) for rows in partitions.values() for row in rows}
+        if not self._delete_legacy_event_rows(events, exclude=partitions):
+            return None
+        self._refresh_index_sheet()
+        return sorted(partitions)
 
-        # Объединяем записи, отдавая приоритет новым данным
-        final_records = {**existing_records, **new_records}
+    def sheet_title_for(self, created_date):
+        """Лист-раздел для даты события (значение колонки 'Дата создания')"""
+        return self.sheet_title_prefix + partition_title(created_date, self.partition_period)
 
-        # Сортируем записи по дате создания и времени начала
-        sorted_records = sorted(
-            final_records.values(),
-            key=lambda x: (x[0], x[5])  # Сортировка по дате создания и времени начала
-        )
+    def partition_rows(self, rows):
+        """Строки листа по листам-разделам {название_листа: [строки]} (с префиксом названий)"""
+        return {
+            self.sheet_title_prefix + sheet_title: partition_rows
+            for sheet_title, partition_rows in split_rows_by_partition(rows, self.partition_period).items()
+        }
+
+    def partition_titles(self, data):
+        """Листы-разделы, в которые попадут данные участников"""
+        rows = [self._row_from_data(row) for row in data]
+        return sorted(self.partition_rows(rows))
+
+    def export_digest(self, data):
+        """Хеш выгружаемого набора строк (с учётом разбиения по листам)"""
+        return rows_digest([self._row_from_data(row) for row in data], salt=self.partition_period)
+
+    def has_exported_rows(self, data):
+        """
+        Проверяет по локальному индексу (без обращения к API), что все строки данных есть в листах.
+        Защищает пропуск по хешу от сброса индекса или очистки листа.
+        """
+        from .sheets_index import count_event_rows
+        rows = [self._row_from_data(row) for row in data]
+        for sheet_title, partition_rows in self.partition_rows(rows).items():
+            keys = {row_key(row) for row in partition_rows}
+            events = {event_key(row) for row in partition_rows}
+            if count_event_rows(sheet_title, events) != len(keys):
+                return False
+        return True
 
-        # Формируем итоговый список для записи
-        final_values = [headers] + sorted_records
+    def rebuild_sheet(self, sheet_title, rows, chunk_rows=5000):
+        """
+        Переписывает лист целиком: заголовок и строки крупными values.update по chunk_rows строк,
+        хвост от прежнего содержимого очищается одним values.clear. Индекс строк листа строится заново,
+        окраска выполняется отдельно (finish_rebuild). Запись идёт под блокировкой листа,
+        как и экспорт, поэтому экспорт в этот лист не вклинится между записью и индексом.
+        Возвращает False при ошибке API.
+        """
+        from .sheets_index import SheetLockTimeout, invalidate_sheet_index, replace_sheet_index, sheet_lock
+        if not self._ensure_sheet(sheet_title):
+            return False
+        values = [SHEET_HEADERS] + rows
+        try:
+            with sheet_lock(sheet_title) as lease:
+                try:
+                    for offset in range(0, len(values), chunk_rows):
+                        self._execute(self.service.spreadsheets().values().update(
+                            spreadsheetId=self.spreadsheet_id,
+                            range=f"'{sheet_title}'!A{offset + 1}",
+                            valueInputOption='RAW',
+                            body={'values': values[offset:offset + chunk_rows]}
+                        ), idempotent=True)
+                        lease.renew()
+                    self._execute(self.service.spreadsheets().values().clear(
+                        spreadsheetId=self.spreadsheet_id,
+                        range=f"'{sheet_title}'!A{len(values) + 1}:L"
+                    ), idempotent=True)
+                except HttpError as error:
+                    print(f"Ошибка при пересборке листа {sheet_title}: {error}")
+                    # Лист мог быть переписан частично — индекс перестроится при следующей записи
+                    invalidate_sheet_index(sheet_title)
+                    return False
+                replace_sheet_index(sheet_title, rows)
+        except SheetLockTimeout as error:
+            print(f"Ошибка при пересборке листа {sheet_title}: {error}")
+            return False
+        self._colored_groups[sheet_title] = set()
+        return True
+
+    def finish_rebuild(self, sheet_titles):
+        """
+        Окраска пересобранных листов одним batchUpdate (с предварительным сбросом фона листа)
+        и обновление листа-оглавления.
+        """
+        from .sheets_index import load_event_rows
+        requests = []
+        new_groups = {}
+        try:
+            for sheet_title in sheet_titles:
+                sheet_id = self._get_sheet_id(sheet_title)
+                if sheet_id is None:
+                    continue
+                requests.append({
+                    "repeatCell": {
+                        "range": {"sheetId": sheet_id},
+                        "cell": {"userEnteredFormat": {}},
+                        "fields": "userEnteredFormat.backgroundColor"
+                    }
+                })
+                self._colored_groups[sheet_title] = set()
+                sheet_requests, groups = self._color_requests(SHEET_HEADERS, load_event_rows(sheet_title), sheet_title)
+                requests.extend(sheet_requests)
+                new_groups[sheet_title] = groups or []
+            if requests:
+                self._execute(self.service.spreadsheets().batchUpdate(
+                    spreadsheetId=self.spreadsheet_id,
+                    body={"requests": requests}
+                ), idempotent=True)
+            for sheet_title, groups in new_groups.items():
+                self._colored_groups[sheet_title] = set(groups)
+        except HttpError as error:
+            for sheet_title in sheet_titles:
+                self._colored_groups.pop(sheet_title, None)
+            print(f"Ошибка при окрашивании пересобранных листов: {error}")
+        self._refresh_index_sheet()
 
-        # Записываем обновлённые данные
+    def _ensure_sheet(self, sheet_title):
+        """Создаёт лист, если его ещё нет в таблице. Возвращает False при ошибке API"""
+        from .sheets_index import invalidate_sheet_index
         try:
-            self.service.spreadsheets().values().update(
+            if self._get_sheet_id(sheet_title) is not None:
+                return True
+            response = self._execute(self.service.spreadsheets().batchUpdate(
                 spreadsheetId=self.spreadsheet_id,
-                range='Лист1!A1',
-                valueInputOption="RAW",
-                body={"values": final_values}
-            ).execute()
-            # Цветовая маркировка после записи
-            self._colorize_events_in_sheet1(headers, sorted_records)
+                body={'requests': [{'addSheet': {'properties': {'title': sheet_title}}}]}
+            ))
+            properties = response['replies'][0]['addSheet']['properties']
+            with self._sheet_ids_lock:
+                self._sheet_ids[sheet_title] = properties['sheetId']
+            # Лист новый: записи индекса от удалённого вручную листа с тем же названием устарели
+            invalidate_sheet_index(sheet_title)
+            self._colored_groups.pop(sheet_title, None)
+            print(f"Создан лист '{sheet_title}'")
             return True
         except HttpError as error:
-            print(f"Ошибка при записи данных в Лист1: {error}")
+            print(f"Ошибка при создании листа {sheet_title}: {error}")
             return False
 
-    def delete_activity_data_from_sheet1(self, activity_history):
-        """Удаляет данные конкретной активности из Лист1"""
+    def _refresh_index_sheet(self):
+        """Переписывает лист-оглавление, только если список разделов или количество строк изменились"""
+        from .sheets_index import sheet_row_counts
+        if self.partition_period == 'none':
+            return
+        deferred = getattr(self._local, 'deferred', None)
+        if deferred is not None:
+            deferred['index'] = True
+            return
+        rows = build_index_sheet_rows(sheet_row_counts(self.sheet_title_prefix), self.index_sheet_title)
+        if rows == self._index_sheet_rows:
+            return
         try:
-            # Получаем все данные из Лист1
-            existing_data = self.service.spreadsheets().values().get(
-                spreadsheetId=self.spreadsheet_id,
-                range='Лист1!A:K'
-            ).execute()
-            
-            existing_values = existing_data.get('values', [])
-            
-            if not existing_values:
-                return True  # Лист пустой, нечего удалять
-            
-            headers = existing_data[0]
-            data_rows = existing_data[1:]
-            
-            # Находим строки, которые нужно удалить
-            rows_to_keep = []
-            activity_date = activity_history.activity_started_at.strftime('%d.%m.%Y')
-            activity_name = activity_history.name
-            
-            for i, row in enumerate(data_rows):
-                if len(row) > 0:
-                    # Проверяем, не относится ли эта строка к удаляемой активности
-                    # Сравниваем по дате создания (первая колонка) и названию активности
-                    if len(row) >= 1 and row[0] == activity_date:
-                        # Проверяем, есть ли в строке название активности
-                        if len(row) >= 11 and 'Активность' in headers:
-                            # Если есть колонка "Активность", сравниваем по ней
-                            activity_col_index = headers.index('Активность')
-                            if len(row) > activity_col_index and row[activity_col_index] == activity_name:
-                                # Это строка нашей активности - пропускаем её
-                                print(f"Удаляем запись активности: {row[1]} ({activity_name})")
-                                continue
-                        else:
-                            # Если нет колонки с названием активности, удаляем все записи с этой датой
-                            # но только если это единственная активность с этой датой
-                            print(f"Удаляем запись с датой {activity_date}: {row[1]}")
-                            continue
-                    
-                    # Это строка другой активности - сохраняем её
-                    rows_to_keep.append(row)
-            
-            # Если все строки удалены, очищаем лист
-            if not rows_to_keep:
-                # Очищаем весь лист
-                self.service.spreadsheets().values().clear(
+            if not self._ensure_sheet(self.index_sheet_title):
+                return
+            # Лишние строки от прошлого (более длинного) оглавления затираем пустыми значениями
+            previous_length = len(self._index_sheet_rows) if self._index_sheet_rows else 0
+            values = rows + [['', '']] * max(previous_length - len(rows), 0)
+            if self._index_sheet_rows is None:
+                self._execute(self.service.spreadsheets().values().clear(
                     spreadsheetId=self.spreadsheet_id,
-                    range='Лист1!A:K'
-                ).execute()
-                print(f"Удалены все записи активности '{activity_name}' с даты {activity_date}")
-            else:
-                # Записываем оставшиеся данные
-                new_values = [headers] + rows_to_keep
-                self.service.spreadsheets().values().update(
+                    range=f"'{self.index_sheet_title}'!A:B"
+                ), idempotent=True)
+            self._execute(self.service.spreadsheets().values().update(
+                spreadsheetId=self.spreadsheet_id,
+                range=f"'{self.index_sheet_title}'!A1",
+                valueInputOption='RAW',
+                body={'values': values}
+            ), idempotent=True)
+            self._index_sheet_rows = rows
+        except HttpError as error:
+            self._index_sheet_rows = None
+            print(f"Ошибка при обновлении листа {self.index_sheet_title}: {error}")
+
+    def _write_rows(self, sheet_title, new_rows):
+        from .sheets_index import SheetLockTimeout, load_event_index, sheet_lock
+        try:
+            with sheet_lock(sheet_title):
+                if not self._ensure_sheet_index(sheet_title):
+                    return False
+                events = {event_key(row) for row in new_rows}
+                diff = diff_rows(load_event_index(sheet_title, events), new_rows)
+                if diff.is_empty:
+                    return True
+                self._apply_indexed_diff(sheet_title, diff)
+                return True
+        except (HttpError, SheetLockTimeout) as error:
+            print(f"Ошибка при записи данных в {sheet_title}: {error}")
+            return False
+
+    def _apply_indexed_diff(self, sheet_title, diff):
+        """Применяет diff к листу, затем к индексу строк и обновляет окраску"""
+        from .sheets_index import apply_diff_to_index, invalidate_sheet_index
+        try:
+            first_appended_row = self._apply_sheet_diff(sheet_title, diff)
+        except HttpError:
+            # Лист мог измениться частично — индекс перестроится при следующей записи
+            invalidate_sheet_index(sheet_title)
+            raise
+        apply_diff_to_index(sheet_title, diff, first_appended_row)
+        self._colorize_from_index(sheet_title)
+
+    def _ensure_sheet_index(self, sheet_title):
+        """Строит индекс листа, если его ещё нет (единственное чтение листа)"""
+        from .sheets_index import has_sheet_index
+        if has_sheet_index(sheet_title):
+            return True
+        return self.reconcile_sheet_index(sheet_title) is not None
+
+    def reconcile_sheet_index(self, sheet_title='Лист1'):
+        """
+        Сверяет локальный индекс строк с листом и исправляет расхождения.
+        Пустому листу записывается заголовок. Лист с данными, но с другим заголовком
+        (например, переименованной колонкой) не трогается: расхождение пишется в лог.
+        Возвращает счётчики изменений индекса или None при ошибке API или чужом заголовке.
+        """
+        from . import logger
+        from .sheets_index import SheetLockTimeout, invalidate_sheet_index, reconcile_sheet_index, sheet_lock
+        try:
+            with sheet_lock(sheet_title):
+                existing_values = self._read_sheet_values(sheet_title)
+                if existing_values and existing_values[0] != SHEET_HEADERS:
+                    logger.error(
+                        f"Лист '{sheet_title}': заголовок {existing_values[0]} не совпадает с ожидаемым "
+                        f"{SHEET_HEADERS}, сверка и запись в лист пропущены"
+                    )
+                    return None
+                if not existing_values:
+                    # Пустой лист — начинаем его с заголовка
+                    self._execute(self.service.spreadsheets().values().update(
+                        spreadsheetId=self.spreadsheet_id,
+                        range=f"'{sheet_title}'!A1",
+                        valueInputOption="RAW",
+                        body={"values": [SHEET_HEADERS]}
+                    ), idempotent=True)
+                    invalidate_sheet_index(sheet_title)
+                    self._colored_groups.pop(sheet_title, None)
+                    return {'added': 0, 'updated': 0, 'deleted': 0}
+                return reconcile_sheet_index(sheet_title, existing_values[1:])
+        except (HttpError, SheetLockTimeout) as error:
+            print(f"Ошибка при сверке индекса листа {sheet_title}: {error}")
+            return None
+
+    def reconcile_sheet_titles(self):
+        """
+        Листы для периодической сверки индекса: разделы, перечисленные в листе-оглавлении,
+        и Лист1, пока он существует. Ошибка API пробрасывается.
+        """
+        legacy_title = self.sheet_title_prefix + LEGACY_SHEET_TITLE
+        sheet_titles = []
+        if self.partition_period != 'none' and self._get_sheet_id(self.index_sheet_title) is not None:
+            index_data = self._execute(self.service.spreadsheets().values().get(
+                spreadsheetId=self.spreadsheet_id,
+                range=f"'{self.index_sheet_title}'!A2:A"
+            ), 'read')
+            sheet_titles = [str(row[0]) for row in index_data.get('values', []) if row and row[0]]
+        if legacy_title not in sheet_titles and self._get_sheet_id(legacy_title) is not None:
+            sheet_titles.append(legacy_title)
+        return sheet_titles
+
+    def _colorize_from_index(self, sheet_title):
+        """Окраска событий по данным индекса, без чтения листа (внутри batch() — в конце пакета)"""
+        deferred = getattr(self._local, 'deferred', None)
+        if deferred is not None:
+            deferred['colorize'].add(sheet_title)
+            return
+        self._colorize_sheets([sheet_title])
+
+    @staticmethod
+    def _row_from_data(row):
+        """Строка листа из словаря данных участника"""
+        return [
+            row.get('Дата создания', ''),
+            row.get('Активность', ''),
+            row.get('Участник', ''),
+            row.get('Класс', ''),
+            row.get('Уровень', ''),
+            row.get('Время начала', ''),
+            row.get('Время конца', ''),
+            row.get('Расчетное время', ''),
+            row.get('Коэффициент', ''),
+            row.get('Кол-во поинтов', ''),
+            row.get('Доп поинты', ''),
+            float(row.get('Кол-во поинтов', 0)) + float(row.get('Доп поинты', 0)),
+        ]
+
+    def _apply_sheet_diff(self, sheet_title, diff):
+        """
+        Применяет изменения к листу минимальным числом запросов:
+        обновления по номерам строк, затем удаление лишних строк, затем добавление новых в конец.
+        Возвращает номер первой добавленной строки (или None).
+        """
+        if diff.updates:
+            self._execute(self.service.spreadsheets().values().batchUpdate(
+                spreadsheetId=self.spreadsheet_id,
+                body={
+                    'valueInputOption': 'RAW',
+                    'data': build_update_ranges(sheet_title, diff.updates),
+                }
+            ), idempotent=True)
+        if diff.removed:
+            sheet_id = self._get_sheet_id(sheet_title)
+            if sheet_id is not None:
+                self._execute(self.service.spreadsheets().batchUpdate(
                     spreadsheetId=self.spreadsheet_id,
-                    range='Лист1!A1',
-                    valueInputOption="RAW",
-                    body={"values": new_values}
-                ).execute()
-                print(f"Удалены записи активности '{activity_name}' с даты {activity_date}, сохранено {len(rows_to_keep)} других записей")
-            
+                    body={'requests': build_delete_requests(sheet_id, diff.removed)}
+                ))
+        if diff.appends:
+            response = self._execute(self.service.spreadsheets().values().append(
+                spreadsheetId=self.spreadsheet_id,
+                range=f"'{sheet_title}'!A1",
+                valueInputOption='RAW',
+                insertDataOption='INSERT_ROWS',
+                body={'values': diff.appends}
+            ))
+            return parse_first_row(response.get('updates', {}).get('updatedRange', ''))
+        return None
+
+    def _get_sheet_id(self, sheet_title):
+        """Возвращает sheetId листа по названию (кешируется, запрос к API — только при промахе)"""
+        with self._sheet_ids_lock:
+            if sheet_title in self._sheet_ids:
+                return self._sheet_ids[sheet_title]
+        spreadsheet = self._execute(self.service.spreadsheets().get(
+            spreadsheetId=self.spreadsheet_id,
+            fields='sheets.properties'
+        ), 'read')
+        with self._sheet_ids_lock:
+            self._sheet_ids = {
+                sheet['properties']['title']: sheet['properties']['sheetId']
+                for sheet in spreadsheet['sheets']
+            }
+            return self._sheet_ids.get(sheet_title)
+
+    def _forget_sheet(self, sheet_title):
+        """Сбрасывает кеш sheetId и окраски для удалённого листа"""
+        with self._sheet_ids_lock:
+            self._sheet_ids.pop(sheet_title, None)
+        self._colored_groups.pop(sheet_title, None)
+
+    def delete_activity_data(self, activity_history):
+        """
+        Удаляет данные конкретной активности из её листа-раздела и из Лист1, пока выгрузки до разбиения
+        не перенесены в разделы (migrate_legacy_sheet). Строки находятся по индексу SheetRowIndex
+        (индекс Лист1 при первом обращении строится чтением листа) и удаляются объединёнными
+        диапазонами deleteDimension одним batchUpdate — остальные данные листа не переписываются.
+        """
+        event = (activity_history.activity_started_at.strftime('%d.%m.%Y %H:%M:%S'), activity_history.name)
+        sheet_title = self.sheet_title_for(event[0])
+        try:
+            if self._get_sheet_id(sheet_title) is not None:  # Нет листа раздела — нет и строк активности
+                if not self._delete_event_rows(sheet_title, event):
+                    return False
+                print(f"Данные активности '{activity_history.name}' ({event[0]}) удалены из {sheet_title}")
+            if not self._delete_legacy_event_rows({event}, exclude={sheet_title}):
+                return False
+            self._refresh_index_sheet()
             return True
-            
         except HttpError as error:
-            print(f"Ошибка при удалении данных активности из Лист1: {error}")
-            return False 
+            print(f"Ошибка при удалении данных активности из Google Sheets: {error}")
+            return False
+
+    def legacy_sheet_title(self):
+        """
+        Лист1 с выгрузками до разбиения по периодам, пока он не перенесён в разделы; иначе None.
+        Пустой Лист1 (без строк данных) удаляется при первой проверке. Ошибка API пробрасывается.
+        """
+        from .sheets_index import has_sheet_index
+        if self.partition_period == 'none':
+            return None
+        legacy_title = self.sheet_title_prefix + LEGACY_SHEET_TITLE
+        with self._sheet_ids_lock:
+            if self._sheet_ids and legacy_title not in self._sheet_ids:
+                return None
+        if self._get_sheet_id(legacy_title) is None:
+            return None
+        if has_sheet_index(legacy_title) or len(self._read_sheet_values(legacy_title)) > 1:
+            return legacy_title
+        self._remove_sheet(legacy_title)
+        return None
 
-    def _colorize_events_in_sheet1(self, headers, all_rows):
-        """Чередует цвет строк для разных событий активности (название + дата/время)"""
+    def _delete_legacy_event_rows(self, events, exclude=()):
+        """Удаляет строки событий из Лист1, если он ещё не перенесён в разделы; False при ошибке"""
         try:
-            # Получаем sheetId для Лист1
-            spreadsheet = self.service.spreadsheets().get(spreadsheetId=self.spreadsheet_id).execute()
-            sheet_id = None
-            for sheet in spreadsheet['sheets']:
-                if sheet['properties']['title'] == 'Лист1':
-                    sheet_id = sheet['properties']['sheetId']
-                    break
-            if sheet_id is None:
-                return
-            
-            # Находим индексы нужных колонок
-            activity_col_index = None
-            date_col_index = None
-            for i, header in enumerate(headers):
-                if header == 'Активность':
-                    activity_col_index = i
-                elif header == 'Дата создания':
-                    date_col_index = i
-            
-            if activity_col_index is None or date_col_index is None:
-                print("Колонки 'Активность' или 'Дата создания' не найдены")
-                return
-            
-            # Группируем строки по уникальным событиям (название активности + дата/время)
-            event_groups = {}  # {(название_активности, дата_время): [индексы_строк]}
-            for i, row in enumerate(all_rows):
-                if len(row) > max(activity_col_index, date_col_index):
-                    activity_name = row[activity_col_index]
-                    date_time = row[date_col_index]
-                    event_key = (activity_name, date_time)
-                    
-                    if event_key not in event_groups:
-                        event_groups[event_key] = []
-                    event_groups[event_key].append(i)
-            
-            # Цвета для чередования событий
-            colors = [
-                {"red": 1, "green": 0.95, "blue": 0.5},  # банановый
-                {"red": 0.7, "green": 0.9, "blue": 1}    # нежно-голубой
-            ]
-            
-            requests = []
-            color_index = 0
-            
-            # Окрашиваем каждое уникальное событие своим цветом
-            for event_key, row_indices in event_groups.items():
-                activity_name, date_time = event_key
-                color = colors[color_index % 2]
-                
-                for row_idx in row_indices:
-                    # +2 потому что индексация с 1 и есть заголовок
-                    actual_row = row_idx + 2
-                    
-                    requests.append({
-                        "repeatCell": {
-                            "range": {
-                                "sheetId": sheet_id,
-                                "startRowIndex": actual_row - 1,  # Google Sheets использует 0-индексацию
-                                "endRowIndex": actual_row
-                            },
-                            "cell": {"userEnteredFormat": {"backgroundColor": color}},
-                            "fields": "userEnteredFormat.backgroundColor"
-                        }
-                    })
-                
-                color_index += 1
-                print(f"Событие '{activity_name}' от {date_time} окрашено в цвет {color_index % 2 + 1}")
-            
+            legacy_title = self.legacy_sheet_title()
+        except HttpError as error:
+            print(f"Ошибка при проверке листа {LEGACY_SHEET_TITLE}: {error}")
+            return False
+        if legacy_title is None or legacy_title in exclude:
+            return True
+        for event in sorted(events):
+            if not self._delete_event_rows(legacy_title, event):
+                # Лист мог быть удалён другим процессом — при следующей попытке список листов перечитается
+                self._forget_sheet(legacy_title)
+                return False
+        return True
+
+    def migrate_legacy_sheet(self):
+        """
+        Разовый перенос выгрузок до разбиения из Лист1 в листы-разделы. События, которые уже есть
+        в разделе (история сохранена повторно после разбиения), не переносятся — в разделе
+        более свежие строки. Строки с нераспознанной датой остаются в Лист1, иначе Лист1 удаляется.
+        Возвращает {'rows': перенесено строк, 'sheets': [разделы], 'kept': осталось в Лист1}
+        или None при ошибке API или чужом заголовке.
+        """
+        from . import logger
+        from .sheets_index import SheetLockTimeout, load_event_index, sheet_lock
+        report = {'rows': 0, 'sheets': [], 'kept': 0}
+        try:
+            legacy_title = self.legacy_sheet_title()
+            if legacy_title is None:
+                return report
+            with sheet_lock(legacy_title):
+                values = self._read_sheet_values(legacy_title)
+                if values and values[0] != SHEET_HEADERS:
+                    logger.error(
+                        f"Лист '{legacy_title}': заголовок {values[0]} не совпадает с ожидаемым "
+                        f"{SHEET_HEADERS}, перенос в разделы пропущен"
+                    )
+                    return None
+                partitions = self.partition_rows([row for row in values[1:] if row])
+                kept = partitions.pop(legacy_title, [])
+                for sheet_title, rows in sorted(partitions.items()):
+                    if not self._ensure_sheet(sheet_title) or not self._ensure_sheet_index(sheet_title):
+                        return None
+                    present = {key[:2] for key in load_event_index(sheet_title, {event_key(row) for row in rows})}
+                    rows = [row for row in rows if event_key(row) not in present]
+                    if rows and not self._write_rows(sheet_title, rows):
+                        return None
+                    report['rows'] += len(rows)
+                    report['sheets'].append(sheet_title)
+                if kept:
+                    if not self.rebuild_sheet(legacy_title, kept):
+                        return None
+                    report['kept'] = len(kept)
+                else:
+                    self._remove_sheet(legacy_title)
+        except (HttpError, SheetLockTimeout) as error:
+            print(f"Ошибка при переносе листа {LEGACY_SHEET_TITLE} в разделы: {error}")
+            return None
+        self._refresh_index_sheet()
+        return report
+
+    def remove_legacy_sheet(self):
+        """Удаляет Лист1 после полной пересборки выгрузки из БД; False при ошибке API"""
+        try:
+            legacy_title = self.legacy_sheet_title()
+            if legacy_title is not None:
+                self._remove_sheet(legacy_title)
+            return True
+        except HttpError as error:
+            print(f"Ошибка при удалении листа {LEGACY_SHEET_TITLE}: {error}")
+            return False
+
+    def _read_sheet_values(self, sheet_title):
+        """Все значения листа (с заголовком) одним чтением"""
+        return self._execute(self.service.spreadsheets().values().get(
+            spreadsheetId=self.spreadsheet_id,
+            range=f"'{sheet_title}'!A1:L",
+            valueRenderOption='UNFORMATTED_VALUE'
+        ), 'read').get('values', [])
+
+    def _remove_sheet(self, sheet_title):
+        """Удаляет лист вместе с его индексом строк; ошибка API пробрасывается"""
+        from .sheets_index import invalidate_sheet_index
+        sheet_id = self._get_sheet_id(sheet_title)
+        if sheet_id is None:
+            return
+        # Последний лист таблицы удалить нельзя — оглавление остаётся в ней в любом случае
+        self._ensure_sheet(self.index_sheet_title)
+        self._execute(self.service.spreadsheets().batchUpdate(
+            spreadsheetId=self.spreadsheet_id,
+            body={'requests': [{'deleteSheet': {'sheetId': sheet_id}}]}
+        ))
+        invalidate_sheet_index(sheet_title)
+        self._forget_sheet(sheet_title)
+        print(f"Удалён лист '{sheet_title}'")
+
+    def _delete_event_rows(self, sheet_title, event):
+        from .sheets_index import SheetLockTimeout, load_event_index, sheet_lock
+        try:
+            with sheet_lock(sheet_title):
+                if not self._ensure_sheet_index(sheet_title):
+                    return False
+                existing = load_event_index(sheet_title, {event})
+                if not existing:
+                    return True  # Строк этой активности в листе нет
+                diff = SheetDiff([], [], sorted(row_number for row_number, _ in existing.values()))
+                self._apply_indexed_diff(sheet_title, diff)
+                return True
+        except (HttpError, SheetLockTimeout) as error:
+            print(f"Ошибка при удалении строк активности из {sheet_title}: {error}")
+            return False
+
+    def _colorize_sheets(self, sheet_titles):
+        """Окраска событий нескольких листов по данным индекса одним batchUpdate"""
+        from .sheets_index import load_event_rows
+        requests = []
+        new_groups = {}
+        try:
+            for sheet_title in sheet_titles:
+                sheet_requests, groups = self._color_requests(SHEET_HEADERS, load_event_rows(sheet_title), sheet_title)
+                if groups is None:
+                    continue
+                requests.extend(sheet_requests)
+                new_groups[sheet_title] = groups
             if requests:
-                self.service.spreadsheets().batchUpdate(
+                self._execute(self.service.spreadsheets().batchUpdate(
                     spreadsheetId=self.spreadsheet_id,
                     body={"requests": requests}
-                ).execute()
-                print(f"Окрашено {len(requests)} строк для {len(event_groups)} уникальных событий")
-                
+                ), idempotent=True)
+                print(f"Перекрашено {len(requests)} групп строк в {len(new_groups)} лист(ах)")
+            for sheet_title, groups in new_groups.items():
+                self._colored_groups[sheet_title] = set(groups)
         except Exception as e:
-            print(f"Ошибка при окрашивании строк: {e}") 
\ No newline at end of file
+            for sheet_title in sheet_titles:
+                self._colored_groups.pop(sheet_title, None)
+            print(f"Ошибка при окрашивании строк: {e}")
+
+    def _color_requests(self, headers, all_rows, sheet_title='Лист1'):
+        """
+        Чередует цвет строк для разных событий активности (название + дата/время).
+        Соседние строки одного события окрашиваются одним диапазоном; в запросы попадают
+        только группы, границы или цвет которых изменились с прошлой окраски.
+        Возвращает (запросы repeatCell, все группы листа) или ([], None), если лист не найден.
+        """
+        sheet_id = self._get_sheet_id(sheet_title)
+        if sheet_id is None:
+            return [], None
+
+        # Находим индексы нужных колонок
+        if 'Активность' not in headers or 'Дата создания' not in headers:
+            print("Колонки 'Активность' или 'Дата создания' не найдены")
+            return [], None
+        activity_col_index = headers.index('Активность')
+        date_col_index = headers.index('Дата создания')
+
+        groups = build_color_groups(all_rows, activity_col_index, date_col_index)
+        previous = self._colored_groups.get(sheet_title, set())
+        requests = [
+            {
+                "repeatCell": {
+                    "range": {
+                        "sheetId": sheet_id,
+                        "startRowIndex": start - 1,  # Google Sheets использует 0-индексацию
+                        "endRowIndex": end
+                    },
+                    "cell": {"userEnteredFormat": {"backgroundColor": EVENT_COLORS[color_index]}},
+                    "fields": "userEnteredFormat.backgroundColor"
+                }
+            }
+            for start, end, color_index in groups
+            if (start, end, color_index) not in previous
+        ]
+        return requests, groups
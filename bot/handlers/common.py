@@ -1,6 +1,7 @@
 import json
 import random
 from datetime import timedelta
+from django.db import transaction
 from django.utils import timezone
 from bot import bot
 from django.conf import settings
@@ -11,6 +12,9 @@ from telebot.types import (
     CallbackQuery,
 )
 from bot.models import Player, GameClass, PlayerClass, Activity, ActivityParticipant
+from bot.caching import FAMILY_ACTIVITIES, FAMILY_PROFILE_TEXT, cached, get_player_profile, invalidate
+from bot.activity_registry import activity_registry, get_activity
+from bot.class_catalog import game_class_catalog, get_player_classes
 from bot.keyboards import PROFILE_BUTTONS
 from .registration import start_registration
 from functools import wraps
@@ -64,67 +68,82 @@ def only_our_player(func):
     @wraps(func)
     def wrapper(call, *args, **kwargs):
         user_id = str(call.from_user.id)
-        try:
-            player = Player.objects.get(telegram_id=user_id)
-            if not player.is_our_player:
-                bot.send_message(user_id, 'Доступ запрещён. Вы не являетесь нашим игроком.')
-                return
-        except Player.DoesNotExist:
+        player = get_player_profile(user_id)
+        if player is None:
             bot.send_message(user_id, 'Вы не зарегистрированы. Используйте /start.')
             return
+        if not player['is_our_player']:
+            bot.send_message(user_id, 'Доступ запрещён. Вы не являетесь нашим игроком.')
+            return
         return func(call, *args, **kwargs)
     return wrapper
 
 
-@only_our_player
-def profile(call: CallbackQuery):
-    user_id = str(call.from_user.id)
-    try:
-        player = Player.objects.get(telegram_id=user_id)
-        # Профиль
-        user_info = (
-            f"👤 *Информация о пользователе*\n\n"
-            f"Игровой никнейм: {player.game_nickname}\n"
-            f"Telegram: @{player.tg_name}\n"
-            f"Статус: {'Администратор' if player.is_admin else 'Игрок'}\n"
-            f"Дата регистрации: {player.created_at.strftime('%d.%m.%Y')}\n\n"
-        )
-        player_classes = player.get_available_classes()
-        if player_classes:
-            user_info += "*Ваши классы:*\n"
-            for class_info in player_classes:
-                user_info += (
-                    f"• {class_info['class_name']} (Уровень {class_info['level']})\n"
-                )
-        else:
-            user_info += "У вас пока нет классов\n"
-        selected_class = player.get_selected_class()
-        if selected_class:
-            user_info += f"\n*Текущий выбранный класс:*\n"
+def render_profile_text(player):
+    """Текст профиля (Markdown) из кешированного профиля игрока (get_player_profile)"""
+    user_info = (
+        f"👤 *Информация о пользователе*\n\n"
+        f"Игровой никнейм: {player['game_nickname']}\n"
+        f"Telegram: @{player['tg_name']}\n"
+        f"Статус: {'Администратор' if player['is_admin'] else 'Игрок'}\n"
+        f"Дата регистрации: {player['created_at'].strftime('%d.%m.%Y')}\n\n"
+    )
+    if player['classes']:
+        user_info += "*Ваши классы:*\n"
+        for class_info in player['classes']:
             user_info += (
-                f"• {selected_class['class_name']} (Уровень {selected_class['level']})\n"
+                f"• {class_info['class_name']} (Уровень {class_info['level']})\n"
             )
-        msg = bot.send_message(
-            chat_id=user_id,
-            text=user_info,
-            parse_mode='Markdown',
-            reply_markup=PROFILE_BUTTONS
+    else:
+        user_info += "У вас пока нет классов\n"
+    selected_class = player['selected_class']
+    if selected_class:
+        user_info += f"\n*Текущий выбранный класс:*\n"
+        user_info += (
+            f"• {selected_class['class_name']} (Уровень {selected_class['level']})\n"
         )
-    except Player.DoesNotExist:
+    return user_info
+
+
+def get_profile_text(telegram_id):
+    """
+    Готовый текст профиля из кеша (сбрасывается сигналами Player/PlayerClass/GameClass).
+    None — игрок не зарегистрирован.
+    """
+    def load():
+        player = get_player_profile(telegram_id)
+        return render_profile_text(player) if player else None
+    return cached(FAMILY_PROFILE_TEXT, str(telegram_id), load)
+
+
+@only_our_player
+def profile(call: CallbackQuery):
+    user_id = str(call.from_user.id)
+    user_info = get_profile_text(user_id)
+    if user_info is None:
         bot.send_message(
             chat_id=user_id,
             text="Вы еще не зарегистрированы. Используйте команду /start для регистрации."
         )
+        return
+    msg = bot.send_message(
+        chat_id=user_id,
+        text=user_info,
+        parse_mode='Markdown',
+        reply_markup=PROFILE_BUTTONS
+    )
 
 def show_classes(call: CallbackQuery, page: int = 1):
     """Показать список всех доступных классов с пагинацией (только те, что есть у игрока)"""
     user_id = str(call.from_user.id)
     message_id = call.message.message_id
     try:
-        player = Player.objects.get(telegram_id=user_id)
-        player_classes = player.player_classes.select_related('game_class').all()
+        # Список классов игрока из кеша: страница — срез списка, без запросов к БД
+        player_classes = get_player_classes(user_id)
+        if player_classes is None:
+            raise Player.DoesNotExist
         classes_per_page = 4
-        total_classes = player_classes.count()
+        total_classes = len(player_classes)
         total_pages = (total_classes + classes_per_page - 1) // classes_per_page
         start_idx = (page - 1) * classes_per_page
         end_idx = start_idx + classes_per_page
@@ -133,8 +152,8 @@ def show_classes(call: CallbackQuery, page: int = 1):
         for pc in current_page_classes:
             keyboard.add(
                 InlineKeyboardButton(
-                    text=pc.game_class.name,
-                    callback_data=f"select_class_{pc.game_class.id}"
+                    text=pc['class_name'],
+                    callback_data=f"select_class_{pc['game_class_id']}"
                 )
             )
         nav_buttons = []
@@ -197,11 +216,12 @@ def changeLvlClassMarkup(call: CallbackQuery, page: int = 1):
     user_id = str(call.from_user.id)
     message_id = call.message.message_id
     try:
-        player = Player.objects.get(telegram_id=user_id)
-        # Получаем только PlayerClass игрока
-        player_classes = player.player_classes.select_related('game_class').all()
+        # Классы игрока из кеша: страница — срез списка, без запросов к БД
+        player_classes = get_player_classes(user_id)
+        if player_classes is None:
+            raise Player.DoesNotExist
         classes_per_page = 4
-        total_classes = player_classes.count()
+        total_classes = len(player_classes)
         total_pages = (total_classes + classes_per_page - 1) // classes_per_page
         start_idx = (page - 1) * classes_per_page
         end_idx = start_idx + classes_per_page
@@ -210,8 +230,8 @@ def changeLvlClassMarkup(call: CallbackQuery, page: int = 1):
         for pc in current_page_classes:
             keyboard.add(
                 InlineKeyboardButton(
-                    text=pc.game_class.name,
-                    callback_data=f"change_lvl_{pc.game_class.id}"
+                    text=pc['class_name'],
+                    callback_data=f"change_lvl_{pc['game_class_id']}"
                 )
             )
         nav_buttons = []
@@ -277,12 +297,14 @@ def handle_change_level(call: CallbackQuery):
         # Получаем ID выбранного класса из callback_data
         class_id = int(call.data.split('_')[2])
         
-        # Получаем пользователя и игрока
-        player = Player.objects.get(telegram_id=str(call.from_user.id))
-        
-        # Получаем выбранный класс
-        game_class = GameClass.objects.get(id=class_id)
-        player_class = PlayerClass.objects.get(player=player, game_class=game_class)
+        # Классы игрока из кеша и название из каталога классов
+        player_classes = get_player_classes(user_id)
+        if player_classes is None:
+            raise Player.DoesNotExist
+        class_name = game_class_catalog.name(class_id)
+        player_class = next((pc for pc in player_classes if pc['game_class_id'] == class_id), None)
+        if player_class is None:
+            raise PlayerClass.DoesNotExist(f'У игрока нет класса {class_id}')
         
         # Создаем клавиатуру для возврата
         keyboard = InlineKeyboardMarkup()
@@ -292,7 +314,7 @@ def handle_change_level(call: CallbackQuery):
         bot.edit_message_text(
             chat_id=user_id,
             message_id=message_id,
-            text=f"Текущий уровень класса {game_class.name}: {player_class.level}\n"
+            text=f"Текущий уровень класса {class_name}: {player_class['level']}\n"
                  f"Введите новый уровень (целое число):",
             reply_markup=keyboard
         )
@@ -340,12 +362,12 @@ def process_new_level(message: Message, class_id: int):
             )
             return
         
-        # Получаем пользователя и игрока
-        player = Player.objects.get(telegram_id=str(message.from_user.id))
-        
-        # Получаем класс игрока
-        game_class = GameClass.objects.get(id=class_id)
-        player_class = PlayerClass.objects.get(player=player, game_class=game_class)
+        # Игрок из кеша профилей, название класса из каталога; из БД читается только изменяемый класс
+        profile = get_player_profile(user_id)
+        if profile is None:
+            raise Player.DoesNotExist
+        class_name = game_class_catalog.name(class_id)
+        player_class = PlayerClass.objects.get(player_id=profile['id'], game_class_id=class_id)
         
         # Обновляем уровень
         player_class.level = new_level
@@ -354,7 +376,7 @@ def process_new_level(message: Message, class_id: int):
         # Отправляем сообщение об успешном обновлении
         bot.send_message(
             chat_id=user_id,
-            text=f"Уровень класса {game_class.name} успешно изменен на {new_level}",
+            text=f"Уровень класса {class_name} успешно изменен на {new_level}",
             reply_markup=InlineKeyboardMarkup().add(
                 InlineKeyboardButton(text="◀️ Назад в профиль", callback_data="profile")
             )
@@ -386,32 +408,11 @@ def cancel_level_change(call: CallbackQuery):
         # Сбрасываем обработчик следующего шага
         bot.clear_step_handler(call.message)
         
-        # Получаем игрока
-        player = Player.objects.get(telegram_id=user_id)
-        
-        # Формируем информацию профиля
-        user_info = (
-            f"👤 *Информация о пользователе*\n\n"
-            f"Игровой никнейм: {player.game_nickname}\n"
-            f"Telegram: @{player.tg_name}\n"
-            f"Статус: {'Администратор' if player.is_admin else 'Игрок'}\n"
-            f"Дата регистрации: {player.created_at.strftime('%d.%m.%Y')}\n\n"
-        )
-        player_classes = player.get_available_classes()
-        if player_classes:
-            user_info += "*Ваши классы:*\n"
-            for class_info in player_classes:
-                user_info += (
-                    f"• {class_info['class_name']} (Уровень {class_info['level']})\n"
-                )
-        else:
-            user_info += "У вас пока нет классов\n"
-        selected_class = player.get_selected_class()
-        if selected_class:
-            user_info += f"\n*Текущий выбранный класс:*\n"
-            user_info += (
-                f"• {selected_class['class_name']} (Уровень {selected_class['level']})\n"
-            )
+        # Профиль игрока и его текст — из кеша
+        player = get_player_profile(user_id)
+        if player is None:
+            raise Player.DoesNotExist
+        user_info = get_profile_text(user_id)
         
         # Обновляем сообщение на профиль
         bot.edit_message_text(
@@ -423,7 +424,9 @@ def cancel_level_change(call: CallbackQuery):
         )
         
         # Показываем активности с новой логикой
-        participations = ActivityParticipant.objects.filter(player=player).select_related('activity', 'player_class').order_by('-joined_at')
+        participations = ActivityParticipant.objects.filter(player_id=player['id']).select_related(
+            'activity', 'player_class__game_class'
+        ).order_by('-joined_at')
         
         # Показываем каждое участие отдельно
         for part in participations:
@@ -494,11 +497,11 @@ def cancel_level_change(call: CallbackQuery):
                     )
         
         # Показываем доступные активности (все активные активности)
-        for activity in Activity.objects.filter(is_active=True):
+        for activity in activity_registry.all():
             text = (
                 f"⚪ *Доступная активность*\n"
                 f"{activity.name}\n"
-                f"Доступно классов для участия: {player.player_classes.count()}"
+                f"Доступно классов для участия: {len(player['classes'])}"
             )
             keyboard = InlineKeyboardMarkup()
             keyboard.add(InlineKeyboardButton("🟢 Принять участие", callback_data=f"join_activity_{activity.id}"))
@@ -536,7 +539,7 @@ def handle_join_activity(call: CallbackQuery, page: int = 1):
         player = Player.objects.get(telegram_id=str(call.from_user.id))
         
         # Получаем активность
-        activity = Activity.objects.get(id=activity_id)
+        activity = get_activity(activity_id)
         
         # Проверяем, активна ли активность
         if not activity.is_active:
@@ -677,7 +680,7 @@ def cancel_activity_join(call: CallbackQuery):
         activity_id = int(call.data.split('_')[2])
         
         # Получаем активность
-        activity = Activity.objects.get(id=activity_id)
+        activity = get_activity(activity_id)
         
         bot.edit_message_text(
             chat_id=user_id,
@@ -783,7 +786,7 @@ def handle_select_activity_class(call: CallbackQuery):
         activity_id = int(parts[3])
         player_class_id = int(parts[4])
         player = Player.objects.get(telegram_id=str(call.from_user.id))
-        activity = Activity.objects.get(id=activity_id)
+        activity = get_activity(activity_id)
         
         if not activity.is_active:
             bot.edit_message_text(
@@ -811,11 +814,27 @@ def handle_select_activity_class(call: CallbackQuery):
             )
             return
             
-        participation = ActivityParticipant.objects.create(
-            activity=activity,
-            player=player,
-            player_class=player_class
-        )
+        with transaction.atomic():
+            # Реестр активностей в этом воркере может отставать (например, при кеше locmem):
+            # перед записью статус проверяется по БД под блокировкой строки активности
+            is_active = Activity.objects.select_for_update().filter(pk=activity_id).values_list(
+                'is_active', flat=True
+            ).first()
+            if is_active:
+                participation = ActivityParticipant.objects.create(
+                    activity=activity,
+                    player=player,
+                    player_class=player_class
+                )
+        if not is_active:
+            # Сброс кеша активностей: реестр перечитает список из БД при следующем обращении
+            invalidate(FAMILY_ACTIVITIES)
+            bot.edit_message_text(
+                chat_id=user_id,
+                message_id=message_id,
+                text="Эта активность в данный момент неактивна."
+            )
+            return
 
         # Получаем все активные участия в этой активности для этого игрока
         active_participations = ActivityParticipant.objects.filter(
@@ -912,7 +931,7 @@ def handle_select_activity_class(call: CallbackQuery):
 def show_active_activity_message(user_id):
     try:
         player = Player.objects.get(telegram_id=str(user_id))
-        activity = Activity.objects.filter(is_active=True).order_by('-created_at').first()
+        activity = activity_registry.latest()
         if not activity:
             if user_id in user_active_activity_message:
                 try:
@@ -967,8 +986,10 @@ def handle_join_activity(call: CallbackQuery, page: int = 1):
     message_id = call.message.message_id
     try:
         activity_id = int(call.data.split('_')[2])
-        player = Player.objects.get(telegram_id=user_id)
-        activity = Activity.objects.get(id=activity_id)
+        profile = get_player_profile(user_id)
+        if profile is None:
+            raise Player.DoesNotExist
+        activity = get_activity(activity_id)
         
         if not activity.is_active:
             bot.edit_message_text(
@@ -978,20 +999,20 @@ def handle_join_activity(call: CallbackQuery, page: int = 1):
             )
             return
             
-        # Получаем все PlayerClass игрока
-        all_player_classes = list(player.player_classes.select_related('game_class').all())
+        # Все классы игрока — из кеша списка классов
+        all_player_classes = get_player_classes(user_id)
         
         # Получаем классы, которые уже активно участвуют в этой активности
         active_class_ids = set(
             ActivityParticipant.objects.filter(
                 activity=activity,
-                player=player,
+                player_id=profile['id'],
                 completed_at__isnull=True
             ).values_list('player_class_id', flat=True)
         )
         
         # Оставляем только те классы, которые не участвуют активно
-        available_player_classes = [pc for pc in all_player_classes if pc.id not in active_class_ids]
+        available_player_classes = [pc for pc in all_player_classes if pc['id'] not in active_class_ids]
         
         if not available_player_classes:
             bot.edit_message_text(
@@ -1012,8 +1033,8 @@ def handle_join_activity(call: CallbackQuery, page: int = 1):
         for pc in current_page_classes:
             keyboard.add(
                 InlineKeyboardButton(
-                    text=f"{pc.game_class.name} (Уровень {pc.level})",
-                    callback_data=f"select_activity_class_{activity_id}_{pc.id}"
+                    text=f"{pc['class_name']} (Уровень {pc['level']})",
+                    callback_data=f"select_activity_class_{activity_id}_{pc['id']}"
                 )
             )
             
@@ -1076,7 +1097,7 @@ def handle_leave_activity_button(call):
         parts = call.data.split('_')
         activity_id = int(parts[2])
         player_class_id = int(parts[3])
-        activity = Activity.objects.get(id=activity_id)
+        activity = get_activity(activity_id)
         
         # Находим конкретное участие, которое нужно завершить
         participation = ActivityParticipant.objects.filter(
@@ -1346,7 +1367,7 @@ def update_activity_stats(call: CallbackQuery):
         activity_id = int(parts[2])
         
         player = Player.objects.get(telegram_id=user_id)
-        activity = Activity.objects.get(id=activity_id)
+        activity = get_activity(activity_id)
         
         # Получаем все активные участия
         active_participations = ActivityParticipant.objects.filter(
@@ -1,9 +1,13 @@
 from bot.models import Player, GameClass, PlayerClass
+from bot.caching import get_player_profile
+from bot.state_storage import state_storage
 from bot import bot
 from django.conf import settings
 from telebot.types import Message, CallbackQuery
 
-registration_states = {}
+def _registration_key(telegram_id):
+    # Данные регистрации хранятся в state_storage, чтобы шаги могли выполняться в разных воркерах
+    return f'registration:{telegram_id}'
 
 def start_registration(message: Message):
     """
@@ -12,17 +16,17 @@ def start_registration(message: Message):
     try:
         from bot.handlers.common import profile
         telegram_id = str(message.from_user.id)
-        # Проверяем, существует ли игрок
-        player = Player.objects.filter(telegram_id=telegram_id).first()
+        # Проверяем, существует ли игрок (профиль из кеша)
+        player = get_player_profile(telegram_id)
         if player:
-            if player.is_our_player:
+            if player['is_our_player']:
                 # Показываем только профиль
                 fake_call = type('FakeCall', (), {'from_user': message.from_user, 'message': message})
                 profile(fake_call)
             else:
                 bot.send_message(message.chat.id, 'Доступ запрещён. Вы не являетесь нашим игроком.')
             return
-        registration_states[telegram_id] = {}
+        state_storage.set(_registration_key(telegram_id), {})
         bot.send_message(message.chat.id, "Введите ваш игровой никнейм:")
         bot.register_next_step_handler(message, process_nickname_step)
     except Exception as e:
@@ -34,15 +38,18 @@ def start_registration(message: Message):
 
 def process_name_step(message: Message):
     telegram_id = str(message.from_user.id)
-    registration_states[telegram_id]['user_name'] = message.text.strip()
+    state = state_storage.get(_registration_key(telegram_id)) or {}
+    state['user_name'] = message.text.strip()
+    state_storage.set(_registration_key(telegram_id), state)
     bot.send_message(message.chat.id, "Введите ваш игровой никнейм:")
     bot.register_next_step_handler(message, process_nickname_step)
 
 def process_nickname_step(message: Message):
     telegram_id = str(message.from_user.id)
-    registration_states[telegram_id]['game_nickname'] = message.text.strip()
+    state = state_storage.get(_registration_key(telegram_id)) or {}
+    state['game_nickname'] = message.text.strip()
     tg_name = message.from_user.username or "none"
-    game_nickname = registration_states[telegram_id]['game_nickname']
+    game_nickname = state['game_nickname']
     from django.conf import settings
     # Создаём Player
     player = Player.objects.create(
@@ -52,7 +59,7 @@ def process_nickname_step(message: Message):
         is_admin=telegram_id in settings.OWNER_ID
     )
     # sync_player_classes(player)  # Удалено, теперь классы назначаются только админом
-    registration_states.pop(telegram_id, None)
+    state_storage.delete(_registration_key(telegram_id))
     from bot.handlers.common import profile
     fake_call = type('FakeCall', (), {'from_user': message.from_user, 'message': message})
     profile(fake_call)
@@ -0,0 +1,109 @@
+import csv
+import tempfile
+from datetime import datetime
+
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+from openpyxl import Workbook
+
+from .models import ActivityHistoryParticipant
+
+# Колонки выгрузки: (заголовок, поле ActivityHistoryParticipant для values_list)
+EXPORT_COLUMNS = [
+    ('Активность', 'activity_history__name'),
+    ('Начало активности', 'activity_history__activity_started_at'),
+    ('Конец активности', 'activity_history__activity_ended_at'),
+    ('Участник', 'player_game_nickname'),
+    ('Telegram', 'player_tg_name'),
+    ('Класс', 'class_name'),
+    ('Уровень', 'class_level'),
+    ('Время присоединения', 'joined_at'),
+    ('Время завершения', 'completed_at'),
+    ('Баллы', 'points_earned'),
+    ('Доп баллы', 'additional_points'),
+]
+EXPORT_HEADERS = [header for header, _ in EXPORT_COLUMNS] + ['Баллы итого']
+# Размер пачки серверного курсора: память не зависит от количества строк
+EXPORT_CHUNK_SIZE = 2000
+DATETIME_FORMAT = '%d.%m.%Y %H:%M:%S'
+
+
+def history_participants_queryset(histories=None, date_from=None, date_to=None):
+    """
+    Участники историй для выгрузки: по выбранным историям (queryset или список id)
+    и/или по дате начала активности (date_from/date_to включительно).
+    """
+    queryset = ActivityHistoryParticipant.objects.all()
+    if histories is not None:
+        queryset = queryset.filter(activity_history__in=histories)
+    if date_from:
+        queryset = queryset.filter(activity_history__activity_started_at__date__gte=date_from)
+    if date_to:
+        queryset = queryset.filter(activity_history__activity_started_at__date__lte=date_to)
+    return queryset.order_by('activity_history__activity_started_at', 'activity_history_id', 'joined_at', 'id')
+
+
+def iter_export_rows(queryset):
+    """Строки выгрузки (даты в локальном времени без tzinfo) через курсор values_list().iterator()"""
+    values = queryset.values_list(*[field for _, field in EXPORT_COLUMNS]).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    for row in values:
+        row = [
+            timezone.localtime(value).replace(tzinfo=None) if isinstance(value, datetime) else value
+            for value in row
+        ]
+        row.append((row[-2] or 0) + (row[-1] or 0))
+        yield row
+
+
+class _Echo:
+    """Псевдофайл для csv.writer: возвращает записанную строку вместо буферизации"""
+
+    def write(self, value):
+        return value
+
+
+def _iter_csv(rows):
+    writer = csv.writer(_Echo(), delimiter=';')
+    # BOM, чтобы Excel открыл файл в UTF-8
+    yield '\ufeff' + writer.writerow(EXPORT_HEADERS)
+    for row in rows:
+        yield writer.writerow([
+            value.strftime(DATETIME_FORMAT) if isinstance(value, datetime) else ('' if value is None else value)
+            for value in row
+        ])
+
+
+def csv_response(queryset, filename):
+    """Потоковая CSV-выгрузка: ответ начинает отдаваться сразу, строки читаются пачками"""
+    response = StreamingHttpResponse(_iter_csv(iter_export_rows(queryset)), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+    return response
+
+
+def xlsx_response(queryset, filename):
+    """
+    XLSX-выгрузка в режиме write-only openpyxl: строки пишутся на диск по мере чтения курсора,
+    готовый файл отдаётся потоком из временного файла.
+    """
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet('История')
+    worksheet.append(EXPORT_HEADERS)
+    for row in iter_export_rows(queryset):
+        worksheet.append(row)
+    output = tempfile.TemporaryFile()
+    workbook.save(output)
+    output.seek(0)
+    return FileResponse(
+        output,
+        as_attachment=True,
+        filename=f'{filename}.xlsx',
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    )
+
+
+def export_response(queryset, export_format='csv'):
+    """Ответ с выгрузкой участников историй в формате csv или xlsx"""
+    filename = f"activity_history_{timezone.localtime():%Y%m%d_%H%M%S}"
+    if export_format == 'xlsx':
+        return xlsx_response(queryset, filename)
+    return csv_response(queryset, filename)
@@ -0,0 +1,158 @@
+import time
+
+from django.core.cache import cache
+
+from .caching import FAMILY_LIVE_STATS, cache_key, cached, get_active_activities, get_class_coefficients, invalidate
+from .models import ActivityParticipant
+
+# Срок блокировки сводки активности на время её правки (секунды)
+UPDATE_LOCK_TIMEOUT = 5
+
+
+def participant_coefficient(base_coefficient, ignore_odds, class_coefficients, class_name, class_level):
+    """Коэффициент участника, как в ActivityParticipant.calculate_points, без запросов к БД"""
+    if ignore_odds or class_level is None:
+        return base_coefficient
+    for coefficient_class, min_level, max_level, coefficient in class_coefficients:
+        if coefficient_class == class_name and min_level <= class_level <= max_level:
+            return base_coefficient * coefficient
+    return base_coefficient
+
+
+class _ClassTotals:
+    """Накопленные суммы по одному классу активности"""
+    __slots__ = ('active', 'joined_sum', 'coefficient_sum', 'coefficient_joined_sum', 'closed_seconds', 'closed_points')
+
+    def __init__(self):
+        self.active = 0
+        self.joined_sum = 0.0
+        self.coefficient_sum = 0.0
+        self.coefficient_joined_sum = 0.0
+        self.closed_seconds = 0.0
+        self.closed_points = 0.0
+
+
+class LiveActivityStats:
+    """
+    Сводка по идущим активностям: участники сейчас, разбивка по классам, накопленное время
+    и прогноз баллов. Сводка каждой активности хранится в общем кеше Django (семейство
+    live_stats, по id активности), поэтому все воркеры админки и процесс бота видят одни
+    и те же цифры. Вход, выход и удаление участника правят сводку после коммита, и опрос
+    панели при попадании в кеш не делает запросов к БД. Если сводку поправить не удалось
+    (её нет в кеше или её в этот момент правит другой процесс), она сбрасывается и при
+    следующем опросе пересчитывается из БД — как и после смены настроек или коэффициентов.
+    """
+
+    def _load(self, activity):
+        """Сводка одной активности из БД: участники — один запрос, коэффициенты — из кеша"""
+        state = {
+            'base_coefficient': activity['base_coefficient'],
+            'ignore_odds': activity['ignore_odds'],
+            'coefficients': get_class_coefficients(activity['id']),
+            'participants': {},
+            'classes': {},
+        }
+        participants = ActivityParticipant.objects.filter(activity_id=activity['id']).values_list(
+            'pk', 'class_name', 'class_level', 'joined_at', 'completed_at'
+        )
+        for pk, class_name, class_level, joined_at, completed_at in participants:
+            self._set_participant(state, pk, class_name, class_level, joined_at, completed_at)
+        return state
+
+    @staticmethod
+    def _apply(state, record, sign):
+        class_name, joined, completed, coefficient = record
+        totals = state['classes'].setdefault(class_name, _ClassTotals())
+        if completed is None:
+            totals.active += sign
+            totals.joined_sum += sign * joined
+            totals.coefficient_sum += sign * coefficient
+            totals.coefficient_joined_sum += sign * coefficient * joined
+        else:
+            totals.closed_seconds += sign * (completed - joined)
+            totals.closed_points += sign * coefficient * (completed - joined)
+
+    def _set_participant(self, state, pk, class_name, class_level, joined_at, completed_at):
+        previous = state['participants'].get(pk)
+        if previous is not None:
+            self._apply(state, previous, -1)
+        record = (
+            class_name or '—',
+            joined_at.timestamp(),
+            completed_at.timestamp() if completed_at else None,
+            participant_coefficient(
+                state['base_coefficient'], state['ignore_odds'], state['coefficients'], class_name, class_level
+            ),
+        )
+        state['participants'][pk] = record
+        self._apply(state, record, 1)
+
+    def _remove_participant(self, state, pk):
+        record = state['participants'].pop(pk, None)
+        if record is not None:
+            self._apply(state, record, -1)
+
+    def _update(self, activity_id, change):
+        """Правит сводку активности в кеше под короткой блокировкой (cache.add), иначе сбрасывает её"""
+        key = cache_key(FAMILY_LIVE_STATS, activity_id)
+        lock_key = f'{key}:lock'
+        if cache.add(lock_key, 1, UPDATE_LOCK_TIMEOUT):
+            try:
+                state = cache.get(key)
+                if state is not None:
+                    change(state)
+                    cache.set(key, state, None)
+                    return
+            finally:
+                cache.delete(lock_key)
+        invalidate(FAMILY_LIVE_STATS, activity_id)
+
+    def participant_saved(self, participant):
+        """Вход (создание участия) или выход (completed_at) участника"""
+        self._update(participant.activity_id, lambda state: self._set_participant(
+            state, participant.pk, participant.class_name, participant.class_level,
+            participant.joined_at, participant.completed_at
+        ))
+
+    def participant_deleted(self, activity_id, participant_id):
+        """Участие удалено"""
+        self._update(activity_id, lambda state: self._remove_participant(state, participant_id))
+
+    def invalidate(self, activity_id):
+        """Сводка активности пересчитается из БД при следующем опросе (смена статуса, коэффициентов)"""
+        invalidate(FAMILY_LIVE_STATS, activity_id)
+
+    def snapshot(self):
+        """Сводка по активным активностям; запросы к БД — только для сводок, которых нет в кеше"""
+        now = time.time()
+        result = []
+        activities = sorted(get_active_activities(), key=lambda item: item['activated_at'] or item['created_at'])
+        for activity in activities:
+            state = cached(FAMILY_LIVE_STATS, activity['id'], lambda: self._load(activity))
+            classes = []
+            for class_name, totals in sorted(state['classes'].items()):
+                seconds = totals.closed_seconds + totals.active * now - totals.joined_sum
+                points = totals.closed_points + totals.coefficient_sum * now - totals.coefficient_joined_sum
+                if not totals.active and round(seconds) == 0:
+                    continue
+                classes.append({
+                    'class_name': class_name,
+                    'active': totals.active,
+                    'seconds': round(seconds),
+                    'projected_points': round(points, 2),
+                })
+            activated_at = activity['activated_at'] or activity['created_at']
+            result.append({
+                'id': activity['id'],
+                'name': activity['name'],
+                'activated_at': activated_at.isoformat() if activated_at else None,
+                'active': sum(item['active'] for item in classes),
+                'participations': len(state['participants']),
+                'seconds': sum(item['seconds'] for item in classes),
+                'projected_points': round(sum(item['projected_points'] for item in classes), 2),
+                'classes': classes,
+            })
+        return {'generated_at': now, 'activities': result}
+
+
+live_stats = LiveActivityStats()
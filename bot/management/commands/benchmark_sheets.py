@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+from googleapiclient.discovery import build
+
+from bot import google_sheets
+from bot.google_sheets import GoogleSheetsManager, get_sheets_manager
+
+
+class Command(BaseCommand):
+    help = 'Замер стоимости создания клиента Google Sheets'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20, help='Количество повторов каждого замера')
+
+    def _measure(self, label, func, iterations):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        elapsed = (time.perf_counter() - started) / iterations
+        self.stdout.write(f"{label}: {elapsed * 1000:.2f} мс")
+        return elapsed
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        manager = get_sheets_manager()
+
+        self.stdout.write(f"Создание клиента ({iterations} повторов):")
+        self._measure(
+            'build() с разбором discovery-документа',
+            lambda: build('sheets', 'v4', credentials=manager.creds, static_discovery=True),
+            iterations
+        )
+
+        def fresh_manager():
+            google_sheets._discovery_doc = None
+            GoogleSheetsManager()
+        self._measure('GoogleSheetsManager() без кеша документа', fresh_manager, iterations)
+        self._measure('GoogleSheetsManager() с кешем документа', GoogleSheetsManager, iterations)
+        self._measure('get_sheets_manager()', get_sheets_manager, iterations)
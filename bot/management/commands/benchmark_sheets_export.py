@@ -0,0 +1,120 @@
+import contextlib
+import io
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from bot.google_sheets import SHEET_HEADERS, GoogleSheetsManager
+from bot.models import ActivityHistory
+from bot.sheets_fake import FakeSheetsService
+from bot.sheets_partitions import PARTITION_PERIODS
+from bot.sheets_quota import QuotaGovernor
+
+# Префикс листов и записей индекса строк замера: замер не читает и не блокирует индекс листов выгрузки
+BENCH_SHEET_PREFIX = 'bench-'
+
+
+class Command(BaseCommand):
+    help = (
+        'Замер экспорта в Google Sheets на офлайн-замене API (FakeSheetsService) при растущем размере листа. '
+        'Листы и индекс строк замера имеют префикс bench-, изменения индекса откатываются после замера.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='100,1000,5000', help='Размеры листа (строк) через запятую')
+        parser.add_argument('--event-rows', type=int, default=30, help='Строк (участников) в одном событии')
+        parser.add_argument('--latency', type=float, default=0.0, help='Имитируемая задержка одного запроса, сек')
+        parser.add_argument(
+            '--period', choices=PARTITION_PERIODS, default='month',
+            help='Разбиение по листам (none — всё в Лист1, как до разбиения)'
+        )
+
+    @staticmethod
+    def _event_data(event_number, rows_count, points=10):
+        """Данные участников одного события (по событию в день)"""
+        started_at = datetime(2025, 1, 1, 10, 0, 0) + timedelta(days=event_number)
+        return [
+            {
+                'Дата создания': started_at.strftime('%d.%m.%Y %H:%M:%S'),
+                'Активность': f'Событие {event_number}',
+                'Участник': f'Игрок {i}',
+                'Класс': 'Класс',
+                'Уровень': 1,
+                'Время начала': started_at.strftime('%H:%M:%S'),
+                'Время конца': (started_at + timedelta(hours=1)).strftime('%H:%M:%S'),
+                'Расчетное время': '1ч 0м 0с',
+                'Коэффициент': 1.0,
+                'Кол-во поинтов': points,
+                'Доп поинты': 0,
+            }
+            for i in range(rows_count)
+        ]
+
+    def _measure(self, service, func):
+        """Выполняет операцию (вывод менеджера подавляется) и возвращает время и статистику запросов"""
+        service.stats.reset()
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            func()
+        elapsed = time.perf_counter() - started
+        return elapsed, service.stats.as_dict()
+
+    def _report(self, size, label, elapsed, stats):
+        self.stdout.write(
+            f"{size:>7} | {label:<28} | {elapsed * 1000:>9.1f} мс | {stats['total_requests']:>4} запр. | "
+            f"{stats['cells_sent']:>7} / {stats['cells_received']:>7} яч. | "
+            f"{stats['bytes_sent']:>9} / {stats['bytes_received']:>9} байт"
+        )
+
+    def _benchmark_size(self, size, event_rows, latency, period):
+        service = FakeSheetsService(latency=latency, sheet_titles=())
+        # Квота фейкового API не ограничена, чтобы замер не включал ожидание бюджета
+        quota = QuotaGovernor(read_limit=10 ** 9, write_limit=10 ** 9)
+        manager = GoogleSheetsManager(
+            service=service, partition_period=period, quota=quota, sheet_title_prefix=BENCH_SHEET_PREFIX
+        )
+
+        # Заполняем листы разделов напрямую, минуя API, чтобы не учитывать подготовку
+        events_count = max(size // event_rows, 1)
+        rows = []
+        for event_number in range(events_count):
+            rows.extend(GoogleSheetsManager._row_from_data(row) for row in self._event_data(event_number, event_rows))
+        partitions = manager.partition_rows(rows)
+        for sheet_title, partition_rows in partitions.items():
+            service.add_sheet(sheet_title)
+            service.write_range(f"'{sheet_title}'!A1", [list(SHEET_HEADERS)] + partition_rows)
+
+        new_event = self._event_data(events_count, event_rows)
+        edited_event = self._event_data(events_count, event_rows, points=20)
+        removed_event = ActivityHistory(
+            name=f'Событие {events_count // 2}',
+            activity_started_at=datetime(2025, 1, 1, 10, 0, 0) + timedelta(days=events_count // 2),
+        )
+
+        def build_indexes():
+            for sheet_title in partitions:
+                manager.reconcile_sheet_index(sheet_title)
+
+        steps = [
+            (f'индекс {len(partitions)} лист(ов)', build_indexes),
+            ('новое событие', lambda: manager.write_activity_data_partitioned(new_event)),
+            ('повторный экспорт без правок', lambda: manager.write_activity_data_partitioned(new_event)),
+            ('правка всех строк события', lambda: manager.write_activity_data_partitioned(edited_event)),
+            ('удаление события', lambda: manager.delete_activity_data(removed_event)),
+        ]
+        for label, func in steps:
+            elapsed, stats = self._measure(service, func)
+            self._report(size, label, elapsed, stats)
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',') if size.strip()]
+        self.stdout.write(
+            f"{'Строк':>7} | {'Операция':<28} | {'Время':>12} | {'Запросы':>10} | "
+            f"{'Ячеек отпр./получ.':>19} | {'Байт отпр./получ.':>24}"
+        )
+        for size in sizes:
+            with transaction.atomic():
+                self._benchmark_size(size, options['event_rows'], options['latency'], options['period'])
+                transaction.set_rollback(True)
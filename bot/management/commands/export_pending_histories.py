@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from bot.export_scheduler import export_scheduler
+from bot.models import ActivityHistory
+
+
+class Command(BaseCommand):
+    help = 'Экспорт в Google Sheets историй активностей, которые ещё не выгружены (is_exported=False)'
+
+    def handle(self, *args, **options):
+        history_ids = list(
+            ActivityHistory.objects.filter(is_exported=False).order_by('activity_started_at').values_list('pk', flat=True)
+        )
+        exported = export_scheduler.export_many(history_ids)
+        self.stdout.write(f"Экспортировано историй: {exported} из {len(history_ids)}")
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from bot.bulk_import import ImportFileError, import_roster
+
+
+class Command(BaseCommand):
+    help = (
+        'Импорт состава гильдии из CSV/XLSX (никнейм, Telegram ID, класс, уровень, Telegram имя): '
+        'игроки и их классы добавляются или обновляются пакетно'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу .csv или .xlsx')
+        parser.add_argument('--our-players', action='store_true', help='Отметить импортированных игроков как наших')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], 'rb') as uploaded_file:
+                report = import_roster(uploaded_file, mark_our_players=options['our_players'])
+        except (OSError, ImportFileError) as e:
+            raise CommandError(str(e))
+        for error in report['errors']:
+            self.stderr.write(error)
+        self.stdout.write(
+            f"Строк: {report['rows']}. Игроки: добавлено {report['players_inserted']}, "
+            f"обновлено {report['players_updated']}. Классы: добавлено {report['classes_inserted']}, "
+            f"обновлено {report['classes_updated']}. Ошибок: {len(report['errors'])}. "
+            f"Время: {report['seconds']:.2f} с"
+        )
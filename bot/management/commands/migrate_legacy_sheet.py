@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from bot.google_sheets import get_sheets_manager
+
+
+class Command(BaseCommand):
+    help = 'Разовый перенос выгрузок до разбиения по периодам из Лист1 в листы-разделы'
+
+    def handle(self, *args, **options):
+        report = get_sheets_manager().migrate_legacy_sheet()
+        if report is None:
+            raise CommandError('Не удалось перенести Лист1 в разделы')
+        self.stdout.write(
+            f"Перенесено строк: {report['rows']} в листы {', '.join(report['sheets']) or '—'}; "
+            f"осталось в Лист1 (дата не распознана): {report['kept']}"
+        )
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from bot.sheets_rebuild import REBUILD_CHUNK_ROWS, RebuildInProgress, rebuild_export
+
+
+class Command(BaseCommand):
+    help = 'Полная пересборка выгрузки в Google Sheets из БД за один проход'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--partition', action='append', dest='partitions',
+            help='Пересобрать только указанный лист-раздел (можно указать несколько раз)'
+        )
+        parser.add_argument('--chunk-rows', type=int, default=REBUILD_CHUNK_ROWS, help='Строк в одном values.update')
+
+    def handle(self, *args, **options):
+        try:
+            report = rebuild_export(partitions=options['partitions'], chunk_rows=options['chunk_rows'])
+        except RebuildInProgress as error:
+            raise CommandError(str(error))
+        self.stdout.write(
+            f"Пересобрано листов: {len(report['sheets'])}, историй: {report['histories']}, строк: {report['rows']}, "
+            f"запросов к API: {report['requests']}, время: {report['seconds']:.1f} с "
+            f"({report['rows_per_second']:.0f} строк/с)"
+        )
+        if report['failed_sheets']:
+            raise CommandError(f"Не удалось пересобрать листы: {', '.join(report['failed_sheets'])}")
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from googleapiclient.errors import HttpError
+
+from bot.google_sheets import get_sheets_manager
+
+
+class Command(BaseCommand):
+    help = 'Сверка локального индекса строк (SheetRowIndex) с листами Google Sheets'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sheet', action='append', dest='sheets',
+            help='Название листа (можно несколько раз); по умолчанию — все разделы из листа-оглавления и Лист1'
+        )
+
+    def handle(self, *args, **options):
+        manager = get_sheets_manager()
+        sheet_titles = options['sheets']
+        if not sheet_titles:
+            try:
+                sheet_titles = manager.reconcile_sheet_titles()
+            except HttpError as error:
+                raise CommandError(f'Не удалось прочитать список разделов: {error}')
+        failed = []
+        for sheet_title in sheet_titles:
+            result = manager.reconcile_sheet_index(sheet_title)
+            if result is None:
+                failed.append(sheet_title)
+                continue
+            self.stdout.write(
+                f"Лист '{sheet_title}': добавлено {result['added']}, обновлено {result['updated']}, "
+                f"удалено {result['deleted']} записей индекса"
+            )
+        if failed:
+            raise CommandError(f"Не удалось сверить индекс листов: {', '.join(failed)}")
@@ -1,6 +1,7 @@
 from django.db import models
 from django.utils import timezone
 from django.db.models.signals import post_save, pre_save, post_delete
+from django.core.signals import request_started
 from django.dispatch import receiver
 from bot import bot
 from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
@@ -9,7 +10,7 @@ import json
 from datetime import datetime
 import os
 from django.conf import settings
-from .google_sheets import GoogleSheetsManager
+from .google_sheets import get_sheets_manager
 from collections import defaultdict
 
 def export_activity_participants_to_google_sheets(activity):
@@ -82,15 +83,15 @@ def export_activity_participants_to_google_sheets(activity):
                 'Доп поинты': values['additional_points'],
                 'Поинты итого': values['points_earned'] + values['additional_points'],
             })
-        sheets_manager = GoogleSheetsManager()
-        success = sheets_manager.write_activity_data_to_sheet1(data)
-        if success:
+        sheets_manager = get_sheets_manager()
+        sheet_titles = sheets_manager.write_activity_data_partitioned(data)
+        if sheet_titles:
             delete_completion_messages_for_all_users(activity.id)
             delete_activity_messages_for_all_users(activity.id)
-            print(f"Данные активности '{activity.name}' успешно экспортированы в Google Sheets (Лист1)")
+            print(f"Данные активности '{activity.name}' успешно экспортированы в Google Sheets ({', '.join(sheet_titles)})")
             return {
                 'url': sheets_manager.get_spreadsheet_url(),
-                'sheet_title': 'Лист1'
+                'sheet_title': ', '.join(sheet_titles)
             }
         return None
     except Exception as e:
@@ -196,7 +197,7 @@ class Player(models.Model):
         return [{
             'class_name': pc.game_class.name,
             'level': pc.level
-        } for pc in self.player_classes.all()]
+        } for pc in self.player_classes.select_related('game_class')]
 
     def add_activity_message(self, activity_id, message_id):
         """Добавить ID сообщения об активности"""
@@ -356,14 +357,13 @@ class ActivityParticipant(models.Model):
             duration = (self.completed_at - self.joined_at).total_seconds()
             # Используем сохраненные данные класса для расчета баллов
             if not self.activity.ignore_odds:
-                class_coefficient = self.activity.class_level_coefficients.filter(
-                    game_class__name=self.class_name,
-                    min_level__lte=self.class_level,
-                    max_level__gte=self.class_level
-                ).first()
-                coefficient = self.activity.base_coefficient
-                if class_coefficient:
-                    coefficient *= class_coefficient.coefficient
+                # Таблица коэффициентов активности берётся из кеша (сбрасывается сигналами)
+                from .caching import get_class_coefficients
+                from .live_stats import participant_coefficient
+                coefficient = participant_coefficient(
+                    self.activity.base_coefficient, False, get_class_coefficients(self.activity_id),
+                    self.class_name, self.class_level
+                )
             else:
                 coefficient = self.activity.base_coefficient
             self.points_earned = round(coefficient * duration, 2)
@@ -384,6 +384,10 @@ class ActivityParticipant(models.Model):
     class Meta:
         verbose_name = 'Участник активности'
         verbose_name_plural = 'Участники активности'
+        indexes = [
+            # Постраничный просмотр участников в админке (ключ страницы — joined_at, id)
+            models.Index(fields=['activity', 'joined_at', 'id']),
+        ]
 
     def __str__(self):
         return f"{self.player_game_nickname} - {self.activity.name}"
@@ -425,6 +429,12 @@ class ActivityHistory(models.Model):
         default=False,
         verbose_name='Экспортировано в Google Sheets'
     )
+    export_hash = models.CharField(
+        max_length=40,
+        blank=True,
+        default='',
+        verbose_name='Хеш выгруженных данных'
+    )
 
     def __str__(self):
         return f"{self.name} ({self.activity_started_at.strftime('%d.%m.%Y %H:%M')})"
@@ -508,6 +518,9 @@ class ActivityHistoryParticipant(models.Model):
     class Meta:
         verbose_name = 'Участник истории активности'
         verbose_name_plural = 'Участники истории активности'
+        indexes = [
+            models.Index(fields=['activity_history', 'joined_at', 'id']),
+        ]
 
 @receiver(post_save, sender=Activity)
 def notify_users_about_activity(sender, instance, created, **kwargs):
@@ -621,9 +634,10 @@ def handle_activity_status_change(sender, instance, **kwargs):
                             print(f"Ошибка при обработке игрока {player.game_nickname}: {str(e)}")
                 # СНАЧАЛА УДАЛЯЕМ СООБЩЕНИЯ
                 delete_activity_messages()
+                history_record = None
                 try:
                     # СНАЧАЛА СОЗДАЁМ ЗАПИСЬ В ИСТОРИИ (и обновляем participation)
-                    create_activity_history_record(instance)
+                    history_record = create_activity_history_record(instance)
                     from bot.handlers.common import send_full_participation_stats
                     # --- Новое: рассылка только общей статистики одним сообщением ---
                     all_players = Player.objects.filter(is_our_player=True)
@@ -633,7 +647,9 @@ def handle_activity_status_change(sender, instance, **kwargs):
                             send_full_participation_stats(player, instance, with_delete_button=True)
                 except Exception as e:
                     print(f"Ошибка при создании записи истории: {str(e)}")
-                ActivityParticipant.objects.filter(activity=instance).delete()
+                # Участия удаляются в фоне пачками, после проверки записи истории
+                from .purge import schedule_participants_purge
+                schedule_participants_purge(instance, history_record)
         except Activity.DoesNotExist:
             pass
 
@@ -710,87 +726,120 @@ def create_activity_history_record(activity):
                 class_level=values['class_level']
             )
         print(f"Создана запись истории для активности {activity.name}")
-        # Автоматически экспортируем в Google Sheets
-        from .models import export_activity_history_to_google_sheets
-        export_activity_history_to_google_sheets(history_record)
+        # Автоматически экспортируем в Google Sheets (в фоне, одним экспортом)
+        from .export_scheduler import schedule_export
+        schedule_export(history_record)
+        return history_record
     except Exception as e:
         print(f"Ошибка при создании записи истории: {str(e)}")
+        return None
+
+def load_class_coefficients(activity_ids):
+    """Коэффициенты классов активностей {id_активности: [(класс, мин. уровень, макс. уровень, коэффициент)]} одним запросом"""
+    coefficients = defaultdict(list)
+    entries = ActivityClassLevelCoefficient.objects.filter(activity_id__in=activity_ids).order_by('pk').values_list(
+        'activity_id', 'game_class__name', 'min_level', 'max_level', 'coefficient'
+    )
+    for activity_id, class_name, min_level, max_level, coefficient in entries:
+        coefficients[activity_id].append((class_name, min_level, max_level, coefficient))
+    return coefficients
+
+
+def build_activity_history_export_data(activity_history, participants, class_coefficients=()):
+    """
+    Строки выгрузки истории активности (агрегация по игроку+класс+уровень) без запросов к БД.
+    class_coefficients — коэффициенты классов исходной активности из load_class_coefficients.
+    """
+    grouped = defaultdict(lambda: {
+        'points_earned': 0,
+        'additional_points': 0,
+        'duration': 0,
+        'first_joined_at': None,
+        'last_completed_at': None,
+        'player_game_nickname': '',
+        'player_tg_name': '',
+        'class_name': '',
+        'class_level': 0,
+    })
+    for participant in participants:
+        key = (participant.player_game_nickname, participant.class_name, participant.class_level)
+        grouped[key]['points_earned'] += participant.points_earned or 0
+        grouped[key]['additional_points'] += participant.additional_points or 0
+        duration = (participant.completed_at - participant.joined_at).total_seconds()
+        grouped[key]['duration'] += duration
+        if not grouped[key]['first_joined_at'] or participant.joined_at < grouped[key]['first_joined_at']:
+            grouped[key]['first_joined_at'] = participant.joined_at
+        if not grouped[key]['last_completed_at'] or participant.completed_at > grouped[key]['last_completed_at']:
+            grouped[key]['last_completed_at'] = participant.completed_at
+        grouped[key]['player_game_nickname'] = participant.player_game_nickname
+        grouped[key]['player_tg_name'] = participant.player_tg_name
+        grouped[key]['class_name'] = participant.class_name
+        grouped[key]['class_level'] = participant.class_level
+    data = []
+    for (nickname, class_name, class_level), values in grouped.items():
+        hours = int(values['duration'] // 3600)
+        minutes = int((values['duration'] % 3600) // 60)
+        seconds = int(values['duration'] % 60)
+        total_coefficient = activity_history.base_coefficient
+        if not activity_history.ignore_odds:
+            # Первое подходящее условие (в порядке создания), как и при выборке .first()
+            for coefficient_class, min_level, max_level, coefficient in class_coefficients:
+                if coefficient_class == class_name and min_level <= class_level <= max_level:
+                    total_coefficient *= coefficient
+                    break
+        data.append({
+            'Дата создания': activity_history.activity_started_at.strftime('%d.%m.%Y %H:%M:%S'),
+            'Активность': activity_history.name,
+            'Участник': nickname,
+            'Telegram': values['player_tg_name'],
+            'Класс': class_name,
+            'Уровень': class_level,
+            'Время начала': values['first_joined_at'].strftime('%H:%M:%S') if values['first_joined_at'] else '',
+            'Время конца': values['last_completed_at'].strftime('%H:%M:%S') if values['last_completed_at'] else '',
+            'Расчетное время': f"{hours}ч {minutes}м {seconds}с",
+            'Коэффициент': round(total_coefficient, 2),
+            'Кол-во поинтов': values['points_earned'],
+            'Доп поинты': values['additional_points'],
+            'Поинты итого': values['points_earned'] + values['additional_points'],
+        })
+    return data
+
 
 def export_activity_history_to_google_sheets(activity_history):
     """
     Экспорт данных участников истории активности в Google таблицу в один лист (агрегация по игроку+класс+уровень)
     """
     try:
-        participants = ActivityHistoryParticipant.objects.filter(
+        participants = list(ActivityHistoryParticipant.objects.filter(
             activity_history=activity_history
-        )
-        if not participants.exists():
+        ))
+        if not participants:
             return None
-        grouped = defaultdict(lambda: {
-            'points_earned': 0,
-            'additional_points': 0,
-            'duration': 0,
-            'first_joined_at': None,
-            'last_completed_at': None,
-            'player_game_nickname': '',
-            'player_tg_name': '',
-            'class_name': '',
-            'class_level': 0,
-        })
-        for participant in participants:
-            key = (participant.player_game_nickname, participant.class_name, participant.class_level)
-            grouped[key]['points_earned'] += participant.points_earned or 0
-            grouped[key]['additional_points'] += participant.additional_points or 0
-            duration = (participant.completed_at - participant.joined_at).total_seconds()
-            grouped[key]['duration'] += duration
-            if not grouped[key]['first_joined_at'] or participant.joined_at < grouped[key]['first_joined_at']:
-                grouped[key]['first_joined_at'] = participant.joined_at
-            if not grouped[key]['last_completed_at'] or participant.completed_at > grouped[key]['last_completed_at']:
-                grouped[key]['last_completed_at'] = participant.completed_at
-            grouped[key]['player_game_nickname'] = participant.player_game_nickname
-            grouped[key]['player_tg_name'] = participant.player_tg_name
-            grouped[key]['class_name'] = participant.class_name
-            grouped[key]['class_level'] = participant.class_level
-        data = []
-        for (nickname, class_name, class_level), values in grouped.items():
-            hours = int(values['duration'] // 3600)
-            minutes = int((values['duration'] % 3600) // 60)
-            seconds = int(values['duration'] % 60)
-            total_coefficient = activity_history.base_coefficient
-            if not activity_history.ignore_odds:
-                if activity_history.original_activity:
-                    class_coefficient = activity_history.original_activity.class_level_coefficients.filter(
-                        game_class__name=class_name,
-                        min_level__lte=class_level,
-                        max_level__gte=class_level
-                    ).first()
-                    if class_coefficient:
-                        total_coefficient *= class_coefficient.coefficient
-            data.append({
-                'Дата создания': activity_history.activity_started_at.strftime('%d.%m.%Y %H:%M:%S'),
-                'Активность': activity_history.name,
-                'Участник': nickname,
-                'Telegram': values['player_tg_name'],
-                'Класс': class_name,
-                'Уровень': class_level,
-                'Время начала': values['first_joined_at'].strftime('%H:%M:%S') if values['first_joined_at'] else '',
-                'Время конца': values['last_completed_at'].strftime('%H:%M:%S') if values['last_completed_at'] else '',
-                'Расчетное время': f"{hours}ч {minutes}м {seconds}с",
-                'Коэффициент': round(total_coefficient, 2),
-                'Кол-во поинтов': values['points_earned'],
-                'Доп поинты': values['additional_points'],
-                'Поинты итого': values['points_earned'] + values['additional_points'],
-            })
-        from .google_sheets import GoogleSheetsManager
-        sheets_manager = GoogleSheetsManager()
-        success = sheets_manager.write_activity_data_to_sheet1(data)
-        if success:
+        class_coefficients = ()
+        if not activity_history.ignore_odds and activity_history.original_activity_id:
+            class_coefficients = load_class_coefficients([activity_history.original_activity_id])[
+                activity_history.original_activity_id
+            ]
+        data = build_activity_history_export_data(activity_history, participants, class_coefficients)
+        sheets_manager = get_sheets_manager()
+        # Набор строк не изменился с прошлой выгрузки и все строки на месте — к API не обращаемся
+        export_hash = sheets_manager.export_digest(data)
+        if export_hash == activity_history.export_hash and sheets_manager.has_exported_rows(data):
+            print(f"Данные активности '{activity_history.name}' не изменились, экспорт пропущен")
+            return {
+                'url': sheets_manager.get_spreadsheet_url(),
+                'sheet_title': ', '.join(sheets_manager.partition_titles(data))
+            }
+        sheet_titles = sheets_manager.write_activity_data_partitioned(data)
+        if sheet_titles:
+            ActivityHistory.objects.filter(pk=activity_history.pk).update(export_hash=export_hash)
+            activity_history.export_hash = export_hash
             if activity_history.original_activity:
                 delete_activity_messages_for_all_users(activity_history.original_activity.id)
-            print(f"Данные активности '{activity_history.name}' успешно экспортированы в Google Sheets (Лист1)")
+            print(f"Данные активности '{activity_history.name}' успешно экспортированы в Google Sheets ({', '.join(sheet_titles)})")
             return {
                 'url': sheets_manager.get_spreadsheet_url(),
-                'sheet_title': 'Лист1'
+                'sheet_title': ', '.join(sheet_titles)
             }
         return None
     except Exception as e:
@@ -827,19 +876,57 @@ class ActivityClassLevelCoefficient(models.Model):
     def __str__(self):
         return f"{self.activity.name} | {self.game_class.name}: {self.min_level}-{self.max_level} -> {self.coefficient}"
 
+class SheetRowIndex(models.Model):
+    """Индекс строк экспортированного листа Google Sheets: ключ строки -> номер строки и хеш содержимого"""
+    sheet_title = models.CharField(max_length=100, default='Лист1', verbose_name='Лист')
+    created_date = models.CharField(max_length=32, verbose_name='Дата создания')
+    activity_name = models.CharField(max_length=100, verbose_name='Активность')
+    participant = models.CharField(max_length=50, verbose_name='Участник')
+    class_name = models.CharField(max_length=50, verbose_name='Класс')
+    start_time = models.CharField(max_length=16, verbose_name='Время начала')
+    row_number = models.IntegerField(verbose_name='Номер строки')
+    content_hash = models.CharField(max_length=40, verbose_name='Хеш содержимого')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Строка листа Google Sheets'
+        verbose_name_plural = 'Индекс строк Google Sheets'
+        unique_together = ['sheet_title', 'created_date', 'activity_name', 'participant', 'class_name', 'start_time']
+        indexes = [
+            models.Index(fields=['sheet_title', 'row_number']),
+        ]
+
+    @property
+    def key(self):
+        return (self.created_date, self.activity_name, self.participant, self.class_name, self.start_time)
+
+    def __str__(self):
+        return f"{self.sheet_title}!{self.row_number}: {self.participant} ({self.activity_name})"
+
+
+class SheetLock(models.Model):
+    """
+    Аренда листа Google Sheets: запись в лист и в его индекс строк выполняется владельцем аренды,
+    чтобы экспорт, удаление и пересборка не перемешивали номера строк. Аренда берётся короткой
+    транзакцией и истекает сама, если владелец завершился, не освободив лист
+    """
+    sheet_title = models.CharField(max_length=100, unique=True, verbose_name='Лист')
+    owner = models.CharField(max_length=100, blank=True, default='', verbose_name='Владелец аренды')
+    expires_at = models.DateTimeField(null=True, blank=True, verbose_name='Аренда действует до')
+
+    class Meta:
+        verbose_name = 'Блокировка листа Google Sheets'
+        verbose_name_plural = 'Блокировки листов Google Sheets'
+
+    def __str__(self):
+        return self.sheet_title
+
 # Сигнал для автоматического копирования коэффициентов при создании активности
 @receiver(post_save, sender=Activity)
 def create_activity_class_level_coefficients(sender, instance, created, **kwargs):
     if created:
-        for game_class in GameClass.objects.all():
-            for cond in game_class.base_coefficient_conditions.all():
-                ActivityClassLevelCoefficient.objects.create(
-                    activity=instance,
-                    game_class=game_class,
-                    min_level=cond.min_level,
-                    max_level=cond.max_level,
-                    coefficient=cond.coefficient
-                )
+        from .coefficients import apply_coefficient_template
+        apply_coefficient_template(instance)
     
 def delete_activity_messages_for_all_users(activity_id):
     """Удалить сообщения об активности у всех пользователей"""
@@ -876,11 +963,11 @@ def delete_completion_messages_for_all_users(activity_id):
 def delete_activity_history_from_google_sheets(activity_history):
     """Удаление данных активности из Google Sheets"""
     try:
-        # Создаем экземпляр Google Sheets Manager
-        sheets_manager = GoogleSheetsManager()
+        # Общий для процесса Google Sheets Manager
+        sheets_manager = get_sheets_manager()
         
-        # Удаляем данные активности из Лист1
-        success = sheets_manager.delete_activity_data_from_sheet1(activity_history)
+        # Удаляем данные активности из её листа-раздела
+        success = sheets_manager.delete_activity_data(activity_history)
         
         return success
         
@@ -955,14 +1042,14 @@ def export_active_activity_to_google_sheets(activity):
                 'Доп поинты': values['additional_points'],
                 'Активность': activity.name
             })
-        sheets_manager = GoogleSheetsManager()
-        success = sheets_manager.write_activity_data_to_sheet1(data)
-        if success:
+        sheets_manager = get_sheets_manager()
+        sheet_titles = sheets_manager.write_activity_data_partitioned(data)
+        if sheet_titles:
             delete_activity_messages_for_all_users(activity.id)
-            print(f"Данные активности '{activity.name}' успешно экспортированы в Google Sheets (Лист1)")
+            print(f"Данные активности '{activity.name}' успешно экспортированы в Google Sheets ({', '.join(sheet_titles)})")
             return {
                 'url': sheets_manager.get_spreadsheet_url(),
-                'sheet_title': 'Лист1'
+                'sheet_title': ', '.join(sheet_titles)
             }
         return None
     except Exception as e:
@@ -971,14 +1058,111 @@ def export_active_activity_to_google_sheets(activity):
     
 @receiver(post_save, sender=ActivityHistory)
 def export_activity_history_on_save(sender, instance, **kwargs):
-    from .models import export_activity_history_to_google_sheets
-    export_activity_history_to_google_sheets(instance)
+    from .export_scheduler import schedule_export
+    schedule_export(instance)
 
 @receiver(post_save, sender=ActivityHistoryParticipant)
 def export_activity_history_participant_on_save(sender, instance, **kwargs):
-    from .models import export_activity_history_to_google_sheets
-    export_activity_history_to_google_sheets(instance.activity_history)
+    from .export_scheduler import schedule_export
+    schedule_export(instance.activity_history_id)
 
 @receiver(post_delete, sender=GameClass)
 def delete_player_classes_on_gameclass_delete(sender, instance, **kwargs):
-    PlayerClass.objects.filter(game_class=instance).delete()  
\ No newline at end of file
+    PlayerClass.objects.filter(game_class=instance).delete()  
+
+@receiver(post_save, sender=ActivityParticipant)
+def update_live_stats_on_participant_save(sender, instance, **kwargs):
+    """Вход/выход участника отражается в сводке панели после коммита"""
+    from django.db import transaction
+    from .live_stats import live_stats
+    transaction.on_commit(lambda: live_stats.participant_saved(instance))
+
+@receiver(post_delete, sender=ActivityParticipant)
+def update_live_stats_on_participant_delete(sender, instance, **kwargs):
+    """Удалённое участие убирается из сводки панели после коммита"""
+    from django.db import transaction
+    from .live_stats import live_stats
+    activity_id, participant_id = instance.activity_id, instance.pk
+    transaction.on_commit(lambda: live_stats.participant_deleted(activity_id, participant_id))
+
+@receiver(post_save, sender=Activity)
+def invalidate_live_stats_on_activity_save(sender, instance, **kwargs):
+    from django.db import transaction
+    from .live_stats import live_stats
+    transaction.on_commit(lambda: live_stats.invalidate(instance.pk))
+
+@receiver(post_save, sender=ActivityClassLevelCoefficient)
+@receiver(post_delete, sender=ActivityClassLevelCoefficient)
+def invalidate_live_stats_on_coefficient_change(sender, instance, **kwargs):
+    from django.db import transaction
+    from .live_stats import live_stats
+    transaction.on_commit(lambda: live_stats.invalidate(instance.activity_id))
+
+@receiver(pre_save, sender=Player)
+def remember_player_telegram_id(sender, instance, update_fields=None, **kwargs):
+    # Прежний telegram_id нужен, чтобы после смены id сбросить кеш и под старым ключом
+    if instance.pk and (update_fields is None or 'telegram_id' in update_fields):
+        instance._previous_telegram_id = Player.objects.filter(pk=instance.pk).values_list(
+            'telegram_id', flat=True
+        ).first()
+
+@receiver(post_save, sender=Player)
+@receiver(post_delete, sender=Player)
+def invalidate_player_cache(sender, instance, **kwargs):
+    from .caching import invalidate_player
+    invalidate_player(instance.telegram_id)
+    previous = instance.__dict__.pop('_previous_telegram_id', None)
+    if previous is not None and previous != instance.telegram_id:
+        invalidate_player(previous)
+
+@receiver(post_save, sender=PlayerClass)
+@receiver(post_delete, sender=PlayerClass)
+def invalidate_player_cache_on_class_change(sender, instance, **kwargs):
+    from .caching import invalidate_player
+    telegram_id = Player.objects.filter(pk=instance.player_id).values_list('telegram_id', flat=True).first()
+    if telegram_id is not None:
+        invalidate_player(telegram_id)
+
+@receiver(post_save, sender=GameClass)
+@receiver(post_delete, sender=GameClass)
+def invalidate_game_class_cache(sender, instance, **kwargs):
+    # Название класса входит в профили игроков и таблицы коэффициентов
+    from .caching import FAMILY_CLASSES, FAMILY_COEFFICIENTS, invalidate, invalidate_player
+    for family in (FAMILY_CLASSES, FAMILY_COEFFICIENTS):
+        invalidate(family)
+    invalidate_player()
+
+@receiver(post_save, sender=Activity)
+@receiver(post_delete, sender=Activity)
+def invalidate_activity_cache(sender, instance, **kwargs):
+    from .caching import FAMILY_ACTIVITIES, FAMILY_COEFFICIENTS, invalidate
+    invalidate(FAMILY_ACTIVITIES)
+    invalidate(FAMILY_COEFFICIENTS, instance.pk)
+
+@receiver(post_save, sender=ActivityClassLevelCoefficient)
+@receiver(post_delete, sender=ActivityClassLevelCoefficient)
+def invalidate_coefficient_cache(sender, instance, **kwargs):
+    from .caching import FAMILY_COEFFICIENTS, invalidate
+    invalidate(FAMILY_COEFFICIENTS, instance.activity_id)
+
+@receiver(post_save, sender=Activity)
+def update_activity_registry_on_save(sender, instance, **kwargs):
+    from django.db import transaction
+    from .activity_registry import activity_registry
+    transaction.on_commit(lambda: activity_registry.activity_saved(instance))
+
+@receiver(post_delete, sender=Activity)
+def update_activity_registry_on_delete(sender, instance, **kwargs):
+    from django.db import transaction
+    from .activity_registry import activity_registry
+    activity_id = instance.pk
+    transaction.on_commit(lambda: activity_registry.activity_deleted(activity_id))
+
+@receiver(request_started)
+def warm_activity_registry(sender, **kwargs):
+    """Прогрев реестра активных активностей на первом запросе воркера"""
+    from .activity_registry import activity_registry
+    try:
+        activity_registry.warm_if_needed()
+    except Exception as e:
+        print(f"Ошибка при прогреве реестра активностей: {e}")
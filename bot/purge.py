@@ -0,0 +1,111 @@
+import threading
+import time
+
+from django.db import connection, transaction
+from django.db.models import Max
+
+from .models import ActivityHistory, ActivityParticipant
+
+# Размер пачки удаления и пауза между пачками (чтобы не держать долгие блокировки на MySQL)
+PURGE_BATCH_SIZE = 500
+PURGE_BATCH_PAUSE = 0.05
+# Повторные проверки истории перед очисткой: число попыток и задержка перед первым повтором (удваивается)
+PURGE_VERIFY_ATTEMPTS = 4
+PURGE_VERIFY_DELAY = 15.0
+
+
+def verify_history_for_purge(activity_id, history_id, max_pk):
+    """Проверяет, что история активности создана и участники перенесены в неё"""
+    if not history_id:
+        return False
+    try:
+        history = ActivityHistory.objects.get(pk=history_id, original_activity_id=activity_id)
+    except ActivityHistory.DoesNotExist:
+        return False
+    has_participants = ActivityParticipant.objects.filter(activity_id=activity_id, pk__lte=max_pk).exists()
+    return not has_participants or history.participants.exists()
+
+
+def wait_for_history(activity_id, history_id, max_pk, attempts=PURGE_VERIFY_ATTEMPTS, delay=PURGE_VERIFY_DELAY):
+    """
+    Проверка истории с повторами (перенос участников мог ещё не завершиться).
+    Если проверка так и не прошла, участия сохраняются, а в лог бота пишется ошибка:
+    удалять можно только то, что уже есть в истории.
+    """
+    from . import logger
+    for attempt in range(attempts):
+        if verify_history_for_purge(activity_id, history_id, max_pk):
+            return True
+        if attempt < attempts - 1:
+            time.sleep(delay * 2 ** attempt)
+    logger.error(
+        f"Очистка участников активности {activity_id} пропущена: перенос в историю {history_id} не подтверждён "
+        f"после {attempts} проверок, участия с pk <= {max_pk} сохранены"
+    )
+    return False
+
+
+def purge_activity_participants(activity_id, history_id, max_pk, batch_size=PURGE_BATCH_SIZE,
+                                pause=PURGE_BATCH_PAUSE, progress=None, verify_attempts=PURGE_VERIFY_ATTEMPTS,
+                                verify_delay=PURGE_VERIFY_DELAY):
+    """
+    Удаляет участия завершённой активности пачками без загрузки объектов в память.
+    Удаляются только записи с pk <= max_pk, чтобы не задеть участия после повторной активации.
+    Возвращает количество удалённых строк или None, если перенос в историю не подтверждён.
+    """
+    if not wait_for_history(activity_id, history_id, max_pk, verify_attempts, verify_delay):
+        return None
+    deleted_total = 0
+    while True:
+        pks = list(
+            ActivityParticipant.objects.filter(activity_id=activity_id, pk__lte=max_pk)
+            .order_by('pk')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not pks:
+            break
+        # У ActivityParticipant нет зависимых моделей, поэтому каскад и сигналы удаления не нужны
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {connection.ops.quote_name(ActivityParticipant._meta.db_table)} "
+                f"WHERE id IN ({', '.join(['%s'] * len(pks))})",
+                pks,
+            )
+            deleted = cursor.rowcount
+        deleted_total += deleted
+        if progress:
+            progress(deleted_total)
+        else:
+            print(f"Очистка участников активности {activity_id}: удалено {deleted_total}")
+        if len(pks) < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+    return deleted_total
+
+
+def _run_purge(activity_id, history_id, max_pk):
+    try:
+        purge_activity_participants(activity_id, history_id, max_pk)
+    except Exception as e:
+        print(f"Ошибка при очистке участников активности {activity_id}: {e}")
+    finally:
+        connection.close()
+
+
+def schedule_participants_purge(activity, history_record):
+    """Запускает фоновую очистку участников активности после фиксации транзакции"""
+    max_pk = ActivityParticipant.objects.filter(activity=activity).aggregate(max_pk=Max('pk'))['max_pk']
+    if max_pk is None:
+        return
+    history_id = history_record.pk if history_record else None
+
+    def start():
+        threading.Thread(
+            target=_run_purge,
+            args=(activity.pk, history_id, max_pk),
+            name=f"purge-activity-{activity.pk}",
+            daemon=True,
+        ).start()
+
+    transaction.on_commit(start)
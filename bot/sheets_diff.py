@@ -0,0 +1,174 @@
+import hashlib
+import json
+
+# Колонки ключа строки: Дата создания, Активность, Участник, Класс, Время начала
+KEY_COLUMNS = (0, 1, 2, 3, 5)
+# Колонки события (для группировки и цветовой маркировки): Дата создания, Активность
+EVENT_COLUMNS = (0, 1)
+ROW_WIDTH = 12
+LAST_COLUMN = 'L'
+
+
+def normalize_cell(value):
+    """Приводит значение ячейки к строке так, как его вернёт API с UNFORMATTED_VALUE"""
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return str(value).upper()
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def normalize_row(row):
+    """Дополняет строку до ширины таблицы и нормализует значения"""
+    cells = [normalize_cell(value) for value in row[:ROW_WIDTH]]
+    return cells + [''] * (ROW_WIDTH - len(cells))
+
+
+def row_key(row):
+    cells = normalize_row(row)
+    return tuple(cells[i] for i in KEY_COLUMNS)
+
+
+def event_key(row):
+    cells = normalize_row(row)
+    return tuple(cells[i] for i in EVENT_COLUMNS)
+
+
+def row_hash(row):
+    """Хеш содержимого строки для сравнения без хранения самих значений"""
+    payload = json.dumps(normalize_row(row), ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def rows_digest(rows, salt=''):
+    """Хеш набора строк без учёта их порядка (для пропуска неизменившихся выгрузок)"""
+    digest = hashlib.sha1(salt.encode('utf-8'))
+    for content_hash in sorted(row_hash(row) for row in rows):
+        digest.update(content_hash.encode('ascii'))
+    return digest.hexdigest()
+
+
+class SheetDiff:
+    """Результат сравнения: изменённые строки, новые строки и номера удаляемых строк"""
+
+    def __init__(self, updates, appends, removed):
+        self.updates = updates  # [(номер_строки, значения)]
+        self.appends = appends  # [значения]
+        self.removed = removed  # [номер_строки]
+
+    @property
+    def is_empty(self):
+        return not (self.updates or self.appends or self.removed)
+
+    def __repr__(self):
+        return f"SheetDiff(updates={len(self.updates)}, appends={len(self.appends)}, removed={len(self.removed)})"
+
+
+def index_sheet_rows(values, first_row=2):
+    """Строит индекс {ключ: (номер_строки, хеш)} по значениям листа без заголовка"""
+    index = {}
+    for offset, row in enumerate(values):
+        if not row:
+            continue
+        index[row_key(row)] = (first_row + offset, row_hash(row))
+    return index
+
+
+def diff_rows(existing, new_rows):
+    """
+    Сравнивает новые строки с индексом существующих.
+    Строки событий из new_rows, которых больше нет в новых данных, попадают в removed.
+    """
+    new_by_key = {}
+    for row in new_rows:
+        new_by_key[row_key(row)] = row
+    events = {key[:len(EVENT_COLUMNS)] for key in new_by_key}
+
+    updates = []
+    appends = []
+    for key, row in new_by_key.items():
+        if key in existing:
+            row_number, content_hash = existing[key]
+            if content_hash != row_hash(row):
+                updates.append((row_number, row))
+        else:
+            appends.append(row)
+    removed = sorted(
+        row_number
+        for key, (row_number, _) in existing.items()
+        if key[:len(EVENT_COLUMNS)] in events and key not in new_by_key
+    )
+    updates.sort(key=lambda item: item[0])
+    appends.sort(key=lambda row: (normalize_cell(row[0]), normalize_cell(row[5])))
+    return SheetDiff(updates, appends, removed)
+
+
+def merge_row_ranges(row_numbers):
+    """Склеивает номера строк в непрерывные диапазоны [(начало, конец)] включительно"""
+    ranges = []
+    for row_number in sorted(set(row_numbers)):
+        if ranges and ranges[-1][1] == row_number - 1:
+            ranges[-1] = (ranges[-1][0], row_number)
+        else:
+            ranges.append((row_number, row_number))
+    return ranges
+
+
+def build_update_ranges(sheet_title, updates):
+    """Формирует data для values.batchUpdate, объединяя соседние строки в один диапазон"""
+    data = []
+    rows_by_number = dict(updates)
+    for start, end in merge_row_ranges(rows_by_number):
+        data.append({
+            'range': f"'{sheet_title}'!A{start}:{LAST_COLUMN}{end}",
+            'values': [rows_by_number[number] for number in range(start, end + 1)],
+        })
+    return data
+
+
+def build_delete_requests(sheet_id, row_numbers):
+    """Запросы deleteDimension для строк, снизу вверх, чтобы индексы не сдвигались"""
+    return [
+        {
+            'deleteDimension': {
+                'range': {
+                    'sheetId': sheet_id,
+                    'dimension': 'ROWS',
+                    'startIndex': start - 1,
+                    'endIndex': end,
+                }
+            }
+        }
+        for start, end in reversed(merge_row_ranges(row_numbers))
+    ]
+
+
+def parse_first_row(a1_range):
+    """Номер первой строки из диапазона вида 'Лист1'!A10:L12"""
+    cells = a1_range.rsplit('!', 1)[-1].split(':')[0]
+    digits = ''.join(ch for ch in cells if ch.isdigit())
+    return int(digits) if digits else None
+
+
+def build_color_groups(rows, activity_col_index, date_col_index, first_row=2, colors_count=2):
+    """
+    Группы для окраски: непрерывные диапазоны строк одного события [(начало, конец, индекс_цвета)].
+    Цвет чередуется по событиям в порядке их первого появления.
+    """
+    event_colors = {}
+    groups = []
+    for offset, row in enumerate(rows):
+        if len(row) <= max(activity_col_index, date_col_index):
+            continue
+        event = (normalize_cell(row[activity_col_index]), normalize_cell(row[date_col_index]))
+        if event not in event_colors:
+            event_colors[event] = len(event_colors) % colors_count
+        color_index = event_colors[event]
+        row_number = first_row + offset
+        if groups and groups[-1][1] == row_number - 1 and groups[-1][2] == color_index and groups[-1][3] == event:
+            groups[-1] = (groups[-1][0], row_number, color_index, event)
+        else:
+            groups.append((row_number, row_number, color_index, event))
+    return [(start, end, color_index) for start, end, color_index, _ in groups]
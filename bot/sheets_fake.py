@@ -0,0 +1,337 @@
+import json
+import re
+import threading
+import time
+from collections import Counter
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+
+_A1_CELL = re.compile(r'^([A-Z]*)(\d*)$')
+
+
+def _column_index(letters):
+    index = 0
+    for letter in letters:
+        index = index * 26 + (ord(letter) - ord('A') + 1)
+    return index - 1
+
+
+def _column_letters(index):
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+
+def parse_a1_range(a1_range):
+    """
+    Разбирает диапазон вида 'Лист1'!A2:L10, Лист1!A1:L, 'Лист1'!A:L или 'Лист1'!A1.
+    Возвращает (лист, первая_строка, последняя_строка|None, первая_колонка, последняя_колонка|None), всё с 0.
+    """
+    sheet_title, _, cells = a1_range.rpartition('!')
+    if not sheet_title:
+        sheet_title, cells = cells, ''
+    if sheet_title.startswith("'") and sheet_title.endswith("'"):
+        sheet_title = sheet_title[1:-1].replace("''", "'")
+    start, _, end = cells.partition(':')
+    start_col, start_row = _A1_CELL.match(start or 'A1').groups()
+    first_col = _column_index(start_col) if start_col else 0
+    first_row = int(start_row) - 1 if start_row else 0
+    last_col, last_row = None, None
+    if end:
+        end_col, end_row = _A1_CELL.match(end).groups()
+        last_col = _column_index(end_col) if end_col else None
+        last_row = int(end_row) - 1 if end_row else None
+    return sheet_title, first_row, last_row, first_col, last_col
+
+
+class FakeSheetsStats:
+    """Счётчики обращений к фейковому API: запросы, переданные ячейки и байты"""
+
+    def __init__(self):
+        self.requests = Counter()
+        self.errors = Counter()
+        self.cells_sent = 0
+        self.cells_received = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    @property
+    def total_requests(self):
+        return sum(self.requests.values())
+
+    def reset(self):
+        self.__init__()
+
+    def as_dict(self):
+        return {
+            'requests': dict(self.requests),
+            'total_requests': self.total_requests,
+            'errors': dict(self.errors),
+            'cells_sent': self.cells_sent,
+            'cells_received': self.cells_received,
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.bytes_received,
+        }
+
+
+def _count_cells(payload):
+    """Количество ячеек во всех списках values внутри тела запроса или ответа"""
+    if isinstance(payload, dict):
+        total = 0
+        for key, value in payload.items():
+            if key == 'values' and isinstance(value, list):
+                total += sum(len(row) for row in value)
+            else:
+                total += _count_cells(value)
+        return total
+    if isinstance(payload, list):
+        return sum(_count_cells(item) for item in payload)
+    return 0
+
+
+def _payload_size(payload):
+    return len(json.dumps(payload, ensure_ascii=False).encode('utf-8')) if payload is not None else 0
+
+
+class _FakeRequest:
+    def __init__(self, service, method, handler, body=None):
+        self._service = service
+        self._method = method
+        self._handler = handler
+        self._body = body
+
+    def execute(self, num_retries=0):
+        service = self._service
+        if service.latency:
+            time.sleep(service.latency)
+        with service.lock:
+            if service.pending_errors:
+                status = service.pending_errors.pop(0)
+                service.stats.errors[status] += 1
+                raise HttpError(httplib2.Response({'status': status}), b'{"error": {"message": "fake error"}}')
+            response = self._handler()
+            stats = service.stats
+            stats.requests[self._method] += 1
+            stats.cells_sent += _count_cells(self._body)
+            stats.bytes_sent += _payload_size(self._body)
+            stats.cells_received += _count_cells(response)
+            stats.bytes_received += _payload_size(response)
+        return response
+
+
+class _FakeValues:
+    def __init__(self, service):
+        self._service = service
+
+    def get(self, spreadsheetId, range, valueRenderOption=None, **kwargs):
+        return _FakeRequest(self._service, 'values.get', lambda: self._service.read_range(range))
+
+    def update(self, spreadsheetId, range, body, valueInputOption=None, **kwargs):
+        return _FakeRequest(
+            self._service, 'values.update',
+            lambda: self._service.write_range(range, body.get('values', [])), body
+        )
+
+    def batchUpdate(self, spreadsheetId, body, **kwargs):
+        def handler():
+            responses = [self._service.write_range(item['range'], item.get('values', [])) for item in body.get('data', [])]
+            return {
+                'totalUpdatedRows': sum(r['updatedRows'] for r in responses),
+                'totalUpdatedCells': sum(r['updatedCells'] for r in responses),
+            }
+        return _FakeRequest(self._service, 'values.batchUpdate', handler, body)
+
+    def append(self, spreadsheetId, range, body, valueInputOption=None, insertDataOption=None, **kwargs):
+        return _FakeRequest(
+            self._service, 'values.append',
+            lambda: self._service.append_rows(range, body.get('values', [])), body
+        )
+
+    def clear(self, spreadsheetId, range, body=None, **kwargs):
+        return _FakeRequest(self._service, 'values.clear', lambda: self._service.clear_range(range), body)
+
+    def batchClear(self, spreadsheetId, body, **kwargs):
+        def handler():
+            for a1_range in body.get('ranges', []):
+                self._service.clear_range(a1_range)
+            return {'clearedRanges': body.get('ranges', [])}
+        return _FakeRequest(self._service, 'values.batchClear', handler, body)
+
+
+class _FakeSpreadsheets:
+    def __init__(self, service):
+        self._service = service
+
+    def values(self):
+        return _FakeValues(self._service)
+
+    def get(self, spreadsheetId, fields=None, **kwargs):
+        return _FakeRequest(self._service, 'get', self._service.describe)
+
+    def batchUpdate(self, spreadsheetId, body, **kwargs):
+        return _FakeRequest(
+            self._service, 'batchUpdate',
+            lambda: {'replies': [self._service.apply_request(request) for request in body.get('requests', [])]},
+            body
+        )
+
+
+class FakeSheetsService:
+    """
+    Офлайн-замена клиента Google Sheets v4 (поверхность values/get/batchUpdate) в памяти.
+    Считает запросы, переданные ячейки и байты, может имитировать задержку сети.
+    """
+
+    def __init__(self, latency=0.0, sheet_titles=('Лист1',)):
+        self.latency = latency
+        self.lock = threading.RLock()
+        self.stats = FakeSheetsStats()
+        self.sheets = {}
+        self.formats = {}
+        self.pending_errors = []
+        self._next_sheet_id = 0
+        for title in sheet_titles:
+            self.add_sheet(title)
+
+    def spreadsheets(self):
+        return _FakeSpreadsheets(self)
+
+    def fail_next(self, status=429, count=1):
+        """Следующие count запросов завершатся ошибкой HTTP с указанным статусом (например, 429)"""
+        with self.lock:
+            self.pending_errors.extend([status] * count)
+
+    # --- Состояние ---
+
+    def add_sheet(self, title):
+        if title in self.sheets:
+            raise ValueError(f"Лист '{title}' уже существует")
+        sheet_id = self._next_sheet_id
+        self._next_sheet_id += 1
+        self.sheets[title] = {'sheetId': sheet_id, 'rows': []}
+        return {'title': title, 'sheetId': sheet_id}
+
+    def rows(self, title='Лист1'):
+        return self.sheets[title]['rows']
+
+    def _sheet(self, title):
+        if title not in self.sheets:
+            raise ValueError(f"Лист '{title}' не найден")
+        return self.sheets[title]
+
+    def _sheet_by_id(self, sheet_id):
+        for title, sheet in self.sheets.items():
+            if sheet['sheetId'] == sheet_id:
+                return title, sheet
+        raise ValueError(f"Лист с sheetId={sheet_id} не найден")
+
+    @staticmethod
+    def _trim(rows):
+        for row in rows:
+            while row and row[-1] in ('', None):
+                row.pop()
+        while rows and not rows[-1]:
+            rows.pop()
+
+    # --- Операции ---
+
+    def read_range(self, a1_range):
+        title, first_row, last_row, first_col, last_col = parse_a1_range(a1_range)
+        rows = self._sheet(title)['rows']
+        selected = rows[first_row:None if last_row is None else last_row + 1]
+        values = [list(row[first_col:None if last_col is None else last_col + 1]) for row in selected]
+        self._trim(values)
+        response = {'range': a1_range, 'majorDimension': 'ROWS'}
+        if values:
+            response['values'] = values
+        return response
+
+    def write_range(self, a1_range, values):
+        title, first_row, _, first_col, _ = parse_a1_range(a1_range)
+        rows = self._sheet(title)['rows']
+        for offset, row_values in enumerate(values):
+            row_index = first_row + offset
+            while len(rows) <= row_index:
+                rows.append([])
+            row = rows[row_index]
+            while len(row) < first_col + len(row_values):
+                row.append('')
+            row[first_col:first_col + len(row_values)] = list(row_values)
+        self._trim(rows)
+        return {
+            'updatedRange': a1_range,
+            'updatedRows': len(values),
+            'updatedCells': sum(len(row) for row in values),
+        }
+
+    def append_rows(self, a1_range, values):
+        title = parse_a1_range(a1_range)[0]
+        rows = self._sheet(title)['rows']
+        first_row = len(rows) + 1
+        last_row = first_row + len(values) - 1
+        width = max((len(row) for row in values), default=1)
+        updated_range = f"'{title}'!A{first_row}:{_column_letters(width - 1)}{last_row}"
+        result = self.write_range(updated_range, values)
+        return {'updates': result}
+
+    def clear_range(self, a1_range):
+        title, first_row, last_row, first_col, last_col = parse_a1_range(a1_range)
+        rows = self._sheet(title)['rows']
+        for row in rows[first_row:None if last_row is None else last_row + 1]:
+            end = len(row) if last_col is None else min(len(row), last_col + 1)
+            for col in range(first_col, end):
+                row[col] = ''
+        self._trim(rows)
+        return {'clearedRange': a1_range}
+
+    def describe(self):
+        return {
+            'sheets': [
+                {
+                    'properties': {
+                        'title': title,
+                        'sheetId': sheet['sheetId'],
+                        'gridProperties': {'rowCount': max(len(sheet['rows']), 1000)},
+                    }
+                }
+                for title, sheet in self.sheets.items()
+            ]
+        }
+
+    def apply_request(self, request):
+        if 'addSheet' in request:
+            properties = self.add_sheet(request['addSheet']['properties']['title'])
+            return {'addSheet': {'properties': properties}}
+        if 'deleteSheet' in request:
+            title, _ = self._sheet_by_id(request['deleteSheet']['sheetId'])
+            del self.sheets[title]
+            self.formats.pop(title, None)
+            return {}
+        if 'deleteDimension' in request:
+            dimension = request['deleteDimension']['range']
+            title, sheet = self._sheet_by_id(dimension['sheetId'])
+            if dimension.get('dimension') == 'ROWS':
+                del sheet['rows'][dimension['startIndex']:dimension['endIndex']]
+            return {}
+        if 'repeatCell' in request:
+            cell_range = request['repeatCell']['range']
+            title, sheet = self._sheet_by_id(cell_range['sheetId'])
+            formats = self.formats.setdefault(title, {})
+            color = request['repeatCell']['cell'].get('userEnteredFormat', {}).get('backgroundColor')
+            # Диапазон без границ строк — весь лист
+            end = cell_range.get('endRowIndex', max(len(sheet['rows']), max(formats, default=-1) + 1))
+            for row_index in range(cell_range.get('startRowIndex', 0), end):
+                if color is None:
+                    formats.pop(row_index, None)
+                else:
+                    formats[row_index] = color
+            return {}
+        # Неподдержанный запрос — ошибка в самом фейке или в тесте, а не ответ API
+        raise AssertionError(
+            f"FakeSheetsService не поддерживает запрос batchUpdate {', '.join(request) or '(пустой)'}: {request}"
+        )
@@ -0,0 +1,249 @@
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from .models import SheetLock, SheetRowIndex
+from .sheets_diff import index_sheet_rows, merge_row_ranges, row_hash, row_key
+
+KEY_FIELDS = ('created_date', 'activity_name', 'participant', 'class_name', 'start_time')
+BULK_BATCH_SIZE = 1000
+
+# Аренда листа: срок, на который писатель захватывает лист, и сколько ждать чужую аренду
+SHEET_LOCK_LEASE_SECONDS = getattr(settings, 'SHEETS_LOCK_LEASE_SECONDS', 600)
+SHEET_LOCK_WAIT_SECONDS = getattr(settings, 'SHEETS_LOCK_WAIT_SECONDS', 900)
+SHEET_LOCK_POLL_SECONDS = 0.5
+
+_process_locks = {}
+_process_locks_guard = threading.Lock()
+_held_leases = threading.local()
+
+
+class SheetLockTimeout(Exception):
+    """Лист занят другим писателем дольше допустимого ожидания"""
+
+
+class SheetLease:
+    """Аренда листа, захваченная sheet_lock; renew() продлевает её в длинных операциях"""
+
+    def __init__(self, sheet_title, owner, lease_seconds):
+        self.sheet_title = sheet_title
+        self.owner = owner
+        self.lease_seconds = lease_seconds
+
+    def claim(self):
+        """Захватывает свободный или просроченный лист короткой транзакцией; True при успехе"""
+        with transaction.atomic():
+            lock, _ = SheetLock.objects.select_for_update().get_or_create(sheet_title=self.sheet_title)
+            now = timezone.now()
+            if lock.owner and lock.owner != self.owner and lock.expires_at and lock.expires_at > now:
+                return False
+            lock.owner = self.owner
+            lock.expires_at = now + timedelta(seconds=self.lease_seconds)
+            lock.save(update_fields=['owner', 'expires_at'])
+            return True
+
+    def renew(self):
+        SheetLock.objects.filter(sheet_title=self.sheet_title, owner=self.owner).update(
+            expires_at=timezone.now() + timedelta(seconds=self.lease_seconds)
+        )
+
+    def release(self):
+        SheetLock.objects.filter(sheet_title=self.sheet_title, owner=self.owner).update(owner='', expires_at=None)
+
+
+def lease_owner():
+    """Уникальный владелец аренды: хост, процесс и случайный суффикс"""
+    return f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex}'[-100:]
+
+
+@contextmanager
+def sheet_lock(sheet_title, wait=None, lease=None):
+    """
+    Блокировка листа на время записи в лист и в его индекс строк. Писатели одного листа — экспорт,
+    удаление активности, сверка и пересборка — выполняются по очереди, в том числе из разных
+    процессов. Строка SheetLock захватывается арендой (владелец и срок) в отдельной короткой
+    транзакции, поэтому запросы к Google API и ожидания квоты идут без открытой транзакции
+    и блокировок строк БД; аренда умершего процесса истекает сама. Повторный вход в том же
+    потоке допускается. Если лист не освободился за wait секунд — SheetLockTimeout.
+    """
+    held = getattr(_held_leases, 'leases', None)
+    if held is None:
+        held = _held_leases.leases = {}
+    if sheet_title in held:
+        yield held[sheet_title]
+        return
+    wait = SHEET_LOCK_WAIT_SECONDS if wait is None else wait
+    deadline = time.monotonic() + wait
+    with _process_locks_guard:
+        process_lock = _process_locks.setdefault(sheet_title, threading.Lock())
+    if not process_lock.acquire(timeout=max(wait, 0)):
+        raise SheetLockTimeout(f"Лист '{sheet_title}' занят дольше {wait} с")
+    try:
+        sheet_lease = SheetLease(sheet_title, lease_owner(), SHEET_LOCK_LEASE_SECONDS if lease is None else lease)
+        while not sheet_lease.claim():
+            if time.monotonic() >= deadline:
+                raise SheetLockTimeout(f"Лист '{sheet_title}' занят дольше {wait} с")
+            time.sleep(SHEET_LOCK_POLL_SECONDS)
+        held[sheet_title] = sheet_lease
+        try:
+            yield sheet_lease
+        finally:
+            del held[sheet_title]
+            sheet_lease.release()
+    finally:
+        process_lock.release()
+
+
+def _index_entry(sheet_title, row_number, row):
+    return SheetRowIndex(
+        sheet_title=sheet_title,
+        row_number=row_number,
+        content_hash=row_hash(row),
+        **dict(zip(KEY_FIELDS, row_key(row)))
+    )
+
+
+def has_sheet_index(sheet_title):
+    return SheetRowIndex.objects.filter(sheet_title=sheet_title).exists()
+
+
+def invalidate_sheet_index(sheet_title):
+    """Сбрасывает индекс листа: следующая запись заново прочитает лист"""
+    SheetRowIndex.objects.filter(sheet_title=sheet_title).delete()
+
+
+def load_event_index(sheet_title, events):
+    """Индекс {ключ: (номер_строки, хеш)} только для строк указанных событий (дата, активность)"""
+    if not events:
+        return {}
+    condition = reduce(or_, (Q(created_date=date, activity_name=name) for date, name in events))
+    entries = SheetRowIndex.objects.filter(sheet_title=sheet_title).filter(condition).values_list(
+        *KEY_FIELDS, 'row_number', 'content_hash'
+    )
+    return {tuple(entry[:5]): (entry[5], entry[6]) for entry in entries}
+
+
+def count_event_rows(sheet_title, events):
+    """Количество проиндексированных строк указанных событий (дата, активность) на листе"""
+    if not events:
+        return 0
+    condition = reduce(or_, (Q(created_date=date, activity_name=name) for date, name in events))
+    return SheetRowIndex.objects.filter(sheet_title=sheet_title).filter(condition).count()
+
+
+def load_event_rows(sheet_title):
+    """
+    Колонки события (дата, активность) для всех строк листа по порядку номеров.
+    Используется для окраски без чтения самого листа.
+    """
+    rows = []
+    entries = SheetRowIndex.objects.filter(sheet_title=sheet_title).order_by('row_number').values_list(
+        'row_number', 'created_date', 'activity_name'
+    )
+    for row_number, created_date, activity_name in entries:
+        while len(rows) < row_number - 2:
+            rows.append([])
+        rows.append([created_date, activity_name])
+    return rows
+
+
+def sheet_row_counts(prefix=''):
+    """Количество строк данных по каждому проиндексированному листу {лист: строк} одним запросом"""
+    entries = SheetRowIndex.objects.all()
+    if prefix:
+        entries = entries.filter(sheet_title__startswith=prefix)
+    return dict(entries.values_list('sheet_title').annotate(rows=Count('id')).order_by())
+
+
+def replace_sheet_index(sheet_title, rows, first_row=2):
+    """Заменяет индекс листа индексом переписанных целиком строк"""
+    with transaction.atomic():
+        SheetRowIndex.objects.filter(sheet_title=sheet_title).delete()
+        SheetRowIndex.objects.bulk_create(
+            [
+                SheetRowIndex(
+                    sheet_title=sheet_title,
+                    row_number=row_number,
+                    content_hash=content_hash,
+                    **dict(zip(KEY_FIELDS, key))
+                )
+                for key, (row_number, content_hash) in index_sheet_rows(rows, first_row=first_row).items()
+            ],
+            batch_size=BULK_BATCH_SIZE
+        )
+
+
+def apply_diff_to_index(sheet_title, diff, first_appended_row):
+    """
+    Обновляет индекс после применения diff к листу (в одной транзакции),
+    в том же порядке, что и запись: обновления, удаление со сдвигом, добавление.
+    """
+    with transaction.atomic():
+        if diff.updates:
+            hashes = {row_number: row_hash(row) for row_number, row in diff.updates}
+            entries = list(SheetRowIndex.objects.filter(sheet_title=sheet_title, row_number__in=hashes))
+            for entry in entries:
+                entry.content_hash = hashes[entry.row_number]
+            SheetRowIndex.objects.bulk_update(entries, ['content_hash'], batch_size=BULK_BATCH_SIZE)
+        if diff.removed:
+            SheetRowIndex.objects.filter(sheet_title=sheet_title, row_number__in=diff.removed).delete()
+            # Сдвигаем строки ниже удалённых диапазонов, начиная с нижнего
+            for start, end in reversed(merge_row_ranges(diff.removed)):
+                SheetRowIndex.objects.filter(sheet_title=sheet_title, row_number__gt=end).update(
+                    row_number=F('row_number') - (end - start + 1)
+                )
+        if diff.appends and first_appended_row:
+            SheetRowIndex.objects.bulk_create(
+                [
+                    _index_entry(sheet_title, first_appended_row + offset, row)
+                    for offset, row in enumerate(diff.appends)
+                ],
+                batch_size=BULK_BATCH_SIZE
+            )
+
+
+def reconcile_sheet_index(sheet_title, rows, first_row=2):
+    """
+    Сверяет индекс с фактическими строками листа и исправляет только расхождения.
+    Возвращает словарь со счётчиками added/updated/deleted.
+    """
+    actual = index_sheet_rows(rows, first_row=first_row)
+    with transaction.atomic():
+        stored = {
+            entry.key: entry
+            for entry in SheetRowIndex.objects.select_for_update().filter(sheet_title=sheet_title)
+        }
+        to_delete = [entry.pk for key, entry in stored.items() if key not in actual]
+        to_update = []
+        for key, entry in stored.items():
+            if key in actual and (entry.row_number, entry.content_hash) != actual[key]:
+                entry.row_number, entry.content_hash = actual[key]
+                to_update.append(entry)
+        to_create = [
+            SheetRowIndex(
+                sheet_title=sheet_title,
+                row_number=row_number,
+                content_hash=content_hash,
+                **dict(zip(KEY_FIELDS, key))
+            )
+            for key, (row_number, content_hash) in actual.items()
+            if key not in stored
+        ]
+        if to_delete:
+            SheetRowIndex.objects.filter(pk__in=to_delete).delete()
+        if to_update:
+            SheetRowIndex.objects.bulk_update(to_update, ['row_number', 'content_hash'], batch_size=BULK_BATCH_SIZE)
+        if to_create:
+            SheetRowIndex.objects.bulk_create(to_create, batch_size=BULK_BATCH_SIZE)
+    return {'added': len(to_create), 'updated': len(to_update), 'deleted': len(to_delete)}
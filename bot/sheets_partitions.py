@@ -0,0 +1,48 @@
+from datetime import datetime
+
+from .sheets_diff import normalize_cell
+
+# Лист без разбиения (и лист с данными, выгруженными до разбиения по периодам)
+LEGACY_SHEET_TITLE = 'Лист1'
+# Лист-оглавление со списком разделов и количеством строк в них
+DEFAULT_INDEX_SHEET_TITLE = 'Разделы'
+INDEX_SHEET_HEADERS = ['Лист', 'Строк']
+# Формат колонки 'Дата создания'
+CREATED_DATE_FORMAT = '%d.%m.%Y %H:%M:%S'
+
+PARTITION_PERIODS = ('month', 'quarter', 'year', 'none')
+
+
+def partition_title(created_date, period='month'):
+    """
+    Название листа-раздела для даты события: '2025-01' (month), '2025-Q1' (quarter), '2025' (year).
+    При period='none' или нераспознанной дате все строки пишутся в Лист1.
+    """
+    if period == 'none':
+        return LEGACY_SHEET_TITLE
+    try:
+        date = datetime.strptime(normalize_cell(created_date), CREATED_DATE_FORMAT)
+    except ValueError:
+        return LEGACY_SHEET_TITLE
+    if period == 'year':
+        return f"{date.year}"
+    if period == 'quarter':
+        return f"{date.year}-Q{(date.month - 1) // 3 + 1}"
+    return f"{date.year}-{date.month:02d}"
+
+
+def split_rows_by_partition(rows, period='month', date_col_index=0):
+    """Раскладывает строки листа по разделам {название_листа: [строки]} с сохранением порядка"""
+    partitions = {}
+    for row in rows:
+        partitions.setdefault(partition_title(row[date_col_index], period), []).append(row)
+    return partitions
+
+
+def build_index_sheet_rows(row_counts, index_sheet_title=DEFAULT_INDEX_SHEET_TITLE):
+    """Строки листа-оглавления: заголовок и по строке на раздел, разделы по названию"""
+    rows = [list(INDEX_SHEET_HEADERS)]
+    for sheet_title in sorted(row_counts):
+        if sheet_title != index_sheet_title:
+            rows.append([sheet_title, row_counts[sheet_title]])
+    return rows
@@ -0,0 +1,113 @@
+import random
+import threading
+import time
+from collections import deque
+
+from googleapiclient.errors import HttpError
+
+# Статусы, при которых запрос повторяется с задержкой: 429 (квота превышена, запрос не выполнен) —
+# всегда, 5xx (временная недоступность) — только для идемпотентных запросов: запрос мог успеть
+# выполниться на сервере, и повтор append или deleteDimension задвоил бы строки или удалил лишние
+RETRY_STATUSES = (429,)
+IDEMPOTENT_RETRY_STATUSES = (429, 500, 503)
+
+
+class QuotaGovernor:
+    """
+    Учёт квоты Google Sheets API: не больше read_limit чтений и write_limit записей за скользящее окно.
+    Запрос, не укладывающийся в бюджет, ждёт освобождения окна; ответы 429 (и 5xx для
+    идемпотентных запросов) повторяются с экспоненциальной задержкой и случайным разбросом (jitter).
+    """
+
+    def __init__(self, read_limit=60, write_limit=60, window=60.0, max_retries=5, backoff_base=1.0,
+                 backoff_max=32.0):
+        self.limits = {'read': read_limit, 'write': write_limit}
+        self.window = window
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._lock = threading.Lock()
+        self._sent = {'read': deque(), 'write': deque()}
+        self._totals = {'read': 0, 'write': 0}
+        self._throttled = 0
+        self._retries = 0
+        self._waits = 0
+        self._wait_seconds = 0.0
+
+    def _expire(self, sent, now):
+        while sent and sent[0] <= now - self.window:
+            sent.popleft()
+
+    def acquire(self, kind):
+        """Резервирует запрос в бюджете окна, при необходимости ожидая освобождения"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                sent = self._sent[kind]
+                self._expire(sent, now)
+                if len(sent) < self.limits[kind]:
+                    sent.append(now)
+                    self._totals[kind] += 1
+                    if waited:
+                        self._waits += 1
+                        self._wait_seconds += waited
+                    return waited
+                delay = sent[0] + self.window - now
+            time.sleep(delay)
+            waited += delay
+
+    def backoff_delay(self, attempt):
+        """Задержка перед повтором: экспонента с полным разбросом (full jitter)"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def execute(self, request, kind='write', idempotent=None):
+        """
+        Выполняет запрос к API с учётом бюджета и повторами при 429, а для идемпотентных запросов
+        и при 5xx. По умолчанию идемпотентными считаются чтения; записи, которые можно безопасно
+        повторить (values().update/clear, оформление), вызывающий помечает idempotent=True.
+        """
+        if idempotent is None:
+            idempotent = kind == 'read'
+        retry_statuses = IDEMPOTENT_RETRY_STATUSES if idempotent else RETRY_STATUSES
+        attempt = 0
+        while True:
+            self.acquire(kind)
+            try:
+                return request.execute()
+            except HttpError as error:
+                status = getattr(error.resp, 'status', None)
+                if status not in retry_statuses or attempt >= self.max_retries:
+                    raise
+                delay = self.backoff_delay(attempt)
+                with self._lock:
+                    self._retries += 1
+                    if status == 429:
+                        self._throttled += 1
+                print(f"Google Sheets API вернул {status}, повтор через {delay:.1f} с (попытка {attempt + 1})")
+                time.sleep(delay)
+                attempt += 1
+
+    def metrics(self):
+        """Использование бюджета в текущем окне и накопленные счётчики"""
+        with self._lock:
+            now = time.monotonic()
+            for sent in self._sent.values():
+                self._expire(sent, now)
+            return {
+                'window_seconds': self.window,
+                'read': {
+                    'used': len(self._sent['read']),
+                    'limit': self.limits['read'],
+                    'total': self._totals['read'],
+                },
+                'write': {
+                    'used': len(self._sent['write']),
+                    'limit': self.limits['write'],
+                    'total': self._totals['write'],
+                },
+                'throttled': self._throttled,
+                'retries': self._retries,
+                'waits': self._waits,
+                'wait_seconds': round(self._wait_seconds, 3),
+            }
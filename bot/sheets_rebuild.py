@@ -0,0 +1,175 @@
+import threading
+import time
+from itertools import groupby
+
+from .google_sheets import GoogleSheetsManager, get_sheets_manager
+from .models import (
+    ActivityHistory, ActivityHistoryParticipant, build_activity_history_export_data, load_class_coefficients,
+)
+from .sheets_diff import normalize_cell
+from .sheets_partitions import LEGACY_SHEET_TITLE
+
+# Строк в одном values.update при пересборке (≈1–2 МБ на запрос)
+REBUILD_CHUNK_ROWS = 5000
+# Строка SheetLock, арендой которой пересборка выгрузки занимается на все процессы
+REBUILD_LOCK_TITLE = '__rebuild__'
+PARTICIPANTS_CHUNK_SIZE = 2000
+PARTICIPANT_FIELDS = (
+    'activity_history', 'player_game_nickname', 'player_tg_name', 'class_name', 'class_level',
+    'joined_at', 'completed_at', 'points_earned', 'additional_points',
+)
+
+
+def iter_history_exports(histories, all_histories=False):
+    """
+    Пары (история, строки выгрузки) в порядке начала активностей.
+    Участники всех историй читаются одним курсором, коэффициенты классов — одним запросом.
+    all_histories=True — выбраны все истории, участников можно не фильтровать по списку id.
+    """
+    histories_by_id = {history.pk: history for history in histories}
+    coefficients = load_class_coefficients({
+        history.original_activity_id
+        for history in histories_by_id.values()
+        if history.original_activity_id and not history.ignore_odds
+    })
+    participants = ActivityHistoryParticipant.objects.all()
+    if not all_histories:
+        participants = participants.filter(activity_history_id__in=list(histories_by_id))
+    participants = participants.order_by('activity_history__activity_started_at', 'activity_history_id', 'pk').only(
+        *PARTICIPANT_FIELDS
+    ).iterator(chunk_size=PARTICIPANTS_CHUNK_SIZE)
+    for history_id, history_participants in groupby(participants, key=lambda participant: participant.activity_history_id):
+        history = histories_by_id.get(history_id)
+        if history is None:
+            continue  # История создана уже после начала пересборки
+        yield history, build_activity_history_export_data(
+            history, history_participants, coefficients.get(history.original_activity_id, ())
+        )
+
+
+_rebuild_lock = threading.Lock()
+
+
+class RebuildInProgress(Exception):
+    """Пересборка выгрузки уже идёт в этом или другом процессе"""
+
+
+def claim_rebuild():
+    """
+    Занимает пересборку выгрузки: одновременно идёт только одна пересборка на все процессы
+    (блокировка процесса и аренда строки SheetLock). Возвращает аренду для release_rebuild;
+    если пересборка уже идёт — RebuildInProgress.
+    """
+    from .sheets_index import SHEET_LOCK_LEASE_SECONDS, SheetLease, lease_owner
+    if not _rebuild_lock.acquire(blocking=False):
+        raise RebuildInProgress('Пересборка выгрузки уже идёт')
+    try:
+        lease = SheetLease(REBUILD_LOCK_TITLE, lease_owner(), SHEET_LOCK_LEASE_SECONDS)
+        if not lease.claim():
+            raise RebuildInProgress('Пересборка выгрузки уже идёт в другом процессе')
+    except BaseException:
+        _rebuild_lock.release()
+        raise
+    return lease
+
+
+def release_rebuild(lease):
+    """Освобождает пересборку, занятую claim_rebuild (можно из другого потока)"""
+    try:
+        lease.release()
+    finally:
+        _rebuild_lock.release()
+
+
+def rebuild_export(partitions=None, manager=None, chunk_rows=REBUILD_CHUNK_ROWS, lease=None):
+    """
+    Пересобирает выгрузку из БД за один проход: каждый лист-раздел переписывается целиком
+    крупными values.update, окраска всех листов — одним batchUpdate в конце.
+    partitions — названия пересобираемых листов (None — вся выгрузка; листы, для которых
+    в БД не осталось данных, очищаются). В памяти держатся строки только текущего листа.
+    lease — пересборка, уже занятая claim_rebuild; без него пересборка занимается здесь
+    (RebuildInProgress, если уже идёт другая).
+    Возвращает отчёт со счётчиками и скоростью (строк в секунду).
+    """
+    from .export_scheduler import export_scheduler
+    manager = manager or get_sheets_manager()
+    own_lease = lease is None
+    if own_lease:
+        lease = claim_rebuild()
+    try:
+        # Фоновые экспорты этого процесса ждут конца пересборки, а затем выполняются по свежим данным;
+        # экспорты других процессов упорядочиваются блокировкой листа (rebuild_sheet)
+        with export_scheduler.paused():
+            return _rebuild_export(partitions, manager, chunk_rows, lease)
+    finally:
+        if own_lease:
+            release_rebuild(lease)
+
+
+def _rebuild_export(partitions, manager, chunk_rows, lease):
+    from .sheets_index import sheet_row_counts
+    started = time.perf_counter()
+    requests_before = manager.quota_metrics()
+
+    histories = [
+        history
+        for history in ActivityHistory.objects.order_by('activity_started_at', 'pk')
+        if partitions is None
+        or manager.sheet_title_for(history.activity_started_at.strftime('%d.%m.%Y %H:%M:%S')) in partitions
+    ]
+
+    report = {'histories': 0, 'rows': 0, 'sheets': [], 'failed_sheets': []}
+    exported_histories = []  # [(история, лист)]
+    current_title = None
+    current_rows = []
+
+    def write_current():
+        if current_title is None:
+            return
+        lease.renew()
+        if manager.rebuild_sheet(current_title, current_rows, chunk_rows):
+            report['sheets'].append(current_title)
+            report['rows'] += len(current_rows)
+        else:
+            report['failed_sheets'].append(current_title)
+
+    for history, data in iter_history_exports(histories, all_histories=partitions is None):
+        rows = [GoogleSheetsManager._row_from_data(row) for row in data]
+        rows.sort(key=lambda row: (normalize_cell(row[0]), normalize_cell(row[5])))
+        sheet_title = manager.sheet_title_for(rows[0][0])
+        if sheet_title != current_title:
+            write_current()
+            current_title, current_rows = sheet_title, []
+        current_rows.extend(rows)
+        history.export_hash = manager.export_digest(data)
+        history.is_exported = True
+        exported_histories.append((history, sheet_title))
+    write_current()
+
+    # Листы без данных в БД очищаются; Лист1 с выгрузками до разбиения удаляется — его данные
+    # теперь в разделах
+    if partitions is None:
+        stale_titles = set(sheet_row_counts(manager.sheet_title_prefix)) - set(report['sheets']) - set(report['failed_sheets'])
+        if manager.partition_period != 'none':
+            legacy_title = manager.sheet_title_prefix + LEGACY_SHEET_TITLE
+            stale_titles.discard(legacy_title)
+            if not manager.remove_legacy_sheet():
+                report['failed_sheets'].append(legacy_title)
+        for sheet_title in sorted(stale_titles):
+            if manager.rebuild_sheet(sheet_title, [], chunk_rows):
+                report['sheets'].append(sheet_title)
+            else:
+                report['failed_sheets'].append(sheet_title)
+    manager.finish_rebuild(report['sheets'])
+
+    written = [history for history, sheet_title in exported_histories if sheet_title in report['sheets']]
+    ActivityHistory.objects.bulk_update(written, ['export_hash', 'is_exported'], batch_size=1000)
+    report['histories'] = len(written)
+
+    requests_after = manager.quota_metrics()
+    report['requests'] = sum(
+        requests_after[kind]['total'] - requests_before[kind]['total'] for kind in ('read', 'write')
+    )
+    report['seconds'] = time.perf_counter() - started
+    report['rows_per_second'] = report['rows'] / report['seconds'] if report['seconds'] else 0
+    return report
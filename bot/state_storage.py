@@ -0,0 +1,93 @@
+import threading
+
+from django.core.cache import caches
+from telebot.handler_backends import HandlerBackend
+
+# Алиас кеша Django, в котором хранятся состояния диалогов (см. STATE_BACKEND в настройках)
+STATE_CACHE_ALIAS = 'bot_state'
+
+_DELETED = object()
+
+
+class StateStorage:
+    """
+    Состояния многошаговых диалогов (регистрация, ожидание ввода уровня и т.п.) по ключу.
+    Данные лежат в отдельном кеше Django: file — каталог на диске, db — таблица в БД, поэтому
+    диалог продолжается в любом воркере и после перезапуска. Срок жизни записи ограничен
+    таймаутом кеша. Изменения за время обработки одного обновления копятся в памяти потока
+    (чтения видят их сразу) и записываются одной пачкой в flush() в конце запроса.
+    """
+
+    def __init__(self, alias=STATE_CACHE_ALIAS):
+        self.alias = alias
+        self._local = threading.local()
+
+    @property
+    def _cache(self):
+        return caches[self.alias]
+
+    @property
+    def _pending(self):
+        pending = getattr(self._local, 'pending', None)
+        if pending is None:
+            pending = self._local.pending = {}
+        return pending
+
+    def get(self, key, default=None):
+        pending = self._pending
+        if key not in pending:
+            return self._cache.get(key, default)
+        return default if pending[key] is _DELETED else pending[key]
+
+    def set(self, key, value):
+        self._pending[key] = value
+
+    def delete(self, key):
+        self._pending[key] = _DELETED
+
+    def flush(self):
+        """Записывает накопленные изменения текущего потока: один set_many и один delete_many"""
+        pending = self._pending
+        if not pending:
+            return
+        self._local.pending = {}
+        values = {key: value for key, value in pending.items() if value is not _DELETED}
+        deleted = [key for key, value in pending.items() if value is _DELETED]
+        if values:
+            self._cache.set_many(values)
+        if deleted:
+            self._cache.delete_many(deleted)
+
+    def discard(self):
+        """Отбрасывает незаписанные изменения текущего потока"""
+        self._local.pending = {}
+
+
+state_storage = StateStorage()
+
+
+class StateHandlerBackend(HandlerBackend):
+    """Хранилище next step обработчиков telebot в StateStorage (вместо словаря в памяти процесса)"""
+
+    def __init__(self, storage=state_storage, prefix='next_step'):
+        super().__init__()
+        self.storage = storage
+        self.prefix = prefix
+
+    def _key(self, handler_group_id):
+        return f'{self.prefix}:{handler_group_id}'
+
+    def register_handler(self, handler_group_id, handler):
+        handlers = list(self.storage.get(self._key(handler_group_id)) or [])
+        handlers.append(handler)
+        self.storage.set(self._key(handler_group_id), handlers)
+
+    def clear_handlers(self, handler_group_id):
+        self.storage.delete(self._key(handler_group_id))
+
+    def get_handlers(self, handler_group_id):
+        key = self._key(handler_group_id)
+        handlers = self.storage.get(key)
+        if handlers:
+            self.storage.delete(key)
+        return handlers or None
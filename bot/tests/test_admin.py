@@ -0,0 +1,103 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from bot.activity_registry import activity_registry
+from bot.models import (
+    Activity, ActivityHistory, ActivityHistoryParticipant, ActivityParticipant, GameClass, Player, PlayerClass,
+)
+
+
+class ChangelistQueryCountTests(TestCase):
+    """Количество запросов списка не зависит от числа строк (счётчики участников — аннотацией)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        game_class = GameClass.objects.create(name='Маг')
+        # bulk_create — без сигналов моделей (сообщения в Telegram, экспорт в Google Sheets)
+        cls.players = Player.objects.bulk_create(
+            [Player(game_nickname=f'Игрок {i}', telegram_id=str(i), tg_name=f'tg{i}') for i in range(3)]
+        )
+        cls.player_classes = PlayerClass.objects.bulk_create(
+            [PlayerClass(player=player, game_class=game_class, level=10) for player in cls.players]
+        )
+
+    def setUp(self):
+        # Реестр активностей прогревается на первом запросе процесса — это не запрос списка
+        activity_registry.warm()
+
+    def add_rows(self, count):
+        now = timezone.now()
+        activities = Activity.objects.bulk_create([Activity(name=f'Активность {i}') for i in range(count)])
+        ActivityParticipant.objects.bulk_create([
+            ActivityParticipant(activity=activity, player=player, player_class=player_class)
+            for activity in activities
+            for player, player_class in zip(self.players, self.player_classes)
+        ])
+        histories = ActivityHistory.objects.bulk_create([
+            ActivityHistory(
+                original_activity=activity, name=activity.name,
+                activity_started_at=now, activity_ended_at=now,
+            )
+            for activity in activities
+        ])
+        ActivityHistoryParticipant.objects.bulk_create([
+            ActivityHistoryParticipant(
+                activity_history=history, player=player, player_class=player_class, joined_at=now, completed_at=now,
+            )
+            for history in histories
+            for player, player_class in zip(self.players, self.player_classes)
+        ])
+
+    def assert_changelist_queries(self, url_name, expected):
+        self.client.force_login(self.admin)
+        url = reverse(url_name)
+        self.add_rows(2)
+        with self.assertNumQueries(expected):
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.add_rows(8)
+        with self.assertNumQueries(expected):
+            response = self.client.get(url)
+        self.assertEqual(response.context['cl'].result_count, 10)
+
+    def test_activity_changelist(self):
+        self.assert_changelist_queries('admin:bot_activity_changelist', 5)
+
+    def test_activity_history_changelist(self):
+        self.assert_changelist_queries('admin:bot_activityhistory_changelist', 5)
+
+
+class HistoryExportPermissionTests(TestCase):
+    def test_staff_without_view_permission_is_denied(self):
+        staff = get_user_model().objects.create_user('staff', 'staff@example.com', 'password', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(reverse('admin:bot_activityhistory_export'), {'format': 'csv'})
+        self.assertEqual(response.status_code, 403)
+
+
+class RebuildSelectedSheetsTests(TestCase):
+    def test_second_rebuild_is_refused_while_one_runs(self):
+        from bot.sheets_rebuild import claim_rebuild, release_rebuild
+        admin_user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        now = timezone.now()
+        activity = Activity.objects.bulk_create([Activity(name='Активность')])[0]
+        history = ActivityHistory.objects.bulk_create([ActivityHistory(
+            original_activity=activity, name=activity.name, activity_started_at=now, activity_ended_at=now,
+        )])[0]
+        self.client.force_login(admin_user)
+        lease = claim_rebuild()
+        try:
+            with mock.patch('threading.Thread') as thread:
+                response = self.client.post(
+                    reverse('admin:bot_activityhistory_changelist'),
+                    {'action': 'rebuild_selected_sheets', '_selected_action': [history.pk]},
+                    follow=True,
+                )
+            thread.assert_not_called()
+            self.assertIn('уже идёт', ' '.join(str(message) for message in response.context['messages']))
+        finally:
+            release_rebuild(lease)
@@ -0,0 +1,52 @@
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase
+
+from bot.bulk_import import _upsert_target, import_roster
+from bot.models import GameClass, Player, PlayerClass
+
+
+def roster_file(rows):
+    content = 'никнейм;telegram id;класс;уровень\n' + '\n'.join(';'.join(row) for row in rows)
+    return SimpleUploadedFile('roster.csv', content.encode('utf-8'))
+
+
+class ImportRosterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.mage = GameClass.objects.create(name='Маг')
+        cls.warrior = GameClass.objects.create(name='Воин')
+
+    def test_upsert_counts(self):
+        report = import_roster(roster_file([
+            ('Alpha', '100', 'Маг', '10'),
+            ('Alpha', '', 'Воин', '5'),
+            ('Beta', '200', 'Маг', '3'),
+        ]))
+        self.assertEqual(report['errors'], [])
+        self.assertEqual((report['players_inserted'], report['players_updated']), (2, 0))
+        self.assertEqual((report['classes_inserted'], report['classes_updated']), (3, 0))
+
+        report = import_roster(roster_file([
+            ('Alpha', '', 'Маг', '12'),
+            ('Gamma', '300', 'Воин', '1'),
+            ('Beta', '200', 'Неизвестный', '1'),
+        ]))
+        self.assertEqual(report['errors'], ['Строка 4: неизвестный класс «Неизвестный»'])
+        self.assertEqual((report['players_inserted'], report['players_updated']), (1, 1))
+        self.assertEqual((report['classes_inserted'], report['classes_updated']), (1, 1))
+
+        self.assertEqual(Player.objects.count(), 3)
+        alpha = Player.objects.get(game_nickname='Alpha')
+        # Пустая ячейка не затирает сохранённый Telegram ID
+        self.assertEqual(alpha.telegram_id, '100')
+        self.assertEqual(PlayerClass.objects.get(player=alpha, game_class=self.mage).level, 12)
+        self.assertEqual(alpha.selected_class.game_class, self.mage)
+
+    def test_upsert_target_without_conflict_target_support(self):
+        with mock.patch.object(connection.features, 'supports_update_conflicts_with_target', False):
+            self.assertEqual(_upsert_target(['game_nickname']), {})
+        with mock.patch.object(connection.features, 'supports_update_conflicts_with_target', True):
+            self.assertEqual(_upsert_target(['game_nickname']), {'unique_fields': ['game_nickname']})
@@ -0,0 +1,57 @@
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+
+from bot.live_stats import LiveActivityStats
+from bot.models import Activity, ActivityParticipant, GameClass, Player, PlayerClass
+
+
+class LiveActivityStatsTests(TestCase):
+    """Сводка панели в общем кеше: одинакова для всех процессов и следует за входом, выходом и удалением"""
+
+    @classmethod
+    def setUpTestData(cls):
+        game_class = GameClass.objects.create(name='Маг')
+        # bulk_create — без сигналов моделей (сообщения в Telegram, экспорт в Google Sheets)
+        cls.players = Player.objects.bulk_create(
+            [Player(game_nickname=f'Игрок {i}', telegram_id=str(i), tg_name=f'tg{i}') for i in range(3)]
+        )
+        cls.player_classes = PlayerClass.objects.bulk_create(
+            [PlayerClass(player=player, game_class=game_class, level=10) for player in cls.players]
+        )
+        cls.activity = Activity.objects.bulk_create(
+            [Activity(name='Активность', is_active=True, activated_at=timezone.now())]
+        )[0]
+
+    def setUp(self):
+        cache.clear()
+
+    def join(self, index):
+        with self.captureOnCommitCallbacks(execute=True):
+            return ActivityParticipant.objects.create(
+                activity=self.activity, player=self.players[index], player_class=self.player_classes[index]
+            )
+
+    def activity_stats(self, stats):
+        return stats.snapshot()['activities'][0]
+
+    def test_workers_share_the_aggregate(self):
+        bot_process, admin_worker = LiveActivityStats(), LiveActivityStats()
+        self.join(0)
+        self.assertEqual(self.activity_stats(admin_worker)['active'], 1)
+        self.join(1)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.activity_stats(admin_worker)['active'], 2)
+        self.assertEqual(self.activity_stats(bot_process)['active'], 2)
+
+    def test_leave_and_delete(self):
+        stats = LiveActivityStats()
+        first, second = self.join(0), self.join(1)
+        self.assertEqual(self.activity_stats(stats)['participations'], 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            first.completed_at = timezone.now()
+            first.save()
+            second.delete()
+        with self.assertNumQueries(0):
+            activity = self.activity_stats(stats)
+        self.assertEqual((activity['active'], activity['participations']), (0, 1))
@@ -0,0 +1,45 @@
+from django.test import TestCase
+from django.utils import timezone
+
+from bot.models import (
+    Activity, ActivityHistory, ActivityHistoryParticipant, ActivityParticipant, GameClass, Player, PlayerClass,
+)
+from bot.purge import purge_activity_participants
+
+
+class PurgeActivityParticipantsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        game_class = GameClass.objects.create(name='Маг')
+        # bulk_create — без сигналов моделей (сообщения в Telegram, экспорт в Google Sheets)
+        cls.player = Player.objects.bulk_create([Player(game_nickname='Игрок', telegram_id='1', tg_name='tg')])[0]
+        cls.player_class = PlayerClass.objects.bulk_create([PlayerClass(player=cls.player, game_class=game_class)])[0]
+        cls.activity = Activity.objects.bulk_create([Activity(name='Активность')])[0]
+        ActivityParticipant.objects.bulk_create([
+            ActivityParticipant(activity=cls.activity, player=cls.player, player_class=cls.player_class)
+            for _ in range(5)
+        ])
+        cls.max_pk = ActivityParticipant.objects.latest('pk').pk
+        now = timezone.now()
+        cls.history = ActivityHistory.objects.create(
+            original_activity=cls.activity, name='Активность', activity_started_at=now, activity_ended_at=now,
+        )
+
+    def purge(self):
+        return purge_activity_participants(
+            self.activity.pk, self.history.pk, self.max_pk, batch_size=2, pause=0, progress=lambda deleted: None,
+            verify_attempts=2, verify_delay=0,
+        )
+
+    def test_unverified_history_keeps_participants(self):
+        self.assertIsNone(self.purge())
+        self.assertEqual(ActivityParticipant.objects.filter(activity=self.activity).count(), 5)
+
+    def test_verified_history_purges_in_batches(self):
+        now = timezone.now()
+        ActivityHistoryParticipant.objects.create(
+            activity_history=self.history, player=self.player, player_class=self.player_class,
+            joined_at=now, completed_at=now,
+        )
+        self.assertEqual(self.purge(), 5)
+        self.assertFalse(ActivityParticipant.objects.filter(activity=self.activity).exists())
@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+
+from django.test import TestCase
+
+from bot.google_sheets import SHEET_HEADERS, GoogleSheetsManager
+from bot.sheets_fake import FakeSheetsService
+from bot.sheets_quota import QuotaGovernor
+
+EVENT_ROWS = 50
+
+
+def event_data(event_number, points=10, changed=0):
+    """Данные участников события; у первых changed участников другое количество баллов"""
+    started_at = datetime(2025, 1, 1, 10, 0, 0) + timedelta(days=event_number)
+    return [
+        {
+            'Дата создания': started_at.strftime('%d.%m.%Y %H:%M:%S'),
+            'Активность': f'Событие {event_number}',
+            'Участник': f'Игрок {i}',
+            'Класс': 'Класс',
+            'Уровень': 1,
+            'Время начала': started_at.strftime('%H:%M:%S'),
+            'Время конца': (started_at + timedelta(hours=1)).strftime('%H:%M:%S'),
+            'Расчетное время': '1ч 0м 0с',
+            'Коэффициент': 1.0,
+            'Кол-во поинтов': points + 1 if i < changed else points,
+            'Доп поинты': 0,
+        }
+        for i in range(EVENT_ROWS)
+    ]
+
+
+class SheetDiffPayloadTests(TestCase):
+    def change_payload(self, sheet_rows, changed_rows):
+        """Байты, отправленные в API при правке changed_rows строк события на листе из sheet_rows строк"""
+        service = FakeSheetsService(sheet_titles=())
+        manager = GoogleSheetsManager(
+            service=service, partition_period='none', sheet_title_prefix='test-',
+            quota=QuotaGovernor(read_limit=10 ** 9, write_limit=10 ** 9),
+        )
+        sheet_title = 'test-Лист1'
+        rows = []
+        for event_number in range(sheet_rows // EVENT_ROWS):
+            rows.extend(GoogleSheetsManager._row_from_data(row) for row in event_data(event_number))
+        service.add_sheet(sheet_title)
+        service.write_range(f"'{sheet_title}'!A1", [list(SHEET_HEADERS)] + rows)
+        manager.reconcile_sheet_index(sheet_title)
+        # Первая запись ещё и окрашивает лист целиком — замеряется следующая правка
+        manager.write_activity_data_partitioned(event_data(0, changed=1))
+
+        service.stats.reset()
+        self.assertEqual(manager.write_activity_data_partitioned(event_data(1, changed=changed_rows)), [sheet_title])
+        stats = service.stats.as_dict()
+        self.assertEqual(stats['requests'], {'values.batchUpdate': 1})
+        self.assertEqual(stats['cells_sent'], changed_rows * len(SHEET_HEADERS))
+        self.assertEqual(len(service.rows(sheet_title)), sheet_rows + 1)
+        return stats['bytes_sent']
+
+    def test_payload_does_not_grow_with_sheet_size(self):
+        small_sheet = self.change_payload(sheet_rows=200, changed_rows=3)
+        large_sheet = self.change_payload(sheet_rows=5000, changed_rows=3)
+        self.assertLess(large_sheet, small_sheet * 1.1)
+
+    def test_payload_grows_with_changed_rows(self):
+        few_rows = self.change_payload(sheet_rows=2000, changed_rows=2)
+        many_rows = self.change_payload(sheet_rows=2000, changed_rows=40)
+        self.assertGreater(many_rows, few_rows * 10)
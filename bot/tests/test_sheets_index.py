@@ -0,0 +1,32 @@
+from datetime import timedelta
+
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+
+from bot.models import SheetLock
+from bot.sheets_index import SheetLockTimeout, sheet_lock
+
+
+class SheetLockTests(TestCase):
+    """Аренда листа берётся короткой транзакцией и не держит транзакцию на время записи"""
+
+    def test_lease_is_claimed_outside_transaction(self):
+        # TestCase сам оборачивает тест в транзакцию — внутри блокировки новой не открыто
+        savepoints = len(connection.savepoint_ids)
+        with sheet_lock('Лист') as lease:
+            self.assertEqual(SheetLock.objects.get(sheet_title='Лист').owner, lease.owner)
+            self.assertEqual(len(connection.savepoint_ids), savepoints)
+            with sheet_lock('Лист') as nested:
+                self.assertIs(nested, lease)
+        lock = SheetLock.objects.get(sheet_title='Лист')
+        self.assertEqual((lock.owner, lock.expires_at), ('', None))
+
+    def test_live_lease_blocks_and_expired_lease_is_taken_over(self):
+        SheetLock.objects.create(sheet_title='Лист', owner='other', expires_at=timezone.now() + timedelta(minutes=1))
+        with self.assertRaises(SheetLockTimeout):
+            with sheet_lock('Лист', wait=0):
+                pass
+        SheetLock.objects.filter(sheet_title='Лист').update(expires_at=timezone.now() - timedelta(seconds=1))
+        with sheet_lock('Лист', wait=0) as lease:
+            self.assertEqual(SheetLock.objects.get(sheet_title='Лист').owner, lease.owner)
@@ -0,0 +1,47 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+from django.test import TestCase
+
+from bot.google_sheets import GoogleSheetsManager
+from bot.models import SheetRowIndex
+from bot.sheets_fake import FakeSheetsService
+from bot.sheets_quota import QuotaGovernor
+from bot.tests.test_sheets_diff import event_data
+
+
+class LegacySheetTests(TestCase):
+    """Выгрузки до разбиения по периодам в Лист1: удаление, повторное сохранение и перенос в разделы"""
+
+    def setUp(self):
+        self.service = FakeSheetsService()
+        quota = QuotaGovernor(10 ** 9, 10 ** 9)
+        legacy = GoogleSheetsManager(service=self.service, partition_period='none', quota=quota)
+        for event_number in (0, 40, 45):
+            legacy.write_activity_data_partitioned(event_data(event_number))
+        # Индекс Лист1 до разбиения мог не строиться — строки ищутся по содержимому листа
+        SheetRowIndex.objects.filter(sheet_title='Лист1').delete()
+        self.manager = GoogleSheetsManager(service=self.service, quota=quota)
+
+    def legacy_events(self):
+        return sorted({row[1] for row in self.service.rows('Лист1')[1:]})
+
+    def test_delete_removes_legacy_rows_without_index(self):
+        history = SimpleNamespace(name='Событие 0', activity_started_at=datetime(2025, 1, 1, 10))
+        self.assertTrue(self.manager.delete_activity_data(history))
+        self.assertEqual(self.legacy_events(), ['Событие 40', 'Событие 45'])
+
+    def test_resave_moves_event_out_of_legacy_sheet(self):
+        self.manager.write_activity_data_partitioned(event_data(40, points=20))
+        self.assertEqual(self.legacy_events(), ['Событие 0', 'Событие 45'])
+        self.assertEqual(len(self.service.rows('2025-02')), 1 + 50)
+
+    def test_migration_splits_legacy_sheet(self):
+        self.manager.write_activity_data_partitioned(event_data(40, points=20))
+        report = self.manager.migrate_legacy_sheet()
+        self.assertEqual((report['rows'], report['kept']), (100, 0))
+        self.assertIsNone(self.manager.legacy_sheet_title())
+        february = self.service.rows('2025-02')[1:]
+        self.assertEqual(len(february), 100)
+        # Повторно сохранённое событие не затёрто старой копией из Лист1
+        self.assertEqual({row[9] for row in february if row[1] == 'Событие 40'}, {20})
@@ -0,0 +1,44 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+from googleapiclient.errors import HttpError
+
+from bot.sheets_quota import QuotaGovernor
+
+
+class FailingRequest:
+    """Запрос, который отвечает заданными статусами, а затем выполняется успешно"""
+
+    def __init__(self, *statuses):
+        self.statuses = list(statuses)
+        self.calls = 0
+
+    def execute(self):
+        self.calls += 1
+        if self.statuses:
+            raise HttpError(mock.Mock(status=self.statuses.pop(0)), b'')
+        return {'ok': True}
+
+
+@mock.patch('bot.sheets_quota.time.sleep')
+class QuotaGovernorRetryTests(SimpleTestCase):
+    def setUp(self):
+        self.governor = QuotaGovernor(backoff_base=0)
+
+    def test_quota_errors_are_retried_for_any_request(self, sleep):
+        request = FailingRequest(429, 429)
+        self.assertEqual(self.governor.execute(request), {'ok': True})
+        self.assertEqual(request.calls, 3)
+
+    def test_server_errors_are_not_retried_for_non_idempotent_writes(self, sleep):
+        request = FailingRequest(503)
+        with self.assertRaises(HttpError):
+            self.governor.execute(request)
+        self.assertEqual(request.calls, 1)
+
+    def test_server_errors_are_retried_for_reads_and_idempotent_writes(self, sleep):
+        read = FailingRequest(500)
+        self.assertEqual(self.governor.execute(read, 'read'), {'ok': True})
+        write = FailingRequest(503)
+        self.assertEqual(self.governor.execute(write, idempotent=True), {'ok': True})
+        self.assertEqual((read.calls, write.calls), (2, 2))
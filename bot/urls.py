@@ -11,4 +11,6 @@ urlpatterns = [
     path(settings.BOT_TOKEN, views.index, name="index"),
     path('', views.set_webhook, name="set_webhook"),
     path("status/", views.status, name="status"),
+    path("sheets/quota/", views.sheets_quota, name="sheets_quota"),
+    path("cache/stats/", views.cache_stats, name="cache_stats"),
 ]
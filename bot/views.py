@@ -3,6 +3,7 @@ from traceback import format_exc
 from asgiref.sync import sync_to_async
 from bot.handlers import *
 from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.http import HttpRequest, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_GET, require_POST
@@ -10,6 +11,7 @@ from telebot.apihelper import ApiTelegramException
 from telebot.types import Update
 
 from bot import bot, logger
+from bot.state_storage import state_storage
 
 
 
@@ -26,6 +28,25 @@ def status(request: HttpRequest) -> JsonResponse:
     return JsonResponse({"message": "OK"}, status=200)
 
 
+@staff_member_required
+@require_GET
+def sheets_quota(request: HttpRequest) -> JsonResponse:
+    """Использование квоты Google Sheets API текущим процессом"""
+    from bot.google_sheets import get_sheets_manager
+    try:
+        return JsonResponse(get_sheets_manager().quota_metrics(), status=200)
+    except ValueError as e:
+        return JsonResponse({"message": str(e)}, status=503)
+
+
+@staff_member_required
+@require_GET
+def cache_stats(request: HttpRequest) -> JsonResponse:
+    """Доля попаданий кеша данных бота по семействам ключей (текущий процесс)"""
+    from bot.caching import cache_metrics
+    return JsonResponse(cache_metrics(), status=200)
+
+
 @csrf_exempt
 @require_POST
 @sync_to_async
@@ -44,6 +65,9 @@ def index(request: HttpRequest) -> JsonResponse:
     except Exception as e:
         bot.send_message(settings.OWNER_ID, f'Error from index: {e}')
         logger.error(f"Unhandled exception. {e} {format_exc()}")
+    finally:
+        # Состояния диалогов, изменённые за обновление, записываются одной пачкой
+        state_storage.flush()
     return JsonResponse({"message": "OK"}, status=200)
 
 
@@ -28,6 +28,49 @@ BOT_TOKEN = os.getenv('BOT_TOKEN')
 OWNER_ID = os.getenv('OWNER_ID')
 HOOK = os.getenv('HOOK')
 
+# Отложенный экспорт в Google Sheets: окно склейки изменений и максимальная задержка (секунды)
+SHEETS_EXPORT_DEBOUNCE_SECONDS = float(os.getenv('SHEETS_EXPORT_DEBOUNCE_SECONDS', 5))
+SHEETS_EXPORT_MAX_DELAY_SECONDS = float(os.getenv('SHEETS_EXPORT_MAX_DELAY_SECONDS', 60))
+# Разбиение выгрузки по листам: month, quarter, year или none (всё в Лист1) и название листа-оглавления
+SHEETS_PARTITION_PERIOD = os.getenv('SHEETS_PARTITION_PERIOD', 'month')
+SHEETS_INDEX_SHEET_TITLE = os.getenv('SHEETS_INDEX_SHEET_TITLE', 'Разделы')
+# Бюджет запросов к Google Sheets API в минуту (квота Google по умолчанию — 60 на пользователя)
+SHEETS_READ_REQUESTS_PER_MINUTE = int(os.getenv('SHEETS_READ_REQUESTS_PER_MINUTE', 60))
+SHEETS_WRITE_REQUESTS_PER_MINUTE = int(os.getenv('SHEETS_WRITE_REQUESTS_PER_MINUTE', 60))
+
+# Кеш данных бота: locmem (в памяти процесса, по умолчанию), file (общий каталог для нескольких
+# процессов) или db (таблица в БД, создаётся командой createcachetable)
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'locmem')
+CACHE_LOCATION = os.getenv('CACHE_LOCATION')
+CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'gamebot'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', str(BASE_DIR / 'cache')),
+    'db': ('django.core.cache.backends.db.DatabaseCache', 'bot_cache'),
+}
+# Состояния многошаговых диалогов и next step обработчики бота: должны переживать перезапуск
+# и быть общими для воркеров, поэтому по умолчанию file (или db); locmem — только для одного процесса
+STATE_BACKEND = os.getenv('STATE_BACKEND', 'file')
+STATE_LOCATION = os.getenv('STATE_LOCATION')
+STATE_LOCATIONS = {'locmem': 'gamebot-state', 'file': str(BASE_DIR / 'bot_state'), 'db': 'bot_state'}
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND][0],
+        'LOCATION': CACHE_LOCATION or CACHE_BACKENDS[CACHE_BACKEND][1],
+        # Ключи версионируются и сбрасываются сигналами моделей, срок жизни — страховка от утечек
+        'TIMEOUT': int(os.getenv('CACHE_TIMEOUT', 3600)),
+        'KEY_PREFIX': 'gamebot',
+        'OPTIONS': {'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 10000))},
+    },
+    'bot_state': {
+        'BACKEND': CACHE_BACKENDS[STATE_BACKEND][0],
+        'LOCATION': STATE_LOCATION or STATE_LOCATIONS[STATE_BACKEND],
+        # Незавершённый диалог забывается через сутки
+        'TIMEOUT': int(os.getenv('STATE_TIMEOUT', 86400)),
+        'KEY_PREFIX': 'gamebot',
+        'OPTIONS': {'MAX_ENTRIES': int(os.getenv('STATE_MAX_ENTRIES', 100000))},
+    },
+}
+
 # Application definition
 BOT_COMMANDS = [
     BotCommand("start", "Меню"),